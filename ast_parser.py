@@ -1,9 +1,9 @@
 __author__ = 'Taylor'
 
 from parsetable import ParseTable
-from cfg import Grammar, EPSILON
+from cfg import Grammar, EOF, EPSILON
 
-import pydot
+import backends
 
 class Parser:
     '''
@@ -13,83 +13,193 @@ class Parser:
     def __init__(self, grammar=None):
         #storing this just in case
         self.grammar = grammar
-        #start the stack with just the start node
-        self.parse_stack = [grammar.start]
         #construct the parse table
         self.table = ParseTable(grammar).table
 
-    def ll1_parse(self, token_list):
+    def parse(self, tokens, trace=None):
         '''
-        :param rose_tree: a Rose_Tree of the current node we are parsing
-        :param token_list: a list of pairs of terminal tokens and their
-                           associated values to parse into a tree structure
+        Parses a sequence of tokens from the start symbol. The parse is
+        driven by an explicit stack rather than recursion, and the tokens
+        are read one at a time, so they can come from a generator and
+        the input length is not limited by the recursion limit. A Parser
+        can be reused for any number of inputs.
+
+        :param tokens: an iterable of tokens, each a tuple that starts with
+                       the terminal and its value, like (terminal, value)
+                       or lexer.Token; a TokenStream gives lexer.Tokens
+        :param ParseTrace trace: hooks to call as the parse goes, see
+                                 parse_trace; without one, the parse
+                                 only pays for a test of tracing at each
+                                 step
         :return: RoseTree, [tokens]: the RoseTree is the AST of the parse and the
                                      list of tokens are the unconsumed tokens
         '''
+        table = self.table
+        terminals = self.grammar.terminals
+        tokens = iter(tokens)
+        lookahead = next(tokens, None)
+        #expansions since a token was last consumed, and its leaf; past
+        #one per non-terminal, the parse may be going round a left
+        #recursion
+        expansions = 0
+        last_leaf = None
+        limit = len(self.grammar.nonTerminals)
 
-        # if the stack is empty, return the current parse and leftover input
-        if not self.parse_stack or self.parse_stack == None:
-            return Rose_Tree('', ''), token_list
-
-        # if there's no tokens left and we are here, parse error
-        if not token_list or token_list == None:
-            #raise ValueError("Unexpected EOF, current parse stack is: " + str(self.parse_stack[::-1]) + ' and ' +
-            #                 'tokens are ' + str(token_list))
-            token = '\0'
-            token_value = '\0'
-        else:
-            # one token look-ahead
-            token, token_value = token_list[0]
-
-
-        # Get the first symbol
-        current_symbol = self.parse_stack.pop()
-
-        #if we have a matching symbol and token, we can consume the input
-        if current_symbol in self.grammar.terminals:
-            leaf = Rose_Tree(current_symbol, token_value)
-            return leaf, token_list[1:]
-
-        #else we have a non-terminal, we must continue with the rewrite
-        #returns a list of possible productions that should follow
-        production_to_follow = self.table[current_symbol][token]
-
-        # if empty production to follow, unexpected terminal found:
-        if not production_to_follow:
-            raise ValueError("Unexpected terminal, " + str(token) + " @ " + str(token_value)  + ", found.", str(self.parse_stack))
-
-        # we can't handle this in LL1 style parsing
-        if len(production_to_follow) > 1:
-            print str("Warning, not an LL1 parse. Too many possible parses for LL1, this is non-deterministic. "
-                             "Please check your grammar. Current parse: " +
-                             str(self.parse_stack[::-1]) + " on terminal " + str(token) + " @ " + str(token_value))
-
-        # push all symbols onto the stack
-        for symbol in production_to_follow[0][::-1]:
-            if symbol == EPSILON:
-                continue
-            self.parse_stack.append(symbol)
+        tracing = trace is not None
+        if tracing:
+            clock = trace.clock
+            sample_every = trace.sample_every
+            until_sample = sample_every
+            #non-terminal to the samples of it still being parsed
+            sampling = {}
+            #sample markers on the stack, which are not part of its depth
+            markers = 0
+
+        root = Rose_Tree(self.grammar.start, "")
+        #nodes still to be parsed, the next one on top; when tracing, a
+        #sampled expansion leaves a (non-terminal, start time) below its
+        #children
+        stack = [root]
 
-        #construct a node in the tree and attach all children parsed
-        current_rose_tree_node = Rose_Tree(current_symbol, "")
+        while stack:
+            node = stack.pop()
+            if tracing and node.__class__ is tuple:
+                symbol, start = node
+                markers -= 1
+                sampling[symbol] -= 1
+                if not sampling[symbol]:
+                    trace.sample(symbol, clock() - start)
+                continue
+            current_symbol = node.symbol
 
-        leftover = token_list
+            # one token look-ahead, EOF once the input runs out
+            if lookahead is None:
+                token = EOF
+                token_value = EOF
+            else:
+                token = lookahead[0]
+                token_value = lookahead[1]
 
-        for symbol in production_to_follow[0]:
-            if symbol == EPSILON:
+            #if we have a matching symbol and token, we can consume the input
+            if current_symbol in terminals:
+                if token != current_symbol:
+                    fail(trace, stack, "Expected " + str(current_symbol) +
+                         ", found " + describe_token(lookahead) + ".")
+                if tracing:
+                    trace.match(token, token_value)
+                node.value = token_value
+                lookahead = next(tokens, None)
+                expansions = 0
+                last_leaf = node
                 continue
-            #this can never just return from an empty stack since we place
-            #all symbols found on the stack before this. See lines 54 & 55
-            parsed_tree_node, leftover = self.ll1_parse(leftover)
 
-            # append as a child
-            current_rose_tree_node.children.append(parsed_tree_node)
+            #else we have a non-terminal, we must continue with the rewrite
+            #returns a list of possible productions that should follow
+            production_to_follow = table[current_symbol].get(token)
 
-            # point back to parent
-            parsed_tree_node.parent = current_rose_tree_node
+            if tracing:
+                trace.lookup(current_symbol, token,
+                             len(stack) + 1 - markers)
+                if production_to_follow:
+                    rhs = production_to_follow[0]
+                    trace.expand(current_symbol, rhs,
+                                 len(rhs) - rhs.count(EPSILON))
+                    if sample_every:
+                        until_sample -= 1
+                        if not until_sample:
+                            until_sample = sample_every
+                            sampling[current_symbol] = \
+                                sampling.get(current_symbol, 0) + 1
+                            #below the children, so it is popped once
+                            #they are parsed
+                            stack.append((current_symbol, clock()))
+                            markers += 1
 
-        #finished parsing for this node completely, return the node and any leftover input
-        return current_rose_tree_node, leftover
+            # if empty production to follow, unexpected terminal found:
+            if not production_to_follow:
+                fail(trace, stack, "Unexpected terminal, " +
+                     describe_token(lookahead) + ", found.")
+
+            # we can't handle this in LL1 style parsing
+            if len(production_to_follow) > 1:
+                print str("Warning, not an LL1 parse. Too many possible parses for LL1, this is non-deterministic. "
+                                 "Please check your grammar. Current parse: " +
+                                 str(stack_symbols(stack[-8:])) + " on terminal " + describe_token(lookahead))
+
+            #construct a node in the tree for each symbol of the production
+            for symbol in production_to_follow[0]:
+                if symbol == EPSILON:
+                    continue
+                child = Rose_Tree(symbol, "")
+                # point back to parent
+                child.parent = node
+                node.children.append(child)
+
+            if node.children:
+                expansions += 1
+                if expansions > limit and left_recursive(node, last_leaf):
+                    fail(trace, stack, "Left recursion on " +
+                         str(current_symbol) + ", expanded again on " +
+                         describe_token(lookahead) + " without consuming it.")
+
+            # push the children so the leftmost is parsed first
+            stack.extend(node.children[::-1])
+
+        leftover = [] if lookahead is None else [lookahead]
+        leftover.extend(tokens)
+        return root, leftover
+
+    def ll1_parse(self, token_list, trace=None):
+        '''
+        :param token_list: a list of pairs of terminal tokens and their
+                           associated values to parse into a tree structure
+        :return: RoseTree, [tokens]: see parse
+        '''
+        return self.parse(token_list, trace)
+
+def describe_token(token):
+    ''' A token and where it was found, for error messages. '''
+    if token is None:
+        return "EOF"
+    description = str(token[0]) + " @ " + str(token[1])
+    if len(token) >= 4:
+        description += " (line %d, column %d)" % (token[2], token[3])
+    return description
+
+def stack_symbols(stack):
+    ''' The symbols on a parse stack, the top first. '''
+    return [n.symbol for n in stack[::-1] if n.__class__ is not tuple]
+
+def fail(trace, stack, message):
+    '''Raises a ValueError of message and the parse stack, reporting it to
+    trace first if there is one.'''
+    symbols = stack_symbols(stack)
+    error = ValueError(message, str(symbols))
+    if trace is not None:
+        trace.fail(error, symbols)
+    raise error
+
+def left_recursive(node, last_leaf):
+    '''Whether node is being expanded inside an expansion of its own
+    symbol that has not consumed a token since, which the parse would
+    repeat forever. The parse being leftmost, those expansions are the
+    ancestors of node that are not also ancestors of the last token's
+    leaf.
+
+    :param Rose_Tree node: the node just expanded
+    :param Rose_Tree last_leaf: the leaf of the last token consumed, None
+                                before the first
+    '''
+    consumed = set()
+    while last_leaf is not None:
+        consumed.add(id(last_leaf))
+        last_leaf = last_leaf.parent
+    ancestor = node.parent
+    while ancestor is not None and id(ancestor) not in consumed:
+        if ancestor.symbol == node.symbol:
+            return True
+        ancestor = ancestor.parent
+    return False
 
 class Rose_Tree:
     def __init__(self, symbol, node_value):
@@ -113,10 +223,13 @@ class Rose_Tree:
         return ret
 
     def pydot_append(self, graph, node_id):
+        #builds the whole graph in memory; dot_writer streams large trees
+        #to a DOT file instead
         #note: don't use ':' as a divider here, it causes
         #strange things to happen when drawing with the pydot tool
         my_name = '%d= "%s@%s"' % (node_id, self.symbol, self.value)
         my_name = my_name.replace(':', '')
+        pydot = backends.load('graphviz')
         graph.add_node(pydot.Node(my_name))
 
         c_num = node_id + 1
@@ -130,6 +243,8 @@ class Rose_Tree:
         return graph, c_num
 
 if __name__ == '__main__':
+    import dot_writer
+
     x = Grammar('./testdata/ll1_test.txt')
     parser = Parser(x)
     root, _ = parser.ll1_parse([('begin', 'begin'), 
@@ -143,6 +258,6 @@ if __name__ == '__main__':
                                 (';', ';'),
                                 ('end', 'end')])
 
-    graph = pydot.Dot('Parse Tree', graph_type='digraph')
-    g, _ = root.pydot_append(graph, 0)
-    g.write_png('./testdata/test.png')
+    with open('./testdata/test.dot', 'w') as f:
+        dot_writer.write_dot(root, f)
+    dot_writer.render('./testdata/test.dot', './testdata/test.png')
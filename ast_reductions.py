@@ -1,7 +1,6 @@
 
 from cfg import Grammar, EOF
 from ast_parser import Parser, Rose_Tree
-import pydot
 
 def simplify_ast(ast):
     '''Reduces the AST to a concrete syntax tree (CST), which removes
@@ -37,7 +36,7 @@ def simplify_ast(ast):
         node = Rose_Tree(ast.symbol, ast.value)
     
         for c in ast.children:
-            child_node = reduce_ast(c)
+            child_node = simplify_ast(c)
             child_node.parent = node
             node.children.append(child_node)
 
@@ -63,9 +62,9 @@ def reduceWhile(ast):
     boolean_child = find_child_with_symbol(ast, 'B')
     while_block = find_child_with_symbol(ast, 'S')
 
-    new_root.children = [reduce_ast(boolean_child), 
-                         reduce_ast(while_block)]
-    return new_root
+    new_root.children = [simplify_ast(boolean_child), 
+                         simplify_ast(while_block)]
+    return with_following_statements(ast, new_root)
 
 #reduces an S -> if .... fi production into a single node with only
 #the three children: boolean expression, then statement, and else
@@ -78,10 +77,25 @@ def reduceIf(ast):
     then_statement = find_child_with_symbol(ast, 'S')
     else_statement = find_child_with_symbol(ast, 'S', 2)
 
-    new_root.children = [reduce_ast(boolean_child),
-                         reduce_ast(then_statement),
-                         reduce_ast(else_statement)]
-    return new_root
+    new_root.children = [simplify_ast(boolean_child),
+                         simplify_ast(then_statement),
+                         simplify_ast(else_statement)]
+    return with_following_statements(ast, new_root)
+
+#the S' at the end of a while or if production holds the statements that
+#follow it (; S), keep them in sequence after the reduced node
+def with_following_statements(ast, node):
+    following = find_child_with_symbol(ast, "S'")
+    if following is None:
+        return node
+
+    sequence = Rose_Tree(symbol='S', node_value='')
+    sequence.parent = ast.parent
+    node.parent = sequence
+    following = simplify_ast(following)
+    following.parent = sequence
+    sequence.children = [node, following]
+    return sequence
 
 #removes all nodes that were created from using epsilon productions
 def filter_epsilon(ast):
@@ -150,6 +164,8 @@ def reduce_ast(ast):
     return root
 
 if __name__ == '__main__':
+    import dot_writer
+
     g = Grammar('./testdata/homework1_grammar.txt')
     x = Parser(g)
 
@@ -181,7 +197,7 @@ if __name__ == '__main__':
                        ])
 
     root = reduce_ast(root)
-    graph = pydot.Dot('Parse Tree', graph_type='digraph')
-    g, _ = root.pydot_append(graph, 0)
-    g.write_png('./testdata/test.png')
+    with open('./testdata/test.dot', 'w') as f:
+        dot_writer.write_dot(root, f)
+    dot_writer.render('./testdata/test.dot', './testdata/test.png')
 
@@ -1,37 +1,157 @@
 
-from cfg import Grammar
-from ast_parser import Parser
-import pydot
-import ast_reductions
-import subprocess
-import re
-
-#bad practice, but oh well. 
-from llvm import *
-from llvm.core import *
-
-tp_int = Type.int()
-tp_bool = Type.int(1)
-tp_main = Type.function(tp_int, [])
-gv_results = {}
-
-def reduce_cst_to_llvm(cst):
-    llvm_module = Module.new('Arithmetic Code')
-    gv_results = {}
-    
-    f_main = llvm_module.add_function(tp_main, 'main')
-    bb = f_main.append_basic_block('entry')
-    builder = Builder.new(bb)
-
-    _, post_builder = cst.to_llvm(builder, f_main)
-
-    exit_bb = build_exit(llvm_module, f_main)
+import backends
+
+#llvmpy is only needed to lower the CST into LLVM, and is imported by
+#load_llvm the first time that happens; other backends can use the CST
+#classes without it installed.
+HAVE_LLVM = backends.available('llvm')
+
+def load_llvm():
+    '''Imports llvm.core into this module, the way `from llvm.core import
+    *' would, and builds the types the generated code uses. Does nothing
+    after the first call.
+    '''
+    global tp_int, tp_bool, tp_main, tp_counter
+    if 'tp_int' in globals():
+        return
+    core = backends.load('llvm')
+    for name in dir(core):
+        if not name.startswith('_'):
+            globals()[name] = getattr(core, name)
+
+    tp_int = Type.int()
+    tp_bool = Type.int(1)
+    tp_main = Type.function(tp_int, [])
+    tp_counter = Type.int(64)
+
+#width of the language's integers, which are lowered to tp_int
+INT_BITS = 32
+
+def wrap_int(value):
+    '''Wraps a Python integer to a signed INT_BITS-wide integer, the way
+    arithmetic on tp_int overflows.
+    '''
+    value &= (1 << INT_BITS) - 1
+    if value >> (INT_BITS - 1):
+        value -= 1 << INT_BITS
+    return value
+
+def evaluate_arithmetic(op, x, y):
+    '''Computes an arithmetic operator on two constants with the same
+    overflow behaviour as the generated code.
+    '''
+    if op == '+':   return wrap_int(x + y)
+    elif op == '-': return wrap_int(x - y)
+    elif op == '*': return wrap_int(x * y)
+    else: raise ValueError("Error in Arithmetic Operation. Operator was found to be: " + op)
+
+def evaluate_relation(op, x, y):
+    '''Computes a relational operator on two constants.'''
+    if op == '<':    return x < y
+    elif op == '<=': return x <= y
+    elif op == '=':  return x == y
+    elif op == '>=': return x >= y
+    elif op == '>':  return x > y
+    elif op == '!=': return x != y
+    else: raise ValueError('Not a valid relational operator:' + op)
+
+class CompileContext:
+    '''All of the state belonging to a single compilation: the module
+    being built, its `main' function and the stack slot of every
+    program variable. Nothing here is shared between compilations, so
+    repeated or concurrent compiles in one process do not see each
+    other's variables.
+
+    Every variable gets an `alloca' in the entry block, which is the
+    form LLVM's mem2reg pass needs to promote it into a register.
+
+    When instrumenting, every counted block gets a 64-bit global counter
+    that build_exit prints next to the variables.
+    '''
+
+    def __init__(self, module_name='Arithmetic Code', instrument=False):
+        load_llvm()
+        self.module = Module.new(module_name)
+        self.f_main = self.module.add_function(tp_main, 'main')
+        self.entry_block = self.f_main.append_basic_block('entry')
+        self.variables = {}
+        self.instrument = instrument
+        self.counters = []
+
+    def count(self, builder, label):
+        '''When instrumenting, emits an increment of a new counter at the
+        builder's position, which should be the start of a block.
+
+        :param builder: the Builder of the block to count
+        :param str label: what the counter is reported as
+        '''
+        if not self.instrument:
+            return
+
+        counter = self.module.add_global_variable(
+            tp_counter, 'block_count_%d' % len(self.counters))
+        counter.initializer = Constant.int(tp_counter, 0)
+        counter.linkage = LINKAGE_INTERNAL
+
+        value = builder.load(counter)
+        builder.store(builder.add(value, Constant.int(tp_counter, 1)),
+                      counter)
+        self.counters.append((label, counter))
+
+    def declare_variables(self, builder, names):
+        '''Allocates a zero-initialized stack slot for each variable name.
+        The builder must still be positioned in the entry block.
+
+        :param builder: a Builder positioned in the entry block
+        :param names: the variable names to allocate
+        '''
+        for name in names:
+            if name in self.variables:
+                continue
+            slot = builder.alloca(tp_int, name=name)
+            builder.store(Constant.int(tp_int, 0), slot)
+            self.variables[name] = slot
+
+    def slot(self, name):
+        '''Returns the stack slot holding the given variable.'''
+        if name not in self.variables:
+            raise ValueError(name + " is not in memory yet!")
+        return self.variables[name]
+
+def reduce_cst_to_llvm(cst, variables=None, instrument=False):
+    '''Lowers a CST into a new LLVM module with a `main' function that
+    runs the program and then prints every variable.
+
+    :param cst: the ProgramNode at the root of the program
+    :param variables: the variable names to allocate and print, by
+                      default those assigned in the cst. Pass the
+                      variables of the original program when cst has
+                      been optimized so the printed results don't change.
+    :param bool instrument: count how often each block runs and print a
+                            report of the counts at exit
+    :return: the LLVM Module
+    '''
+    if variables is None:
+        variables = assigned_variables(cst)
+
+    context = CompileContext(instrument=instrument)
+    builder = Builder.new(context.entry_block)
+    context.count(builder, 'entry: program start')
+
+    #all variables are allocated up front so that every slot dominates
+    #every use, whichever branch first assigns to it
+    context.declare_variables(builder, variables)
+
+    _, post_builder = cst.to_llvm(builder, context)
+
+    exit_bb = build_exit(context)
     post_builder.branch(exit_bb)
 
-    return llvm_module
+    return context.module
 
-def build_exit(llvm_module, f_main):
-    exit_bb = f_main.append_basic_block('exit')
+def build_exit(context):
+    llvm_module = context.module
+    exit_bb = context.f_main.append_basic_block('exit')
     exit_builder = Builder.new(exit_bb)
 
     #copied from the example code...
@@ -48,10 +168,10 @@ def build_exit(llvm_module, f_main):
     tp_print = Type.function(Type.void(), [tp_string], var_arg=True)
     f_printf = llvm_module.add_function(tp_print, 'printf')
     
-    sorted_keys = gv_results.keys()[0:]
+    sorted_keys = context.variables.keys()[0:]
     sorted_keys.sort()
     for gv in sorted_keys:
-        value = exit_builder.load(gv_results[gv])
+        value = exit_builder.load(context.variables[gv])
         string_val = Constant.stringz(gv)
         string_val_global = llvm_module.add_global_variable(string_val.type, gv+'_var')
         string_val_global.initializer = string_val
@@ -61,9 +181,58 @@ def build_exit(llvm_module, f_main):
                                      inbounds=True)
                                                             
         exit_builder.call(f_printf, [pt_printstring, pt_string, value])
+
+    if context.counters:
+        build_profile_report(context, exit_builder, f_printf)
+
     exit_builder.ret(Constant.int(tp_int, 0))
     return exit_bb
 
+def build_profile_report(context, exit_builder, f_printf):
+    '''Prints every block counter, in program order, with the source of
+    the statement the block belongs to.
+    '''
+    llvm_module = context.module
+
+    def global_string(name, text):
+        string = Constant.stringz(text)
+        string_global = llvm_module.add_global_variable(string.type, name)
+        string_global.initializer = string
+        string_global.linkage = LINKAGE_INTERNAL
+        return exit_builder.gep(string_global,
+                                [Constant.int(tp_int, 0),
+                                 Constant.int(tp_int, 0)],
+                                inbounds=True)
+
+    exit_builder.call(f_printf, [global_string('profile_header',
+                                               'Block profile:\n')])
+    pt_format = global_string('profile_fmt', '%12lld  %s\n')
+    for n, (label, counter) in enumerate(context.counters):
+        pt_label = global_string('block_label_%d' % n, label)
+        exit_builder.call(f_printf, [pt_format,
+                                     exit_builder.load(counter),
+                                     pt_label])
+
+def source_head(statement, limit=60):
+    '''The source of a statement, cut short to fit on one line.'''
+    text = str(statement)
+    if len(text) > limit:
+        text = text[:limit - 3] + '...'
+    return text
+
+def assigned_variables(cst):
+    '''Returns the names of all variables assigned anywhere in the
+    program, in the order they are first assigned.
+    '''
+    names = []
+    stack = [cst]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, StatementAssignment) and node.var not in names:
+            names.append(node.var)
+        stack.extend(node.children()[::-1])
+    return names
+
 def ast_to_cst(ast):
     if ast.symbol == 'if':
         boolean_expression = ast_to_cst(ast.children[0])
@@ -128,7 +297,17 @@ def ast_to_cst(ast):
 
             if '(' in symbols:
                 expr = ast_to_cst(ast.children[1])
-                return ArithmeticParenthesized(expr)
+                node = ArithmeticParenthesized(expr)
+                expr.parent = node
+                #( A ) aop A
+                if len(symbols) > 3:
+                    lhs = node
+                    op = ast.children[3].value
+                    rhs = ast_to_cst(ast.children[4])
+                    node = ArithmeticOperation(lhs, op, rhs)
+                    lhs.parent = node
+                    rhs.parent = node
+                return node
             elif 'aop' in symbols:
                 lhs = ast_to_cst(ast.children[0])
                 op = ast.children[1].value
@@ -176,6 +355,10 @@ def ast_to_cst(ast):
                 lhs.parent = node
                 rhs.parent = node
                 return node
+            elif len(ast.children) == 1:
+                #a whole B on one side of a bop, like the not B in
+                #x < y || not B
+                return ast_to_cst(ast.children[0])
             else: #true or false value here...
                 return BooleanValue(ast.children[0].value)
                 
@@ -186,7 +369,9 @@ def ast_to_cst(ast):
 class ProgramNode:
     def __init__(self):
         pass
-    def to_llvm(self, incoming_builder, f_main):
+    def children(self):
+        return []
+    def to_llvm(self, incoming_builder, context):
         pass
 
 class StatementWhile(ProgramNode):
@@ -195,23 +380,33 @@ class StatementWhile(ProgramNode):
         self.bool_expr = boolean_expression
         self.do_statement = do_statement
 
-    def to_llvm(self, incoming_builder, f_main):
-        exit_block = f_main.append_basic_block('exit')
+    def children(self):
+        return [self.bool_expr, self.do_statement]
+
+    def __str__(self):
+        return 'while %s do %s od' % (self.bool_expr, self.do_statement)
+
+    def to_llvm(self, incoming_builder, context):
+        cond_block = context.f_main.append_basic_block('while_cond')
+        cond_builder = Builder.new(cond_block)
+
+        exit_block = context.f_main.append_basic_block('exit')
         exit_builder = Builder.new(exit_block)
 
-        do_block = f_main.append_basic_block('do_block')
+        do_block = context.f_main.append_basic_block('do_block')
         do_builder = Builder.new(do_block)
 
-        b, builder = self.bool_expr.to_llvm(incoming_builder,
-                                            f_main)
+        head = 'while ' + source_head(self.bool_expr)
+        context.count(do_builder, 'do_block: ' + head)
+        context.count(exit_builder, 'exit: ' + head)
 
-        #true if b is true, false if b is false
-        tmp = builder.icmp(ICMP_NE, b, Constant.int(tp_bool, 0))
-        builder.cbranch(tmp, do_block, exit_block)
+        #the condition is re-tested on every trip around the loop
+        incoming_builder.branch(cond_block)
+        b, builder = self.bool_expr.to_llvm(cond_builder, context)
+        builder.cbranch(b, do_block, exit_block)
 
-        self.do_statement.to_llvm(do_builder, f_main)
-
-        do_builder.branch(exit_block)
+        _, do_builder = self.do_statement.to_llvm(do_builder, context)
+        do_builder.branch(cond_block)
 
         return None, exit_builder
         
@@ -221,29 +416,43 @@ class StatementIf(ProgramNode):
         self.boolean_expression = bool_expr
         self.then_statement = then_statement
         self.else_statement = else_statement
-        
-    def to_llvm(self, incoming_builder, f_main):
-        exit_block = f_main.append_basic_block('exit')
+
+    def children(self):
+        return [self.boolean_expression,
+                self.then_statement,
+                self.else_statement]
+
+    def __str__(self):
+        return 'if %s then %s else %s fi' % (self.boolean_expression,
+                                              self.then_statement,
+                                              self.else_statement)
+
+    def to_llvm(self, incoming_builder, context):
+        exit_block = context.f_main.append_basic_block('exit')
         exit_builder = Builder.new(exit_block)
 
-        then_block = f_main.append_basic_block('then')
+        then_block = context.f_main.append_basic_block('then')
         then_builder = Builder.new(then_block)
 
-        else_block = f_main.append_basic_block('else')
+        else_block = context.f_main.append_basic_block('else')
         else_builder = Builder.new(else_block)
 
+        head = 'if ' + source_head(self.boolean_expression)
+        context.count(then_builder, 'then: ' + head)
+        context.count(else_builder, 'else: ' + head)
+        context.count(exit_builder, 'exit: ' + head)
+
         b, builder = self.boolean_expression.to_llvm(incoming_builder,
-                                                     f_main)
+                                                     context)
 
-        tmp = builder.icmp(ICMP_NE, b, Constant.int(tp_bool, 0))
-        builder.cbranch(tmp, then_block, else_block)
+        builder.cbranch(b, then_block, else_block)
 
         _, then_builder = self.then_statement.to_llvm(then_builder,
-                                                      f_main)
+                                                      context)
         then_builder.branch(exit_block)
 
         _, else_builder = self.else_statement.to_llvm(else_builder,
-                                                      f_main)
+                                                      context)
         else_builder.branch(exit_block)
 
         return None, exit_builder
@@ -254,9 +463,15 @@ class StatementSequential(ProgramNode):
         self.s1 = s1
         self.s2 = s2
 
-    def to_llvm(self, incoming_builder, f_main):
-        _, builder = self.s1.to_llvm(incoming_builder, f_main)
-        ret, builder = self.s2.to_llvm(builder, f_main)
+    def children(self):
+        return [self.s1, self.s2]
+
+    def __str__(self):
+        return '%s ; %s' % (self.s1, self.s2)
+
+    def to_llvm(self, incoming_builder, context):
+        _, builder = self.s1.to_llvm(incoming_builder, context)
+        ret, builder = self.s2.to_llvm(builder, context)
         return ret, builder
         
 class StatementAssignment(ProgramNode):
@@ -265,27 +480,29 @@ class StatementAssignment(ProgramNode):
         self.var = var
         self.value = value
 
-    def to_llvm(self, incoming_builder, f_main):
+    def children(self):
+        return [self.value]
+
+    def __str__(self):
+        return '%s := %s' % (self.var, self.value)
+
+    def to_llvm(self, incoming_builder, context):
         #calculate the rhs
-        v, builder = self.value.to_llvm(incoming_builder, f_main)
+        v, builder = self.value.to_llvm(incoming_builder, context)
 
-        #Is this something we already have a variable for?
-        if self.var in gv_results.keys():
-            #yes, then just load the value into the ptr
-            builder.store(v, gv_results[self.var])
-        else:
-            #allocate memory for that value
-            value_pt = builder.malloc(tp_int, self.var)
-            builder.store(v, value_pt)
-            gv_results[self.var] = value_pt
+        #the slot was allocated in the entry block, just store into it
+        builder.store(v, context.slot(self.var))
 
-        return v, incoming_builder
+        return v, builder
 
 class StatementSkip(ProgramNode):
     def __init__(self, parent=None):
         self.parent = parent
 
-    def to_llvm(self, incoming_builder, f_main):
+    def __str__(self):
+        return 'skip'
+
+    def to_llvm(self, incoming_builder, context):
         return None, incoming_builder
 
 class ArithmeticParenthesized(ProgramNode):
@@ -293,8 +510,14 @@ class ArithmeticParenthesized(ProgramNode):
         self.parent = parent
         self.expr = a_statement
 
-    def to_llvm(self, incoming_builder, f_main):
-        return self.expr.to_llvm(incoming_builder, f_main)
+    def children(self):
+        return [self.expr]
+
+    def __str__(self):
+        return '(%s)' % self.expr
+
+    def to_llvm(self, incoming_builder, context):
+        return self.expr.to_llvm(incoming_builder, context)
 
 class ArithmeticOperation(ProgramNode):
     def __init__(self, lhs, op, rhs, parent=None):
@@ -303,13 +526,19 @@ class ArithmeticOperation(ProgramNode):
         self.op  = op
         self.rhs = rhs
 
-    def to_llvm(self, incoming_builder, f_main):
-        x, builder = self.lhs.to_llvm(incoming_builder, f_main)
-        y, builder = self.rhs.to_llvm(builder, f_main)
+    def children(self):
+        return [self.lhs, self.rhs]
+
+    def __str__(self):
+        return '%s %s %s' % (self.lhs, self.op, self.rhs)
+
+    def to_llvm(self, incoming_builder, context):
+        x, builder = self.lhs.to_llvm(incoming_builder, context)
+        y, builder = self.rhs.to_llvm(builder, context)
 
         if self.op == '+':   ret = builder.add(x, y)
         elif self.op == '-': ret = builder.sub(x, y)
-        elif self.op == '*': ret = builder.imul(x, y)
+        elif self.op == '*': ret = builder.mul(x, y)
         else: raise ValueError("Error in Arithmetic Operation. Operator was found to be: " + self.op)
 
         return ret, builder
@@ -319,7 +548,10 @@ class ArithmeticNumber(ProgramNode):
         self.parent = parent
         self.num = num
 
-    def to_llvm(self, incoming_builder, f_main):
+    def __str__(self):
+        return str(self.num)
+
+    def to_llvm(self, incoming_builder, context):
         val = Constant.int(tp_int, self.num)
         return val, incoming_builder
 
@@ -328,20 +560,22 @@ class ArithmeticVariable(ProgramNode):
         self.parent = parent
         self.var = var
 
-    def to_llvm(self, incoming_builder, f_main):
-        if self.var in gv_results.keys():
-            value = incoming_builder.load(gv_results[self.var])
-            return value, incoming_builder
-        else:
-            print gv_results
-            raise ValueError(self.var + " is not in memory yet!")
+    def __str__(self):
+        return self.var
+
+    def to_llvm(self, incoming_builder, context):
+        value = incoming_builder.load(context.slot(self.var))
+        return value, incoming_builder
 
 class BooleanValue(ProgramNode):
     def __init__(self, value, parent=None):
         self.parent = parent
         self.value = value
 
-    def to_llvm(self, incoming_builder, f_main):
+    def __str__(self):
+        return self.value
+
+    def to_llvm(self, incoming_builder, context):
         if self.value == 'true':    ret = Constant.int(tp_bool, 1)
         elif self.value == 'false': ret = Constant.int(tp_bool, 0)
         else: raise ValueError("Boolean value is not true of false: " + self.value)
@@ -353,10 +587,16 @@ class BooleanNot(ProgramNode):
         self.parent = parent
         self.expr = boolean_expression
 
-    def to_llvm(self, incoming_builder, f_main):
-        ret, builder = self.expr.to_llvm(incoming_builder, f_main)
+    def children(self):
+        return [self.expr]
+
+    def __str__(self):
+        return 'not %s' % self.expr
+
+    def to_llvm(self, incoming_builder, context):
+        ret, builder = self.expr.to_llvm(incoming_builder, context)
         #one's compliment of the return value
-        builder.not_(ret)
+        ret = builder.not_(ret)
         return ret, builder
 
 class BooleanBinary(ProgramNode):
@@ -366,14 +606,37 @@ class BooleanBinary(ProgramNode):
         self.op  = boolean_op
         self.rhs = rhs
 
-    def to_llvm(self, incoming_builder, f_main):
-        lhs,builder = self.lhs.to_llvm(incoming_builder, f_main)
-        rhs,builder = self.rhs.to_llvm(builder, f_main)
+    def children(self):
+        return [self.lhs, self.rhs]
+
+    def __str__(self):
+        return '%s %s %s' % (self.lhs, self.op, self.rhs)
 
-        if self.op == '&&':   ret = builder.and_(lhs, rhs)
-        elif self.op == '||': ret = builder.or_(lhs, rhs)
+    def to_llvm(self, incoming_builder, context):
+        #short-circuit: the rhs is only evaluated when the lhs does not
+        #already decide the result, i.e. when it is true for && and false
+        #for ||. Both paths meet in a phi node.
+        if self.op == '&&':   short_circuit = Constant.int(tp_bool, 0)
+        elif self.op == '||': short_circuit = Constant.int(tp_bool, 1)
         else:raise ValueError('Not a valid boolean self.operator:' + self.op)
 
+        lhs,builder = self.lhs.to_llvm(incoming_builder, context)
+        lhs_block = builder.basic_block
+
+        rhs_block = context.f_main.append_basic_block('bool_rhs')
+        merge_block = context.f_main.append_basic_block('bool_merge')
+
+        if self.op == '&&': builder.cbranch(lhs, rhs_block, merge_block)
+        else:               builder.cbranch(lhs, merge_block, rhs_block)
+
+        rhs,rhs_builder = self.rhs.to_llvm(Builder.new(rhs_block), context)
+        rhs_builder.branch(merge_block)
+
+        builder = Builder.new(merge_block)
+        ret = builder.phi(tp_bool)
+        ret.add_incoming(short_circuit, lhs_block)
+        ret.add_incoming(rhs, rhs_builder.basic_block)
+
         return ret, builder
 
 class BooleanRelation(ProgramNode):
@@ -383,9 +646,15 @@ class BooleanRelation(ProgramNode):
         self.op  = comparison_operator
         self.rhs = rhs
 
-    def to_llvm(self, incoming_builder, f_main):
-        lhs,builder = self.lhs.to_llvm(incoming_builder, f_main)
-        rhs,builder = self.rhs.to_llvm(builder, f_main)
+    def children(self):
+        return [self.lhs, self.rhs]
+
+    def __str__(self):
+        return '%s %s %s' % (self.lhs, self.op, self.rhs)
+
+    def to_llvm(self, incoming_builder, context):
+        lhs,builder = self.lhs.to_llvm(incoming_builder, context)
+        rhs,builder = self.rhs.to_llvm(builder, context)
         
         if self.op == '<':   ret = builder.icmp(ICMP_SLT, lhs, rhs)
         elif self.op == '<=':ret = builder.icmp(ICMP_SLE, lhs, rhs)
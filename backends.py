@@ -0,0 +1,62 @@
+'''A registry of the heavy optional libraries the compiler uses, loaded on
+first use rather than when a module is imported, so commands that never
+draw a graph or lower to LLVM do not pay for importing those libraries:
+
+  - graphviz:  pydot, for drawing parse trees
+  - llvm:      llvmpy's llvm.core, for lowering the CST to LLVM IR
+  - pyparsing: for reading grammar files
+
+    pydot = backends.load('graphviz')
+
+Whether a backend is installed can be asked without importing it, with
+available.
+'''
+
+import importlib
+import pkgutil
+
+#backend name to the module load returns
+BACKENDS = {
+    'graphviz': 'pydot',
+    'llvm': 'llvm.core',
+    'pyparsing': 'pyparsing',
+}
+
+_loaded = {}
+
+
+def module_name(backend):
+    if backend not in BACKENDS:
+        raise ValueError("Unknown backend: " + backend + ", expected one "
+                         "of " + ', '.join(sorted(BACKENDS)))
+    return BACKENDS[backend]
+
+def load(backend):
+    '''Imports a backend the first time it is asked for.
+
+    :param str backend: a key of BACKENDS
+    :return module: the backend's module
+    :raise ImportError: when the backend is not installed
+    '''
+    if backend not in _loaded:
+        _loaded[backend] = importlib.import_module(module_name(backend))
+    return _loaded[backend]
+
+def available(backend):
+    '''Whether a backend is installed. Only its top-level package is
+    looked up, so nothing is imported.
+
+    :param str backend: a key of BACKENDS
+    :return bool:
+    '''
+    if backend in _loaded:
+        return True
+    package = module_name(backend).split('.')[0]
+    try:
+        return pkgutil.find_loader(package) is not None
+    except ImportError:
+        return False
+
+def loaded():
+    ''' :return list[str]: the backends that have been imported so far '''
+    return sorted(_loaded)
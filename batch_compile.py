@@ -0,0 +1,215 @@
+'''Compiles a whole directory or list of programs in one go. The homework 1
+grammar and its parser are built once, up front, and shared with a pool
+of worker processes that lex, parse and generate an object file for each
+program. Object files are linked by a pool of threads, so linking one
+program overlaps compiling the next.
+
+Each program succeeds or fails on its own: an error is recorded in the
+manifest against the file and stage it happened in, and the rest of the
+batch carries on. So is a worker process dying under a program, of a
+segfault say, which would leave multiprocessing.Pool waiting forever.
+
+    python batch_compile.py [-j JOBS] [-O LEVEL] [--manifest FILE] PATH...
+'''
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from multiprocessing.pool import ThreadPool
+
+import homework1_suite
+import llvm_optimizer
+import stage_trace
+from batch_jobs import common_directory, find_sources, run_jobs, run_stage
+
+#the warm parser, set in each worker by init_worker
+_parser = None
+
+
+def init_worker(parser):
+    global _parser
+    _parser = parser
+    #the pipeline reports its progress on stdout, which would only
+    #interleave between workers; results go to the manifest instead
+    sys.stdout = open(os.devnull, 'w')
+
+def compile_job(job):
+    '''Compiles one program to an object file in a worker.
+
+    :param (str, str, int) job: the source, the object file to write and
+                                the optimization level
+    :return dict: the program's manifest record
+    '''
+    source, obj, opt_level = job
+    record = {'file': source, 'object': obj, 'status': 'ok',
+              'stage': None, 'error': None, 'timings': {}}
+    #a trace of this program alone, kept in its record
+    trace = stage_trace.Trace(quiet=True)
+    record['trace'] = trace.stages
+    try:
+        string = run_stage(record, 'read', lambda: open(source, 'r').read())
+        tokens = run_stage(record, 'lex', homework1_suite.lex, string, trace)
+        root = run_stage(record, 'parse', homework1_suite.parse,
+                         tokens, _parser, trace)
+        cst, variables = run_stage(record, 'cst', homework1_suite.ast_to_cst,
+                                   root, opt_level, trace)
+        llvm_code = run_stage(record, 'codegen', homework1_suite.cst_to_llvm,
+                              cst, variables, opt_level, False, trace)
+        run_stage(record, 'object', homework1_suite.llvm_to_object,
+                  obj, llvm_code, trace)
+        record['stage'] = None
+    except Exception as e:
+        record['status'] = 'failed'
+        record['error'] = '%s: %s' % (type(e).__name__, e)
+    return record
+
+def link_job(record, binary):
+    ''' Links a compiled program, updating its manifest record. '''
+    try:
+        run_stage(record, 'link', homework1_suite.link,
+                  record['object'], binary)
+        record['stage'] = None
+        record['binary'] = binary
+    except Exception as e:
+        record['status'] = 'failed'
+        record['error'] = '%s: %s' % (type(e).__name__, e)
+    return record
+
+def output_paths(sources, out_dir):
+    '''Where the binary of each program goes: next to its source, or under
+    out_dir at the source's path relative to the directory all the sources
+    are in, so programs of the same name in different directories do not
+    overwrite each other. Its object file goes alongside, with '.o'.
+
+    :return list[str]: the binaries, in the order of sources
+    :raise ValueError: if two programs would still get the same binary
+    '''
+    binaries = [homework1_suite.binary_name(source) for source in sources]
+    if out_dir is not None and sources:
+        root = common_directory(sources)
+        binaries = [os.path.join(out_dir,
+                                 os.path.relpath(os.path.abspath(binary),
+                                                 root))
+                    for binary in binaries]
+    built = {}
+    for source, binary in zip(sources, binaries):
+        key = os.path.realpath(binary)
+        if key in built:
+            raise ValueError('%s and %s would both be built as %s' %
+                             (built[key], source, binary))
+        built[key] = source
+    return binaries
+
+def compile_batch(sources, jobs=None, opt_level=0, out_dir=None,
+                  report=None):
+    '''Compiles and links every program.
+
+    :param list[str] sources: the program files
+    :param int jobs: worker processes (and link threads), by default one
+                     per CPU
+    :param int opt_level: the -O level to compile at
+    :param str out_dir: where to put binaries, by default next to their
+                        sources
+    :param report: called with each record as its program finishes
+    :return list[dict]: one manifest record per program, in the order of
+                        sources
+    '''
+    jobs = jobs or multiprocessing.cpu_count()
+    binaries = output_paths(sources, out_dir)
+    for binary in binaries:
+        directory = os.path.dirname(binary)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    parser = homework1_suite.build_parser()
+
+    work = [(source, binary + '.o', opt_level)
+            for source, binary in zip(sources, binaries)]
+    #by job index, as the same file may be named differently twice
+    records = [None] * len(work)
+
+    def finish(index, record):
+        records[index] = record
+        if report is not None:
+            report(record)
+
+    linkers = ThreadPool(jobs)
+    try:
+        for index, record in run_jobs(compile_job, work, jobs, init_worker,
+                                      (parser,)):
+            if record is None:
+                source, obj, _ = work[index]
+                record = {'file': source, 'object': obj, 'status': 'failed',
+                          'stage': None, 'timings': {}, 'trace': [],
+                          'error': 'The worker process compiling it died'}
+            if record['status'] != 'ok':
+                finish(index, record)
+                continue
+            linkers.apply_async(link_job, (record, binaries[index]),
+                                callback=lambda record, index=index:
+                                finish(index, record))
+
+        linkers.close()
+        linkers.join()
+    finally:
+        linkers.terminate()
+
+    return records
+
+def print_record(record):
+    total = sum(record['timings'].values()) * 1000
+    if record['status'] == 'ok':
+        print 'ok      %s (%.1f ms)' % (record['file'], total)
+    else:
+        #the stage is not known when the worker died
+        where = ' in ' + record['stage'] if record['stage'] else ''
+        print 'FAILED  %s%s: %s' % (record['file'], where, record['error'])
+    sys.stdout.flush()
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Compiles many programs '
+                                         'in the homework 1 language in '
+                                         'parallel.')
+    arg_parser.add_argument('paths', nargs='+',
+                            help='program files and directories of programs')
+    arg_parser.add_argument('-j', '--jobs', type=int, default=None,
+                            help='worker processes (default: one per CPU)')
+    arg_parser.add_argument('-O', dest='opt_level', type=int, default=0,
+                            choices=sorted(llvm_optimizer.OPT_LEVELS),
+                            help='LLVM optimization level (default: 0)')
+    arg_parser.add_argument('--extension', default='.txt',
+                            help='extension of the programs to compile in '
+                                 'directories (default: .txt)')
+    arg_parser.add_argument('--out-dir',
+                            help='where to write binaries (default: next '
+                                 'to each source)')
+    arg_parser.add_argument('--manifest', default='manifest.json',
+                            help='where to write the per-file results '
+                                 '(default: manifest.json)')
+    args = arg_parser.parse_args()
+
+    sources = find_sources(args.paths, args.extension)
+
+    start = time.time()
+    try:
+        records = compile_batch(sources, args.jobs, args.opt_level,
+                                args.out_dir, print_record)
+    except ValueError as e:
+        arg_parser.error(str(e))
+    elapsed = time.time() - start
+
+    failed = len([r for r in records if r['status'] != 'ok'])
+    manifest = {'files': records,
+                'summary': {'total': len(records),
+                            'ok': len(records) - failed,
+                            'failed': failed,
+                            'seconds': elapsed}}
+    with open(args.manifest, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+    print '%d compiled, %d failed in %.2f s; manifest written to %s' %\
+        (len(records) - failed, failed, elapsed, args.manifest)
+    exit(1 if failed else 0)
@@ -0,0 +1,166 @@
+'''Runs one program over many initial variable bindings at once. Every
+binding is a lane of a NumPy array, and each statement is executed for
+all lanes together:
+
+  - arithmetic and relations are vectorized over the lanes
+  - an if runs each branch under a mask of the lanes that take it
+  - a while keeps a mask of the lanes still looping, and stops once it
+    is empty, so each lane leaves the loop on its own trip. When few
+    lanes are left looping they are compacted into smaller arrays.
+
+Variables are int32 arrays, which wrap on overflow the same way the LLVM
+backend's integers do.
+'''
+
+import numpy
+
+from ast_to_llvm import StatementWhile, StatementIf, StatementSequential,\
+    StatementAssignment, StatementSkip, ArithmeticParenthesized,\
+    ArithmeticOperation, ArithmeticNumber, ArithmeticVariable,\
+    BooleanValue, BooleanNot, BooleanBinary, BooleanRelation,\
+    assigned_variables, wrap_int
+
+INT_TYPE = numpy.int32
+
+
+def run_batch(cst, initial, lanes=None):
+    '''Runs a program once per lane.
+
+    :param cst: the ProgramNode at the root of the program
+    :param dict{str : array} initial: starting values for some of the
+                                      variables, as arrays with one value
+                                      per lane or as scalars. Other
+                                      variables start at 0 in every lane.
+    :param int lanes: the number of lanes, by default the length of the
+                      initial arrays
+    :return dict{str : array}: the final value of every variable in
+                               every lane
+    '''
+    if lanes is None:
+        lengths = set(len(numpy.atleast_1d(v)) for v in initial.values())
+        lengths.discard(1)
+        if len(lengths) > 1:
+            raise ValueError("Initial arrays differ in length: " +
+                             str(sorted(lengths)))
+        lanes = lengths.pop() if lengths else 1
+
+    env = {}
+    for var in assigned_variables(cst):
+        env[var] = numpy.zeros(lanes, dtype=INT_TYPE)
+    for var, values in initial.items():
+        env[var] = numpy.empty(lanes, dtype=INT_TYPE)
+        env[var][:] = values
+
+    with numpy.errstate(over='ignore'):
+        execute(cst, env, numpy.ones(lanes, dtype=bool))
+    return env
+
+def execute(node, env, mask):
+    '''Runs a statement in the lanes selected by a mask.
+
+    :param node: the statement
+    :param dict{str : array} env: the variables, updated in place
+    :param array mask: the lanes the statement runs in
+    '''
+    if isinstance(node, StatementSequential):
+        pending = [node]
+        while pending:
+            current = pending.pop()
+            if isinstance(current, StatementSequential):
+                pending.append(current.s2)
+                pending.append(current.s1)
+            else:
+                execute(current, env, mask)
+
+    elif isinstance(node, StatementAssignment):
+        value = evaluate(node.value, env)
+        numpy.copyto(env[node.var], value, where=mask)
+
+    elif isinstance(node, StatementIf):
+        condition = evaluate(node.boolean_expression, env)
+        then_mask = mask & condition
+        else_mask = mask & ~condition
+        if then_mask.any():
+            execute(node.then_statement, env, then_mask)
+        if else_mask.any():
+            execute(node.else_statement, env, else_mask)
+
+    elif isinstance(node, StatementWhile):
+        looping = mask.copy()
+        while True:
+            looping &= evaluate(node.bool_expr, env)
+            active = numpy.count_nonzero(looping)
+            if not active:
+                break
+
+            #once most lanes have left the loop, finish it on a compacted
+            #copy of the remaining lanes instead of masking out the rest
+            if active * 2 < len(looping):
+                lanes = numpy.flatnonzero(looping)
+                compacted = dict((var, values[lanes])
+                                 for var, values in env.items())
+                execute(node, compacted, numpy.ones(active, dtype=bool))
+                for var, values in compacted.items():
+                    env[var][lanes] = values
+                break
+
+            execute(node.do_statement, env, looping)
+
+    elif isinstance(node, StatementSkip):
+        pass
+
+    else:
+        raise ValueError('Not a statement: ' + str(node))
+
+def evaluate(node, env):
+    '''Evaluates an expression in every lane.
+
+    :return: an int32 or bool array, or a scalar for constant expressions
+    '''
+    if isinstance(node, ArithmeticNumber):
+        return INT_TYPE(wrap_int(int(node.num)))
+
+    elif isinstance(node, ArithmeticVariable):
+        if node.var not in env:
+            raise ValueError(node.var + " is not in memory yet!")
+        return env[node.var]
+
+    elif isinstance(node, ArithmeticParenthesized):
+        return evaluate(node.expr, env)
+
+    elif isinstance(node, ArithmeticOperation):
+        x = evaluate(node.lhs, env)
+        y = evaluate(node.rhs, env)
+        if node.op == '+':   return x + y
+        elif node.op == '-': return x - y
+        elif node.op == '*': return x * y
+        else: raise ValueError("Error in Arithmetic Operation. Operator was found to be: " + node.op)
+
+    elif isinstance(node, BooleanValue):
+        if node.value == 'true':    return numpy.bool_(True)
+        elif node.value == 'false': return numpy.bool_(False)
+        else: raise ValueError("Boolean value is not true of false: " + node.value)
+
+    elif isinstance(node, BooleanNot):
+        return ~evaluate(node.expr, env)
+
+    elif isinstance(node, BooleanBinary):
+        x = evaluate(node.lhs, env)
+        y = evaluate(node.rhs, env)
+        if node.op == '&&':   return x & y
+        elif node.op == '||': return x | y
+        else: raise ValueError('Not a valid boolean operator:' + node.op)
+
+    elif isinstance(node, BooleanRelation):
+        x = evaluate(node.lhs, env)
+        y = evaluate(node.rhs, env)
+        if node.op == '<':    return x < y
+        elif node.op == '<=': return x <= y
+        elif node.op == '=':  return x == y
+        elif node.op == '>=': return x >= y
+        elif node.op == '>':  return x > y
+        elif node.op == '!=': return x != y
+        else: raise ValueError('Not a valid relational operator:' + node.op)
+
+    else:
+        raise ValueError('Not an expression: ' + str(node))
@@ -0,0 +1,136 @@
+'''The parts of batch_compile and grammar_batch that do not depend on
+what they process: finding the files, running a job per file in a pool
+of worker processes that survives a worker dying, and timing the stages
+of a job into its record.
+'''
+
+import multiprocessing
+import os
+import time
+import Queue
+
+#job index to the pid of the worker that took it, set in each worker by
+#start_worker
+_started = None
+
+#how often run_jobs looks for dead workers while no job finishes
+POLL_SECONDS = 0.5
+
+
+def find_sources(paths, extension):
+    '''Expands directories into the files inside them.
+
+    :param list[str] paths: files and directories
+    :param str extension: the extension of the files to take from
+                          directories
+    :return list[str]: the files, in a stable order, each once even if it
+                       is given or found more than once
+    '''
+    sources = []
+    seen = set()
+    for path in paths:
+        if os.path.isdir(path):
+            found = []
+            for root, directories, files in os.walk(path):
+                #walked in name order too
+                directories.sort()
+                found.extend(os.path.join(root, name)
+                             for name in sorted(files)
+                             if name.endswith(extension))
+        else:
+            found = [path]
+        for source in found:
+            key = os.path.realpath(source)
+            if key not in seen:
+                seen.add(key)
+                sources.append(source)
+    return sources
+
+def common_directory(paths):
+    ''' The deepest directory that all of paths are in. '''
+    parts = [os.path.abspath(path).split(os.sep)[:-1] for path in paths]
+    return os.sep.join(os.path.commonprefix(parts)) or os.sep
+
+def start_worker(started, init, init_args):
+    global _started
+    _started = started
+    if init is not None:
+        init(*init_args)
+
+def tracked_job(job):
+    ''' Notes which worker took a job of run_jobs, then runs it. '''
+    index, function, argument = job
+    _started[index] = os.getpid()
+    return index, function(argument)
+
+def is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    return True
+
+def run_jobs(function, work, jobs, init=None, init_args=()):
+    '''Calls function on every item of work in a pool of worker processes.
+    A worker that dies takes its job with it, and the pool would wait for
+    that job forever; instead it comes back without a result.
+
+    :param function: a module-level function, run in the workers
+    :param int jobs: worker processes
+    :param init: called with init_args in each worker as it starts
+    :return generator[(int, object)]: the index in work and the result of
+                                      each job, or None if its worker
+                                      died, in the order they finish
+    '''
+    started = multiprocessing.Array('i', len(work), lock=False)
+    finished = Queue.Queue()
+    workers = multiprocessing.Pool(jobs, start_worker,
+                                   (started, init, init_args))
+    try:
+        for index, argument in enumerate(work):
+            workers.apply_async(tracked_job, ((index, function, argument),),
+                                callback=finished.put)
+        remaining = set(range(len(work)))
+        lost = False
+        #jobs found dead at the last poll, with no result in since
+        suspects = set()
+        while remaining:
+            try:
+                index, result = finished.get(timeout=POLL_SECONDS)
+            except Queue.Empty:
+                #a worker takes its jobs in order and sends the result of
+                #one before taking the next, so a dead worker can only
+                #have lost the last job it took
+                last = {}
+                for i in xrange(len(work)):
+                    if started[i]:
+                        last[started[i]] = i
+                dead = set(i for pid, i in last.iteritems()
+                           if i in remaining and not is_alive(pid))
+                #its result may still be on its way, so a job is only lost
+                #once it is found dead twice in a row
+                for index in sorted(dead & suspects):
+                    remaining.discard(index)
+                    lost = True
+                    yield index, None
+                suspects = dead
+                continue
+            suspects = set()
+            if index in remaining:
+                remaining.discard(index)
+                yield index, result
+
+        workers.close()
+        #the pool never forgets a lost job, so joining it would hang
+        if not lost:
+            workers.join()
+    finally:
+        workers.terminate()
+
+def run_stage(record, stage, function, *args):
+    ''' Calls function(*args), timing it as a stage of the record. '''
+    record['stage'] = stage
+    start = time.time()
+    result = function(*args)
+    record['timings'][stage] = time.time() - start
+    return result
@@ -0,0 +1,5 @@
+'''Benchmarks for the compiler pipeline. Each module is a script meant to
+be run from the repository root, e.g.
+
+    python -m benchmarks.bench_opt_levels
+'''
@@ -0,0 +1,102 @@
+'''Compares running one program over a sweep of starting values in
+vectorized lanes against running it once per input: on the bytecode VM
+in this process, and, when llvmpy is installed, as one native process
+per input with the input hard-coded.
+
+    python -m benchmarks.bench_batch [--lanes N] [--native-sample N]
+'''
+
+import argparse
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+import numpy
+
+import ast_to_llvm
+import batch_exec
+import bytecode_vm
+from benchmarks.programs import num, var, op, assign, seq, less_than
+from ast_to_llvm import StatementWhile, StatementIf
+
+
+def sweep_program():
+    '''Runs between 50 and 99 trips depending on the input m, mixing
+    branches and arithmetic on every trip.
+    '''
+    body = seq(StatementIf(less_than(var('a'), var('b')),
+                           assign('a', op(op(var('a'), '*', num(3)), '+',
+                                          var('i'))),
+                           assign('b', op(op(var('b'), '+', var('n')), '-',
+                                          var('a')))),
+               assign('s', op(var('s'), '+', op(var('a'), '-', var('b')))),
+               assign('i', op(var('i'), '+', num(1))))
+    return seq(assign('a', var('n')),
+               assign('b', num(1000)),
+               assign('s', num(0)),
+               assign('i', num(0)),
+               StatementWhile(less_than(var('i'),
+                                        op(num(50), '+', var('m'))),
+                              body))
+
+def with_input(cst, n):
+    ''' The program with its inputs hard-coded in front of it. '''
+    return seq(assign('n', num(n)), assign('m', num(n % 50)), cst)
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--lanes', type=int, default=10000,
+                            help='number of starting values')
+    arg_parser.add_argument('--native-sample', type=int, default=20,
+                            help='inputs to time as native processes')
+    args = arg_parser.parse_args()
+
+    cst = sweep_program()
+    inputs = numpy.arange(1, args.lanes + 1, dtype=batch_exec.INT_TYPE)
+
+    start = time.time()
+    batch = batch_exec.run_batch(cst, {'n': inputs,
+                                             'm': inputs % 50})
+    batch_time = time.time() - start
+
+    start = time.time()
+    for lane, n in enumerate(inputs):
+        results = bytecode_vm.run(bytecode_vm.compile_cst(
+            with_input(cst, int(n))))
+        if results['s'] != batch['s'][lane]:
+            raise Exception("Batch and VM results differ for n = %d" % n)
+    vm_time = time.time() - start
+
+    timings = [('batch', batch_time, args.lanes),
+               ('vm per input', vm_time, args.lanes)]
+
+    if ast_to_llvm.HAVE_LLVM and args.native_sample > 0:
+        from homework1_suite import llvm_to_native
+
+        work_dir = tempfile.mkdtemp(prefix='bench_batch_')
+        try:
+            start = time.time()
+            for n in inputs[:args.native_sample]:
+                binary = os.path.join(work_dir, 'sweep_%d' % n)
+                module = ast_to_llvm.reduce_cst_to_llvm(with_input(cst,
+                                                                   int(n)))
+                llvm_to_native(binary, module)
+                subprocess.check_output([binary])
+            timings.append(('native per input', time.time() - start,
+                            args.native_sample))
+        finally:
+            shutil.rmtree(work_dir)
+
+    print
+    print '%-18s %8s %12s %14s %9s' % ('mode', 'inputs', 'total (s)',
+                                       'inputs / s', 'vs batch')
+    batch_rate = args.lanes / batch_time
+    for mode, seconds, count in timings:
+        rate = count / seconds
+        print '%-18s %8d %12.3f %14.1f %8.1fx' % (mode, count, seconds, rate,
+                                                  batch_rate / rate)
+
+if __name__ == '__main__':
+    main()
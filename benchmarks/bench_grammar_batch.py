@@ -0,0 +1,97 @@
+'''Compares grammar_batch against checking grammars the old way, one
+Python process per file that reads the Grammar and builds its
+ParseTable. The grammars are the ones in testdata and copies of them
+with duplicated non-terminals (see bench_minimize), written to a
+temporary directory until there are --grammars of them.
+
+    python -m benchmarks.bench_grammar_batch [--grammars N] [--jobs N]
+'''
+
+import argparse
+import glob
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import grammar_batch
+import grammar_minimize
+from benchmarks.bench_minimize import duplicated
+from cfg import Grammar
+
+PER_FILE = '''
+import sys
+from cfg import Grammar
+from parsetable import ParseTable
+try:
+    ParseTable(Grammar(sys.argv[1]))
+except Exception:
+    pass
+'''
+
+
+def write_grammars(count, out_dir):
+    ''' :return list[str]: count grammar files written to out_dir '''
+    originals = []
+    for path in sorted(glob.glob('./testdata/*.txt')):
+        try:
+            originals.append(Grammar(path))
+        except Exception:
+            #unproductive.txt cannot be read; it is copied as it is
+            pass
+    paths = []
+    for n in range(count):
+        path = os.path.join(out_dir, 'grammar_%04d.txt' % n)
+        grammar = originals[n % len(originals)]
+        copies = 1 + n // len(originals) % 4
+        with open(path, 'w') as f:
+            grammar_minimize.write_grammar(duplicated(grammar, copies), f)
+        paths.append(path)
+    shutil.copy('./testdata/unproductive.txt',
+                os.path.join(out_dir, 'unproductive.txt'))
+    paths.append(os.path.join(out_dir, 'unproductive.txt'))
+    return paths
+
+def run_per_file(paths):
+    ''' :return float: the seconds to check each file in its own process '''
+    start = time.time()
+    with open(os.devnull, 'w') as devnull:
+        for path in paths:
+            subprocess.call([sys.executable, '-c', PER_FILE, path],
+                            stdout=devnull)
+    return time.time() - start
+
+def run_batch(paths, out_dir, jobs):
+    ''' :return (float, list[dict]): the seconds and the records '''
+    start = time.time()
+    records = grammar_batch.analyze_batch(paths, out_dir, jobs)
+    return time.time() - start, records
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--grammars', type=int, default=200)
+    arg_parser.add_argument('--jobs', type=int, default=None,
+                            help='worker processes (default: one per CPU)')
+    args = arg_parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='bench_grammar_batch_')
+    try:
+        paths = write_grammars(args.grammars, work_dir)
+        per_file = run_per_file(paths)
+        batch, records = run_batch(paths, os.path.join(work_dir, 'reports'),
+                                   args.jobs)
+    finally:
+        shutil.rmtree(work_dir)
+
+    failed = len([r for r in records if r['status'] != 'ok'])
+    print '%d grammars (%d failing)' % (len(paths), failed)
+    print '%-22s %10s %12s' % ('', 'seconds', 'grammars/s')
+    for name, seconds in [('process per file', per_file),
+                          ('grammar_batch', batch)]:
+        print '%-22s %10.2f %12.1f' % (name, seconds, len(paths) / seconds)
+    print '%-22s %9.1fx' % ('speedup', per_file / batch)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+'''Compares running many short programs through the in-process JIT with
+the object file + `cc' link + run path.
+
+    python -m benchmarks.bench_jit [--programs N]
+'''
+
+import argparse
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+import ast_to_llvm
+import llvm_jit
+from homework1_suite import llvm_to_native
+from benchmarks.programs import straight_line, branchy_loop
+
+
+def short_programs(count):
+    '''A mix of tiny straight-line and looping programs.'''
+    programs = []
+    for n in range(count):
+        if n % 2:
+            programs.append(straight_line(10 + n % 20))
+        else:
+            programs.append(branchy_loop(100 + n))
+    return programs
+
+def run_linked(programs, work_dir):
+    results = []
+    for n, cst in enumerate(programs):
+        binary = os.path.join(work_dir, 'program_%d' % n)
+        llvm_to_native(binary, ast_to_llvm.reduce_cst_to_llvm(cst))
+        output = subprocess.check_output([binary])
+        results.append(llvm_jit.parse_results(output))
+    return results
+
+def run_jit(programs):
+    runner = llvm_jit.JitRunner()
+    results = []
+    for cst in programs:
+        _, variables = runner.run(ast_to_llvm.reduce_cst_to_llvm(cst))
+        results.append(variables)
+    return results
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--programs', type=int, default=100,
+                            help='number of programs to run')
+    args = arg_parser.parse_args()
+
+    programs = short_programs(args.programs)
+
+    work_dir = tempfile.mkdtemp(prefix='bench_jit_')
+    try:
+        start = time.time()
+        linked = run_linked(programs, work_dir)
+        link_time = time.time() - start
+    finally:
+        shutil.rmtree(work_dir)
+
+    start = time.time()
+    jitted = run_jit(programs)
+    jit_time = time.time() - start
+
+    if linked != jitted:
+        raise Exception("JIT and linked results differ!")
+
+    print
+    print '%-8s %12s %16s' % ('mode', 'total (s)', 'per program (ms)')
+    for mode, seconds in [('link', link_time), ('jit', jit_time)]:
+        print '%-8s %12.3f %16.3f' % (mode, seconds,
+                                      seconds * 1000 / len(programs))
+    print 'speedup: %.1fx' % (link_time / jit_time)
+
+if __name__ == '__main__':
+    main()
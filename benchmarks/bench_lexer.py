@@ -0,0 +1,85 @@
+'''Measures the master-regex lexer on a generated multi-megabyte program,
+against the old tokenizer that split the input on whitespace and tried
+every terminal's regex on each piece and against the table-driven
+dfa_lexer, and times parsing the lexer's tokens as they stream out.
+
+    python -m benchmarks.bench_lexer [--megabytes N]
+'''
+
+import argparse
+import re
+import time
+
+import dfa_lexer
+import homework1_suite
+
+#the tokenizer homework1_suite used before the master-regex lexer
+legacy_terminals = dict((c, re.compile(v)) for c, v in [
+    (':=', ':='), (';', ';'), ('skip', 'skip'), ('if', 'if'), ('fi', 'fi'),
+    ('then', 'then'), ('else', 'else'), ('do', 'do'), ('od', 'od'),
+    ('while', 'while'), ('(', '\('), (')', '\)'),
+    ('relop', '<=|>=|!=|=|<|>'), ('bop', '&&|\|\|'), ('true', 'true'),
+    ('false', 'false'), ('var', '[a-zA-Z]+'), ('num', '[1-9]{1}[0-9]?')])
+
+def legacy_tokenize(string):
+    string = re.sub('\s', ',', string)
+    pairs = []
+    for token in string.split(','):
+        for term in legacy_terminals:
+            if re.search(legacy_terminals[term], token):
+                pairs.append((term, token))
+    return pairs
+
+STATEMENT = ('if x < 10 && not y >= 20 then x := x + 1 else '
+             'while y != 0 do y := y - 1 ; z := z * 2 od fi ;\n')
+
+def generate_source(megabytes):
+    ''' A long sequence of statements, ending in skip. '''
+    repeats = int(megabytes * 1024 * 1024 / len(STATEMENT)) + 1
+    return STATEMENT * repeats + 'skip\n'
+
+def time_call(function, *args):
+    start = time.time()
+    result = function(*args)
+    return result, time.time() - start
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--megabytes', type=float, default=4,
+                            help='size of the generated program')
+    args = arg_parser.parse_args()
+
+    source = generate_source(args.megabytes)
+    megabytes = len(source) / (1024.0 * 1024.0)
+
+    tokens, lex_time = time_call(lambda: list(homework1_suite.tokenize(source)))
+    _, legacy_time = time_call(legacy_tokenize, source)
+
+    dfa, build_time = time_call(dfa_lexer.load_lexer,
+                                dfa_lexer.spec_file_for(
+                                    homework1_suite.GRAMMAR_FILE))
+    dfa_tokens, dfa_time = time_call(lambda: list(dfa.tokens(source)))
+    if dfa_tokens != tokens:
+        raise Exception("The DFA and master-regex lexers' tokens differ!")
+
+    parser = homework1_suite.build_parser()
+    _, parse_time = time_call(lambda: parser.parse(
+        homework1_suite.tokenize(source)))
+
+    print '%.1f MB, %d tokens' % (megabytes, len(tokens))
+    print 'DFA tables built in %.1f ms' % (build_time * 1000)
+    print
+    print '%-22s %10s %14s %10s' % ('stage', 'time (s)', 'tokens / s',
+                                    'MB / s')
+    for name, seconds in [('lexer', lex_time),
+                          ('legacy tokenize', legacy_time),
+                          ('dfa lexer', dfa_time),
+                          ('lexer + parse', parse_time)]:
+        print '%-22s %10.3f %14.0f %10.2f' % (name, seconds,
+                                              len(tokens) / seconds,
+                                              megabytes / seconds)
+    print
+    print 'lexer speedup over legacy: %.1fx' % (legacy_time / lex_time)
+
+if __name__ == '__main__':
+    main()
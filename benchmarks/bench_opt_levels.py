@@ -0,0 +1,67 @@
+'''Compares the runtime of native binaries built at each -O level on the
+loop-heavy programs in benchmarks.programs.
+
+    python -m benchmarks.bench_opt_levels [--runs N]
+'''
+
+import argparse
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+import ast_to_llvm
+import llvm_optimizer
+from homework1_suite import llvm_to_native
+from benchmarks.programs import LOOP_PROGRAMS
+
+
+def time_binary(path, runs):
+    '''Returns the best wall time of running the binary `runs' times.'''
+    best = None
+    with open(os.devnull, 'w') as devnull:
+        for _ in range(runs):
+            start = time.time()
+            subprocess.check_call([path], stdout=devnull)
+            elapsed = time.time() - start
+            if best is None or elapsed < best:
+                best = elapsed
+    return best
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--runs', type=int, default=3,
+                            help='runs per binary, the best is reported')
+    args = arg_parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='bench_opt_')
+    results = []
+    try:
+        for name, build in LOOP_PROGRAMS:
+            for level in sorted(llvm_optimizer.OPT_LEVELS):
+                module = ast_to_llvm.reduce_cst_to_llvm(build())
+                timings = llvm_optimizer.optimize(module, level)
+                opt_time = sum(seconds for _, seconds in timings)
+
+                binary = os.path.join(work_dir, '%s_O%d' % (name, level))
+                llvm_to_native(binary, module)
+                results.append((name, level, opt_time,
+                                time_binary(binary, args.runs)))
+    finally:
+        shutil.rmtree(work_dir)
+
+    print
+    print '%-16s %5s %12s %12s %9s' % ('program', 'level', 'opt (ms)',
+                                       'run (ms)', 'speedup')
+    baseline = {}
+    for name, level, opt_time, run_time in results:
+        if level == 0:
+            baseline[name] = run_time
+        print '%-16s %5s %12.2f %12.2f %8.2fx' % (name, '-O%d' % level,
+                                                  opt_time * 1000,
+                                                  run_time * 1000,
+                                                  baseline[name] / run_time)
+
+if __name__ == '__main__':
+    main()
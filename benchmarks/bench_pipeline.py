@@ -0,0 +1,197 @@
+'''Times every stage of the compile pipeline on generated programs of
+growing size, from 10 to 10^6 tokens, and compares the timings against a
+saved baseline. A stage is flagged as a regression when it is slower than
+its baseline by more than the threshold; the benchmark then exits with
+status 1, so it can gate CI.
+
+    python -m benchmarks.bench_pipeline [--sizes N ...] [--seed N]
+        [--variables N] [--depth N] [--expression-size N]
+        [--save-baseline FILE] [--baseline FILE] [--threshold FRACTION]
+
+The tree passes recurse once per nested node, so the programs are
+compiled on a thread with a large stack and a raised recursion limit. A
+stage that still fails is reported instead of timed.
+'''
+
+import argparse
+import json
+import os
+import sys
+import threading
+
+import ast_to_llvm
+import bytecode_vm
+import homework1_suite
+import stage_trace
+from benchmarks.program_generator import ProgramGenerator
+
+DEFAULT_SIZES = [10, 100, 1000, 10000, 100000, 1000000]
+
+#stages in the order they run, for the table columns
+STAGES = ['lex', 'parse', 'reduce_ast', 'ast_to_cst', 'optimize_cst',
+          'bytecode', 'codegen', 'verify', 'optimize']
+
+STACK_SIZE = 1 << 30
+RECURSION_LIMIT = 10 ** 7
+
+
+def measure(source, parser, opt_level):
+    '''Compiles a program once, down to LLVM IR when llvmpy is installed.
+
+    :return (dict{str : float}, str): the wall time of every stage that
+                                      finished, and the error of the stage
+                                      that failed, if one did
+    '''
+    trace = stage_trace.Trace(quiet=True)
+    error = None
+    try:
+        tokens = homework1_suite.lex(source, trace)
+        root = homework1_suite.parse(tokens, parser, trace)
+        cst, variables = homework1_suite.ast_to_cst(root, opt_level, trace)
+        with trace.stage('bytecode'):
+            bytecode_vm.compile_cst(cst, variables)
+        if ast_to_llvm.HAVE_LLVM:
+            homework1_suite.cst_to_llvm(cst, variables, opt_level,
+                                        trace=trace)
+    except Exception as e:
+        failed = trace.stages.pop()
+        error = '%s: %s: %s' % (failed['stage'], type(e).__name__, e)
+    return dict((r['stage'], r['wall']) for r in trace.stages), error
+
+def on_large_stack(function, *args):
+    ''' Calls function(*args) on a thread with a large stack. '''
+    result = []
+    thread = threading.Thread(target=lambda: result.append(function(*args)))
+    thread.start()
+    thread.join()
+    return result[0]
+
+def run_sizes(sizes, settings, opt_level, repeat):
+    '''Times the pipeline for every size, keeping each stage's best time
+    out of repeat runs for sizes up to 10^4 tokens.
+
+    :param dict settings: the ProgramGenerator's arguments
+    :return dict{str : dict}: size to {'tokens': int, 'stages':
+                              {stage : seconds}, 'error': str}
+    '''
+    parser = homework1_suite.build_parser()
+    results = {}
+    for size in sizes:
+        source = ProgramGenerator(**settings).program(size)
+        best = {}
+        error = None
+        for _ in range(repeat if size <= 10000 else 1):
+            timings, error = on_large_stack(measure, source, parser,
+                                            opt_level)
+            for stage, seconds in timings.items():
+                best[stage] = min(seconds, best.get(stage, seconds))
+        results[str(size)] = {'tokens': len(homework1_suite.lex(source)),
+                              'stages': best,
+                              'error': error}
+    return results
+
+def regressions(results, baseline, threshold, min_seconds):
+    '''Finds the stages that got slower than the baseline.
+
+    :param float threshold: the allowed slowdown, as a fraction
+    :param float min_seconds: differences smaller than this are noise
+    :return list[(str, str, float, float)]: (size, stage, baseline
+                                            seconds, seconds)
+    '''
+    found = []
+    for size, result in sorted(results.items(), key=lambda r: int(r[0])):
+        if size not in baseline:
+            continue
+        before = baseline[size]['stages']
+        for stage, seconds in sorted(result['stages'].items()):
+            if stage not in before:
+                continue
+            if seconds > before[stage] * (1 + threshold) and \
+                    seconds - before[stage] > min_seconds:
+                found.append((size, stage, before[stage], seconds))
+    return found
+
+def print_table(results):
+    stages = [s for s in STAGES
+              if any(s in r['stages'] for r in results.values())]
+    print '%9s %9s ' % ('size', 'tokens') + \
+        ' '.join('%12s' % s for s in stages)
+    for size, result in sorted(results.items(), key=lambda r: int(r[0])):
+        cells = ['%12.2f' % (result['stages'][s] * 1000)
+                 if s in result['stages'] else '%12s' % '-'
+                 for s in stages]
+        print '%9s %9d ' % (size, result['tokens']) + ' '.join(cells)
+        if result['error']:
+            print '%9s failed in %s' % ('', result['error'])
+    print '(times in ms)'
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--sizes', type=int, nargs='+',
+                            default=DEFAULT_SIZES,
+                            help='program sizes in tokens')
+    arg_parser.add_argument('--seed', type=int, default=0)
+    arg_parser.add_argument('--variables', type=int, default=4)
+    arg_parser.add_argument('--depth', type=int, default=3,
+                            help='how deeply statements may nest')
+    arg_parser.add_argument('--expression-size', type=int, default=3,
+                            help='the most operands in an expression')
+    arg_parser.add_argument('-O', dest='opt_level', type=int, default=0)
+    arg_parser.add_argument('--repeat', type=int, default=3,
+                            help='runs per size, for sizes up to 10^4 '
+                                 'tokens')
+    arg_parser.add_argument('--save-baseline', metavar='FILE',
+                            help='write the timings to FILE')
+    arg_parser.add_argument('--baseline', metavar='FILE',
+                            help='compare the timings against FILE')
+    arg_parser.add_argument('--threshold', type=float, default=0.25,
+                            help='the slowdown flagged as a regression, '
+                                 'as a fraction (default: 0.25)')
+    arg_parser.add_argument('--min-ms', type=float, default=1.0,
+                            help='ignore slowdowns smaller than this')
+    args = arg_parser.parse_args()
+    settings = {'seed': args.seed, 'variables': args.variables,
+                'max_depth': args.depth,
+                'expression_size': args.expression_size}
+
+    sys.setrecursionlimit(RECURSION_LIMIT)
+    threading.stack_size(STACK_SIZE)
+
+    #the parser prints its warnings as it goes
+    out = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        results = run_sizes(args.sizes, settings, args.opt_level,
+                            args.repeat)
+    finally:
+        sys.stdout = out
+
+    print_table(results)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            json.dump({'settings': settings, 'opt_level': args.opt_level,
+                       'results': results}, f, indent=2, sort_keys=True)
+        print 'Baseline written to %s' % args.save_baseline
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if (baseline['settings'], baseline['opt_level']) != \
+                (settings, args.opt_level):
+            raise ValueError("The baseline was taken with different "
+                             "generator settings or optimization level")
+        found = regressions(results, baseline['results'], args.threshold,
+                            args.min_ms / 1000.0)
+        print
+        if not found:
+            print 'No regressions beyond %d%%.' % (args.threshold * 100)
+        for size, stage, before, seconds in found:
+            print 'REGRESSION %s at %s tokens: %.2f ms -> %.2f ms (+%.0f%%)' %\
+                (stage, size, before * 1000, seconds * 1000,
+                 (seconds / before - 1) * 100)
+        if found:
+            exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+'''Compares tree_serialize against cPickle on the parse tree, reduced AST
+and CST of generated programs: the size of the output and the time to
+write and read it back. Pickle recurses once per level of the tree, so
+it is given a raised recursion limit and a large stack, and a tree it
+still cannot handle is reported instead of timed.
+
+    python -m benchmarks.bench_serialize [--sizes N ...] [--repeat N]
+'''
+
+import argparse
+import cPickle as pickle
+import os
+import sys
+import threading
+import time
+
+import homework1_suite
+import tree_serialize
+from benchmarks.bench_pipeline import on_large_stack, STACK_SIZE, \
+    RECURSION_LIMIT
+from benchmarks.program_generator import ProgramGenerator
+
+
+def best_time(function, repeat):
+    ''' :return (float, result): the best seconds of repeat calls '''
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        result = function()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def measure(tree, repeat):
+    '''
+    :return dict{str : (int, float, float)}: for pickle and tree_serialize,
+                                             the bytes, and the seconds to
+                                             write and to read, or None
+                                             when it failed
+    '''
+    formats = {'pickle': (lambda t: pickle.dumps(t, pickle.HIGHEST_PROTOCOL),
+                          pickle.loads),
+               'tree_serialize': (tree_serialize.dumps,
+                                  tree_serialize.loads)}
+    results = {}
+    for name, (dumps, loads) in formats.items():
+        try:
+            write, data = best_time(lambda: dumps(tree), repeat)
+            read, _ = best_time(lambda: loads(data), repeat)
+            results[name] = (len(data), write, read)
+        except RuntimeError:
+            #maximum recursion depth exceeded
+            results[name] = None
+    return results
+
+def trees(size, parser):
+    ''' The parse tree, reduced AST and CST of a program of size tokens. '''
+    source = ProgramGenerator(seed=size).program(size)
+    tokens = homework1_suite.lex(source)
+    parse_tree, _ = parser.parse(tokens)
+    root = homework1_suite.parse(tokens, parser)
+    #ast_to_cst takes its AST apart, so it gets a copy of its own
+    cst, _ = homework1_suite.ast_to_cst(homework1_suite.parse(tokens,
+                                                              parser))
+    return [('parse tree', parse_tree), ('reduced AST', root), ('CST', cst)]
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--sizes', type=int, nargs='+',
+                            default=[100, 1000, 10000, 100000],
+                            help='program sizes in tokens')
+    arg_parser.add_argument('--repeat', type=int, default=3)
+    args = arg_parser.parse_args()
+
+    sys.setrecursionlimit(RECURSION_LIMIT)
+    threading.stack_size(STACK_SIZE)
+
+    out = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        parser = homework1_suite.build_parser()
+        rows = []
+        for size in args.sizes:
+            for name, tree in on_large_stack(trees, size, parser):
+                rows.append((size, name,
+                             on_large_stack(measure, tree, args.repeat)))
+    finally:
+        sys.stdout = out
+
+    print '%8s %-12s %-15s %10s %11s %10s' % ('tokens', 'tree', 'format',
+                                              'KB', 'write (ms)',
+                                              'read (ms)')
+    for size, name, results in rows:
+        for format in ['pickle', 'tree_serialize']:
+            result = results[format]
+            if result is None:
+                print '%8d %-12s %-15s %s' % (size, name, format,
+                                              'failed: too deep')
+                continue
+            print '%8d %-12s %-15s %10.1f %11.2f %10.2f' % \
+                (size, name, format, result[0] / 1024.0, result[1] * 1000,
+                 result[2] * 1000)
+        if results['pickle'] and results['tree_serialize']:
+            ours, theirs = results['tree_serialize'], results['pickle']
+            print '%8s %-12s %-15s %9.1fx %10.1fx %9.1fx' % \
+                ('', '', 'pickle / ours', theirs[0] / float(ours[0]),
+                 theirs[1] / ours[1], theirs[2] / ours[2])
+
+if __name__ == '__main__':
+    main()
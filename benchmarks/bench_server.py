@@ -0,0 +1,73 @@
+'''Compares compiling programs with one homework1_suite.py process each
+against sending them to one warm compile_server over its stdin protocol.
+Uses the VM mode, so it does not need llvmpy.
+
+    python -m benchmarks.bench_server [--requests N]
+'''
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+PROGRAM = ('i := 0 ; s := 0 ; while i < 100 do '
+           'if i < 50 then s := s + i else s := s - 1 fi ; i := i + 1 od')
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--requests', type=int, default=20,
+                            help='programs to compile each way')
+    args = arg_parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='bench_server_')
+    try:
+        source = os.path.join(work_dir, 'program.txt')
+        with open(source, 'w') as f:
+            f.write(PROGRAM)
+
+        with open(os.devnull, 'w') as devnull:
+            start = time.time()
+            for _ in range(args.requests):
+                subprocess.check_call([sys.executable, 'homework1_suite.py',
+                                       '--vm', source], stdout=devnull)
+            cold_time = time.time() - start
+
+            start = time.time()
+            server = subprocess.Popen([sys.executable, 'compile_server.py',
+                                       'serve'], stdin=subprocess.PIPE,
+                                      stdout=subprocess.PIPE, stderr=devnull)
+            request = json.dumps({'mode': 'vm', 'file': source}) + '\n'
+            server.stdin.write(request)
+            server.stdin.flush()
+            json.loads(server.stdout.readline())
+            startup_time = time.time() - start
+
+            start = time.time()
+            for _ in range(args.requests):
+                server.stdin.write(request)
+                server.stdin.flush()
+                response = json.loads(server.stdout.readline())
+                if not response['ok']:
+                    raise Exception(response['error'])
+            warm_time = time.time() - start
+            server.stdin.close()
+            server.wait()
+    finally:
+        shutil.rmtree(work_dir)
+
+    print 'server startup and first request: %.1f ms' % (startup_time * 1000)
+    print
+    print '%-16s %12s %16s' % ('mode', 'total (s)', 'per request (ms)')
+    for mode, seconds in [('process each', cold_time),
+                          ('warm server', warm_time)]:
+        print '%-16s %12.3f %16.2f' % (mode, seconds,
+                                       seconds / args.requests * 1000)
+    print
+    print 'warm server speedup: %.0fx' % (cold_time / warm_time)
+
+if __name__ == '__main__':
+    main()
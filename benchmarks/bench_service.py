@@ -0,0 +1,126 @@
+'''A local load generator for compile_service: sends a burst of generated
+programs to a CompileService and to a warm compile_server.CompileServer,
+which compiles one request at a time, and compares their throughput and
+latency, counted from when each request is handed over. Prints the
+service's stage metrics afterwards.
+
+The programs have no loops, so they can be run. Uses the VM mode by
+default, so it does not need llvmpy; with llvmpy installed, --mode
+native exercises the link stage as well.
+
+    python -m benchmarks.bench_service [--requests N] [--tokens N]
+        [--mode MODE] [--workers N] [--queue-size N]
+'''
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import compile_server
+import compile_service
+from benchmarks.program_generator import ProgramGenerator
+
+
+def make_requests(count, tokens, mode, out_dir):
+    requests = []
+    for n in range(count):
+        request = {'id': n, 'mode': mode,
+                   'source': ProgramGenerator(seed=n, loops=False)
+                             .program(tokens)}
+        if mode in ('object', 'native'):
+            request['output'] = os.path.join(out_dir, 'program_%d' % n)
+        requests.append(request)
+    return requests
+
+def percentile(latencies, fraction):
+    ordered = sorted(latencies)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+def run_sequential(requests):
+    ''' :return (float, list[float], int): seconds, latencies, failures '''
+    server = compile_server.CompileServer()
+    latencies = []
+    failed = 0
+    start = time.time()
+    for request in requests:
+        sent = time.time()
+        request = dict(request)
+        if request['mode'] == 'native':
+            #the server has no link step; count it as its object file
+            request['mode'] = 'object'
+            request['output'] += '.o'
+        response = json.loads(server.handle(json.dumps(request)))
+        latencies.append(time.time() - sent)
+        failed += not response['ok']
+    return time.time() - start, latencies, failed
+
+def run_service(requests, workers, queue_size):
+    ''' :return (float, list[float], int, dict): as run_sequential, and
+                                                 the stage metrics '''
+    service = compile_service.CompileService(workers, None, queue_size)
+    service.start()
+    latencies = []
+    failures = []
+    done = threading.Lock()
+
+    def respond(response):
+        with done:
+            latencies.append(response['seconds'])
+            if not response['ok']:
+                failures.append(response['error'])
+
+    start = time.time()
+    for request in requests:
+        service.submit(request, respond)
+    service.stop()
+    elapsed = time.time() - start
+    return elapsed, latencies, len(failures), service.metrics()
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--requests', type=int, default=200,
+                            help='programs to compile')
+    arg_parser.add_argument('--tokens', type=int, default=300,
+                            help='the size of each program')
+    arg_parser.add_argument('--mode', default='vm',
+                            choices=compile_service.MODES)
+    arg_parser.add_argument('--workers', type=int, default=None,
+                            help='worker processes (default: one per CPU)')
+    arg_parser.add_argument('--queue-size', type=int, default=16)
+    args = arg_parser.parse_args()
+
+    out_dir = tempfile.mkdtemp(prefix='bench_service_')
+    out = sys.stdout
+    try:
+        requests = make_requests(args.requests, args.tokens, args.mode,
+                                 out_dir)
+        #the parsers print their warnings as they are built
+        sys.stdout = open(os.devnull, 'w')
+        try:
+            sequential = run_sequential(requests)
+            service = run_service(requests, args.workers, args.queue_size)
+        finally:
+            sys.stdout = out
+    finally:
+        shutil.rmtree(out_dir)
+
+    print '%-12s %10s %10s %12s %12s %7s' % ('', 'seconds', 'req/s',
+                                             'p50 (ms)', 'p95 (ms)',
+                                             'failed')
+    for name, (elapsed, latencies, failed) in \
+            [('sequential', sequential), ('service', service[:3])]:
+        print '%-12s %10.2f %10.1f %12.2f %12.2f %7d' % \
+            (name, elapsed, len(requests) / elapsed,
+             percentile(latencies, 0.5) * 1000,
+             percentile(latencies, 0.95) * 1000, failed)
+    print
+    print 'Service stages:'
+    print compile_service.format_metrics(service[3])
+
+if __name__ == '__main__':
+    main()
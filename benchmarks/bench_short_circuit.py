@@ -0,0 +1,89 @@
+'''Compares short-circuit lowering of && and || against evaluating both
+operands, on loops whose conditions have an expensive right-hand side
+that is almost never needed.
+
+    python -m benchmarks.bench_short_circuit [--runs N]
+'''
+
+import argparse
+import os
+import shutil
+import tempfile
+
+import ast_to_llvm
+import llvm_optimizer
+from ast_to_llvm import BooleanBinary, BooleanRelation, StatementWhile
+from homework1_suite import llvm_to_native
+from benchmarks.bench_opt_levels import time_binary
+from benchmarks.programs import num, var, op, assign, seq, less_than
+
+
+class EagerBooleanBinary(BooleanBinary):
+    '''The previous lowering: both operands are always evaluated.'''
+
+    def to_llvm(self, incoming_builder, context):
+        lhs,builder = self.lhs.to_llvm(incoming_builder, context)
+        rhs,builder = self.rhs.to_llvm(builder, context)
+
+        if self.op == '&&':   ret = builder.and_(lhs, rhs)
+        else:                 ret = builder.or_(lhs, rhs)
+
+        return ret, builder
+
+def expensive(terms):
+    '''x * y - x + y * x - y ... over `terms' products.'''
+    expr = op(var('x'), '*', var('y'))
+    for n in range(terms):
+        expr = op(expr, '+-'[n % 2], op(var('x'), '*', var('y')))
+    return expr
+
+def guarded_loop(boolean_class, trips, terms):
+    '''while i < trips && (i < trips || expensive > 0) do ... od
+
+    The inner || is decided by its lhs on every trip, so with
+    short-circuiting the expensive expression never runs.
+    '''
+    inner = boolean_class(less_than(var('i'), num(trips)), '||',
+                          BooleanRelation(expensive(terms), '>', num(0)))
+    condition = boolean_class(less_than(var('i'), num(trips)), '&&', inner)
+    body = seq(assign('x', op(var('x'), '+', num(1))),
+               assign('y', op(var('y'), '-', var('i'))),
+               assign('i', op(var('i'), '+', num(1))))
+    return seq(assign('i', num(0)),
+               assign('x', num(1)),
+               assign('y', num(2)),
+               StatementWhile(condition, body))
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--runs', type=int, default=3,
+                            help='runs per binary, the best is reported')
+    arg_parser.add_argument('--trips', type=int, default=2000000,
+                            help='loop trips per program')
+    arg_parser.add_argument('--terms', type=int, default=40,
+                            help='products in the expensive expression')
+    args = arg_parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix='bench_short_circuit_')
+    results = []
+    try:
+        for level in [0, 2]:
+            for name, boolean_class in [('eager', EagerBooleanBinary),
+                                        ('short-circuit', BooleanBinary)]:
+                cst = guarded_loop(boolean_class, args.trips, args.terms)
+                module = ast_to_llvm.reduce_cst_to_llvm(cst)
+                llvm_optimizer.optimize(module, level)
+
+                binary = os.path.join(work_dir, '%s_O%d' % (name, level))
+                llvm_to_native(binary, module)
+                results.append((name, level, time_binary(binary, args.runs)))
+    finally:
+        shutil.rmtree(work_dir)
+
+    print
+    print '%-14s %5s %12s' % ('lowering', 'level', 'run (ms)')
+    for name, level, run_time in results:
+        print '%-14s %5s %12.2f' % (name, '-O%d' % level, run_time * 1000)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+'''Enforces an import-time budget for every command line entry point.
+Each command's modules are imported in a fresh interpreter, best of a few
+runs, and the command fails when the imports take longer than its budget
+or load one of the heavy backends (pydot, pyparsing, llvmpy) up front;
+those are only to be loaded by backends.load when they are needed. Exits
+with status 1 when any command fails, so it can gate CI.
+
+    python -m benchmarks.bench_startup [--runs N] [--scale FACTOR]
+'''
+
+import argparse
+import json
+import subprocess
+import sys
+
+#command to (the modules it imports, its budget in ms)
+COMMANDS = {
+    'parse':         (['ast_parser'], 20),
+    'grammar-check': (['parsetable'], 20),
+    'generate':      (['sentence_generator'], 20),
+    'lex':           (['dfa_lexer'], 40),
+    'compile':       (['homework1_suite'], 60),
+    'grammar-batch': (['grammar_batch'], 40),
+    'draw':          (['dot_writer'], 20),
+    'batch':         (['batch_compile'], 80),
+    'serve':         (['compile_server'], 80),
+    'service':       (['compile_service'], 80),
+}
+
+#the top-level package of every backend in backends.BACKENDS
+BACKEND_PACKAGES = ['pydot', 'pyparsing', 'llvm']
+
+MEASURE = '''
+import json, sys, time
+start = time.time()
+for name in %r:
+    __import__(name)
+seconds = time.time() - start
+print(json.dumps({'seconds': seconds,
+                  'backends': [p for p in %r if p in sys.modules]}))
+'''
+
+
+def measure(modules):
+    '''Imports modules in a fresh interpreter.
+
+    :return (float, list[str]): the seconds the imports took, and the
+                                backend packages they loaded
+    '''
+    output = subprocess.check_output(
+        [sys.executable, '-c', MEASURE % (modules, BACKEND_PACKAGES)])
+    result = json.loads(output.splitlines()[-1])
+    return result['seconds'], result['backends']
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--runs', type=int, default=5,
+                            help='interpreters per command, the best is '
+                                 'reported')
+    arg_parser.add_argument('--scale', type=float, default=1.0,
+                            help='multiply every budget, for slower '
+                                 'machines')
+    args = arg_parser.parse_args()
+
+    failed = []
+    print '%-14s %10s %10s  %s' % ('command', 'import ms', 'budget ms',
+                                   'backends loaded')
+    for command, (modules, budget) in sorted(COMMANDS.items()):
+        budget *= args.scale
+        best = None
+        for _ in range(args.runs):
+            seconds, loaded = measure(modules)
+            best = seconds if best is None else min(best, seconds)
+        ms = best * 1000
+        print '%-14s %10.1f %10.1f  %s' % (command, ms, budget,
+                                           ', '.join(loaded) or '-')
+        if ms > budget:
+            failed.append('%s took %.1f ms, over its %.1f ms budget' %
+                          (command, ms, budget))
+        if loaded:
+            failed.append('%s loaded %s at import' %
+                          (command, ', '.join(loaded)))
+
+    print
+    if not failed:
+        print 'Every command is within its budget.'
+    for failure in failed:
+        print 'OVER BUDGET ' + failure
+    if failed:
+        exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+'''Compares the bytecode VM against a naive tree-walking interpreter over
+the same CSTs. Neither needs llvmpy.
+
+    python -m benchmarks.bench_vm [--scale N]
+'''
+
+import argparse
+import time
+
+import bytecode_vm
+from ast_to_llvm import StatementWhile, StatementIf, StatementSequential,\
+    StatementAssignment, StatementSkip, ArithmeticParenthesized,\
+    ArithmeticOperation, ArithmeticNumber, ArithmeticVariable,\
+    BooleanValue, BooleanNot, BooleanBinary, BooleanRelation,\
+    assigned_variables, evaluate_arithmetic, evaluate_relation, wrap_int
+from benchmarks.programs import nested_loops, branchy_loop, straight_line
+
+
+def interpret(node, env):
+    '''Evaluates a CST node directly, recursing over the tree.'''
+    if isinstance(node, StatementSequential):
+        interpret(node.s1, env)
+        interpret(node.s2, env)
+    elif isinstance(node, StatementAssignment):
+        env[node.var] = interpret(node.value, env)
+    elif isinstance(node, StatementIf):
+        if interpret(node.boolean_expression, env):
+            interpret(node.then_statement, env)
+        else:
+            interpret(node.else_statement, env)
+    elif isinstance(node, StatementWhile):
+        while interpret(node.bool_expr, env):
+            interpret(node.do_statement, env)
+    elif isinstance(node, StatementSkip):
+        pass
+    elif isinstance(node, ArithmeticNumber):
+        return wrap_int(int(node.num))
+    elif isinstance(node, ArithmeticVariable):
+        return env[node.var]
+    elif isinstance(node, ArithmeticParenthesized):
+        return interpret(node.expr, env)
+    elif isinstance(node, ArithmeticOperation):
+        return evaluate_arithmetic(node.op, interpret(node.lhs, env),
+                                   interpret(node.rhs, env))
+    elif isinstance(node, BooleanValue):
+        return node.value == 'true'
+    elif isinstance(node, BooleanNot):
+        return not interpret(node.expr, env)
+    elif isinstance(node, BooleanBinary):
+        if node.op == '&&':
+            return interpret(node.lhs, env) and interpret(node.rhs, env)
+        return interpret(node.lhs, env) or interpret(node.rhs, env)
+    elif isinstance(node, BooleanRelation):
+        return evaluate_relation(node.op, interpret(node.lhs, env),
+                                 interpret(node.rhs, env))
+    else:
+        raise ValueError('Unknown node: ' + str(node))
+
+def run_tree(cst):
+    env = dict((var, 0) for var in assigned_variables(cst))
+    interpret(cst, env)
+    return env
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--scale', type=int, default=1,
+                            help='multiplies the loop trip counts')
+    args = arg_parser.parse_args()
+
+    programs = [('nested_loops', nested_loops(100 * args.scale, 100)),
+                ('branchy_loop', branchy_loop(20000 * args.scale)),
+                ('straight_line', straight_line(300))]
+
+    print '%-14s %12s %12s %12s %9s' % ('program', 'compile (ms)',
+                                        'vm (ms)', 'tree (ms)', 'speedup')
+    for name, cst in programs:
+        start = time.time()
+        program = bytecode_vm.compile_cst(cst)
+        compile_time = time.time() - start
+
+        start = time.time()
+        vm_results = bytecode_vm.run(program)
+        vm_time = time.time() - start
+
+        start = time.time()
+        tree_results = run_tree(cst)
+        tree_time = time.time() - start
+
+        if vm_results != tree_results:
+            raise Exception(name + ": VM and tree interpreter results differ!")
+
+        print '%-14s %12.2f %12.2f %12.2f %8.2fx' % (name,
+                                                     compile_time * 1000,
+                                                     vm_time * 1000,
+                                                     tree_time * 1000,
+                                                     tree_time / vm_time)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+'''A seeded generator of random programs in the language of
+testdata/homework1_grammar.txt, for benchmarks that need inputs of a
+given size. The same seed and settings always give the same program.
+
+    python -m benchmarks.program_generator [--seed N] [--tokens N] ...
+'''
+
+import argparse
+import random
+
+RELOPS = ['<', '<=', '=', '>=', '>', '!=']
+AOPS = ['+', '-', '*']
+BOPS = ['&&', '||']
+
+
+def variable_names(count):
+    '''Distinct variable names that are not keywords: va, vb, ..., vaa...'''
+    names = []
+    for n in range(count):
+        suffix = ''
+        while True:
+            suffix = chr(ord('a') + n % 26) + suffix
+            n = n // 26 - 1
+            if n < 0:
+                break
+        names.append('v' + suffix)
+    return names
+
+
+class ProgramGenerator:
+    ''' Generates programs as lists of tokens. '''
+
+    def __init__(self, seed=0, variables=4, max_depth=3, expression_size=3,
+                 loops=True):
+        '''
+        :param int seed: the random seed
+        :param int variables: how many distinct variables programs use
+        :param int max_depth: how deeply ifs and whiles may nest
+        :param int expression_size: the most operands in an arithmetic
+                                    expression
+        :param bool loops: generate while loops; without them every
+                           program terminates, so it can be run
+        '''
+        self.random = random.Random(seed)
+        self.names = variable_names(variables)
+        self.max_depth = max_depth
+        self.expression_size = expression_size
+        self.loops = loops
+
+    def operand(self):
+        if self.random.random() < 0.5:
+            return [self.random.choice(self.names)]
+        return [str(self.random.randint(0, 99))]
+
+    def expression(self, size=None):
+        ''' An arithmetic expression of up to size operands. '''
+        if size is None:
+            size = self.random.randint(1, self.expression_size)
+        tokens = self.operand()
+        remaining = size - 1
+        while remaining > 0:
+            tokens.append(self.random.choice(AOPS))
+            #sometimes parenthesize a run of the remaining operands
+            if remaining > 1 and self.random.random() < 0.2:
+                inner = self.random.randint(2, remaining)
+                tokens += ['('] + self.expression(inner) + [')']
+                remaining -= inner
+            else:
+                tokens += self.operand()
+                remaining -= 1
+        return tokens
+
+    def condition(self):
+        tokens = []
+        if self.random.random() < 0.1:
+            tokens.append('not')
+        tokens += (self.expression() + [self.random.choice(RELOPS)] +
+                   self.expression())
+        if self.random.random() < 0.2:
+            tokens += [self.random.choice(BOPS)] + self.condition()
+        return tokens
+
+    def statement(self, depth=0):
+        ''' :return list[str]: the tokens of one statement '''
+        r = self.random.random()
+        if depth < self.max_depth and r < 0.15:
+            return (['if'] + self.condition() + ['then'] +
+                    self.block(depth + 1) + ['else'] +
+                    self.block(depth + 1) + ['fi'])
+        elif depth < self.max_depth and r < 0.25 and self.loops:
+            return (['while'] + self.condition() + ['do'] +
+                    self.block(depth + 1) + ['od'])
+        elif r < 0.3:
+            return ['skip']
+        return [self.random.choice(self.names), ':='] + self.expression()
+
+    def block(self, depth):
+        ''' A sequence of one to three statements. '''
+        tokens = self.statement(depth)
+        for _ in range(self.random.randint(0, 2)):
+            tokens += [';'] + self.statement(depth)
+        return tokens
+
+    def tokens(self, count=0, statements=1):
+        '''Generates top-level statements until the program has at least
+        count tokens and at least the given number of statements. The
+        program starts by assigning every variable, as the backends reject
+        reading a variable before it is assigned.
+
+        :return list[str]: the program's tokens
+        '''
+        tokens = []
+        for name in self.names:
+            tokens += [name, ':=', str(self.random.randint(0, 99)), ';']
+        tokens += self.statement()
+        generated = 1
+        while len(tokens) < count or generated < statements:
+            tokens += [';'] + self.statement()
+            generated += 1
+        return tokens
+
+    def program(self, count=0, statements=1):
+        ''' :return str: the source of the program, see tokens '''
+        tokens = self.tokens(count, statements)
+        lines = []
+        for start in range(0, len(tokens), 16):
+            lines.append(' '.join(tokens[start:start + 16]))
+        return '\n'.join(lines) + '\n'
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--seed', type=int, default=0)
+    arg_parser.add_argument('--tokens', type=int, default=100,
+                            help='the least number of tokens')
+    arg_parser.add_argument('--statements', type=int, default=1,
+                            help='the least number of top-level statements')
+    arg_parser.add_argument('--variables', type=int, default=4)
+    arg_parser.add_argument('--depth', type=int, default=3,
+                            help='how deeply statements may nest')
+    arg_parser.add_argument('--expression-size', type=int, default=3,
+                            help='the most operands in an expression')
+    args = arg_parser.parse_args()
+
+    generator = ProgramGenerator(args.seed, args.variables, args.depth,
+                                 args.expression_size)
+    print generator.program(args.tokens, args.statements),
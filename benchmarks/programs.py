@@ -0,0 +1,71 @@
+'''Hand-built CST programs used by the benchmarks. They are constructed
+directly out of the ast_to_llvm node classes so that a benchmark of one
+backend stage does not also measure (or depend on) the front end.
+'''
+
+from ast_to_llvm import StatementWhile, StatementIf, StatementSequential,\
+    StatementAssignment, StatementSkip, ArithmeticOperation,\
+    ArithmeticNumber, ArithmeticVariable, BooleanRelation
+
+
+def num(n):
+    return ArithmeticNumber(str(n))
+
+def var(name):
+    return ArithmeticVariable(name)
+
+def op(lhs, operator, rhs):
+    return ArithmeticOperation(lhs, operator, rhs)
+
+def assign(name, value):
+    return StatementAssignment(name, value)
+
+def less_than(lhs, rhs):
+    return BooleanRelation(lhs, '<', rhs)
+
+def seq(*statements):
+    '''Chains statements into nested StatementSequential nodes.'''
+    node = statements[-1]
+    for statement in statements[-2::-1]:
+        node = StatementSequential(statement, node)
+    return node
+
+def counted_loop(counter, trips, body):
+    '''counter := 0 ; while counter < trips do body ; counter := counter + 1 od'''
+    return seq(assign(counter, num(0)),
+               StatementWhile(less_than(var(counter), num(trips)),
+                              seq(body,
+                                  assign(counter,
+                                         op(var(counter), '+', num(1))))))
+
+def nested_loops(outer, inner):
+    '''Two nested counting loops accumulating into a running sum.'''
+    body = seq(assign('s', op(op(var('s'), '+', var('i')), '-', var('j'))),
+               assign('t', op(var('t'), '+', num(3))))
+    return seq(assign('s', num(0)),
+               assign('t', num(0)),
+               counted_loop('i', outer, counted_loop('j', inner, body)))
+
+def branchy_loop(trips):
+    '''A single loop whose body alternates between two branches.'''
+    body = StatementIf(less_than(var('k'), var('h')),
+                       seq(assign('a', op(var('a'), '+', var('i'))),
+                           assign('k', op(var('k'), '+', num(2)))),
+                       seq(assign('b', op(var('b'), '+', num(1))),
+                           assign('h', op(var('h'), '+', num(2)))))
+    return seq(assign('a', num(0)),
+               assign('b', num(0)),
+               assign('k', num(0)),
+               assign('h', num(1)),
+               counted_loop('i', trips, body))
+
+def straight_line(statements):
+    '''A long run of assignments with no control flow.'''
+    body = [assign('x', num(1))]
+    for n in range(statements):
+        body.append(assign('x', op(op(var('x'), '+', num(n % 7)), '-', num(1))))
+    body.append(StatementSkip())
+    return seq(*body)
+
+LOOP_PROGRAMS = [('nested_loops', lambda: nested_loops(3000, 3000)),
+                 ('branchy_loop', lambda: branchy_loop(5000000))]
@@ -0,0 +1,337 @@
+'''A register-based bytecode backend for the arithmetic language. It runs
+the CST from ast_to_llvm.ast_to_cst without llvmpy, an object file or a C
+linker, which suits the many tiny programs we evaluate.
+
+A compiled Program is one flat list of ints: each instruction is an
+opcode followed by its operands. Operands are register numbers, except
+for jump offsets, which are relative to the instruction following the
+jump. The register file is laid out as
+
+    [ variables | constants | temporaries ]
+
+where every variable has a fixed slot and every distinct constant of the
+program is loaded into its own register once, before the program starts.
+'''
+
+from ast_to_llvm import StatementWhile, StatementIf, StatementSequential,\
+    StatementAssignment, StatementSkip, ArithmeticParenthesized,\
+    ArithmeticOperation, ArithmeticNumber, ArithmeticVariable,\
+    BooleanValue, BooleanNot, BooleanBinary, BooleanRelation,\
+    assigned_variables, wrap_int, INT_BITS
+
+#opcodes, roughly in order of how often they run
+(MOVE, ADD, SUB, JUMP_IF_FALSE, JUMP, LT, LE, EQ, GE, GT, NE, MUL,
+ JUMP_IF_TRUE, NOT, HALT) = range(15)
+
+OPCODE_NAMES = ['MOVE', 'ADD', 'SUB', 'JUMP_IF_FALSE', 'JUMP', 'LT', 'LE',
+                'EQ', 'GE', 'GT', 'NE', 'MUL', 'JUMP_IF_TRUE', 'NOT', 'HALT']
+
+#number of operands following each opcode
+OPERAND_COUNTS = [2, 3, 3, 2, 1, 3, 3, 3, 3, 3, 3, 3, 2, 2, 0]
+
+ARITHMETIC_OPCODES = {'+': ADD, '-': SUB, '*': MUL}
+RELATION_OPCODES = {'<': LT, '<=': LE, '=': EQ, '>=': GE, '>': GT, '!=': NE}
+
+MIN_INT = -(1 << (INT_BITS - 1))
+MAX_INT = (1 << (INT_BITS - 1)) - 1
+
+
+class Program:
+    ''' A compiled program and the initial contents of its registers. '''
+
+    def __init__(self, code, registers, variables):
+        '''
+        :param list[int] code: the instructions
+        :param list[int] registers: the register file before the program
+                                    runs, with the constants loaded
+        :param list[str] variables: the variable held in each of the
+                                    first len(variables) registers
+        '''
+        self.code = code
+        self.registers = registers
+        self.variables = variables
+
+
+class BytecodeCompiler:
+    ''' Translates a CST into a Program. '''
+
+    def __init__(self, cst, variables=None):
+        '''
+        :param cst: the ProgramNode at the root of the program
+        :param variables: the variables to give slots to, by default
+                          those assigned in the cst
+        '''
+        if variables is None:
+            variables = assigned_variables(cst)
+
+        self.cst = cst
+        self.variables = list(variables)
+        self.slots = dict((name, n) for n, name in enumerate(self.variables))
+
+        #find every constant up front, so that the register layout is
+        #known before any code is emitted
+        self.constants = {}
+        for value in sorted(constants_in(cst)):
+            self.constants[value] = len(self.variables) + len(self.constants)
+
+        self.first_temporary = len(self.variables) + len(self.constants)
+        self.temporaries = 0
+        self.max_temporaries = 0
+        self.code = []
+
+    def compile(self):
+        ''' :return Program: the compiled program '''
+        self.statement(self.cst)
+        self.emit(HALT)
+
+        registers = [0] * (self.first_temporary + self.max_temporaries)
+        for value, register in self.constants.items():
+            registers[register] = value
+
+        return Program(self.code, registers, self.variables)
+
+    def emit(self, *instruction):
+        self.code.extend(instruction)
+
+    def emit_jump(self, *instruction):
+        ''' Emits a jump with an offset to be filled in by patch(). '''
+        self.emit(*instruction)
+        return len(self.code) - 1
+
+    def patch(self, offset_index):
+        ''' Points a jump emitted by emit_jump() at the next instruction. '''
+        self.code[offset_index] = len(self.code) - (offset_index + 1)
+
+    def temporary(self):
+        register = self.first_temporary + self.temporaries
+        self.temporaries += 1
+        self.max_temporaries = max(self.max_temporaries, self.temporaries)
+        return register
+
+    def statement(self, node):
+        if isinstance(node, StatementSequential):
+            #walk the chain iteratively, long programs nest deeply
+            pending = [node]
+            while pending:
+                current = pending.pop()
+                if isinstance(current, StatementSequential):
+                    pending.append(current.s2)
+                    pending.append(current.s1)
+                else:
+                    self.statement(current)
+
+        elif isinstance(node, StatementAssignment):
+            self.expression(node.value, self.slot(node.var))
+
+        elif isinstance(node, StatementIf):
+            condition = self.expression(node.boolean_expression)
+            to_else = self.emit_jump(JUMP_IF_FALSE, condition, 0)
+            self.temporaries = 0
+
+            self.statement(node.then_statement)
+            to_end = self.emit_jump(JUMP, 0)
+
+            self.patch(to_else)
+            self.statement(node.else_statement)
+            self.patch(to_end)
+
+        elif isinstance(node, StatementWhile):
+            top = len(self.code)
+            condition = self.expression(node.bool_expr)
+            to_exit = self.emit_jump(JUMP_IF_FALSE, condition, 0)
+            self.temporaries = 0
+
+            self.statement(node.do_statement)
+            self.emit(JUMP, top - (len(self.code) + 2))
+            self.patch(to_exit)
+
+        elif isinstance(node, StatementSkip):
+            pass
+
+        else:
+            raise ValueError('Not a statement: ' + str(node))
+
+        self.temporaries = 0
+
+    def slot(self, name):
+        if name not in self.slots:
+            raise ValueError(name + " is not in memory yet!")
+        return self.slots[name]
+
+    def expression(self, node, target=None):
+        '''Emits the code for an expression.
+
+        :param node: the expression
+        :param int target: the register to leave the result in, if it
+                           has to be a particular one
+        :return int: the register holding the result
+        '''
+        if isinstance(node, ArithmeticParenthesized):
+            return self.expression(node.expr, target)
+
+        elif isinstance(node, (ArithmeticNumber, BooleanValue,
+                               ArithmeticVariable)):
+            if isinstance(node, ArithmeticVariable):
+                register = self.slot(node.var)
+            else:
+                register = self.constants[literal_value(node)]
+
+            if target is not None and target != register:
+                self.emit(MOVE, target, register)
+                return target
+            return register
+
+        elif isinstance(node, (ArithmeticOperation, BooleanRelation)):
+            if isinstance(node, ArithmeticOperation):
+                opcode = ARITHMETIC_OPCODES.get(node.op)
+            else:
+                opcode = RELATION_OPCODES.get(node.op)
+            if opcode is None:
+                raise ValueError('Not a valid operator:' + node.op)
+
+            #temporaries of the operands are free again once the
+            #instruction has read them
+            saved = self.temporaries
+            lhs = self.expression(node.lhs)
+            rhs = self.expression(node.rhs)
+            self.temporaries = saved
+            if target is None:
+                target = self.temporary()
+
+            self.emit(opcode, target, lhs, rhs)
+            return target
+
+        elif isinstance(node, BooleanNot):
+            saved = self.temporaries
+            operand = self.expression(node.expr)
+            self.temporaries = saved
+            if target is None:
+                target = self.temporary()
+
+            self.emit(NOT, target, operand)
+            return target
+
+        elif isinstance(node, BooleanBinary):
+            if node.op == '&&':   jump = JUMP_IF_FALSE
+            elif node.op == '||': jump = JUMP_IF_TRUE
+            else: raise ValueError('Not a valid boolean operator:' + node.op)
+
+            #short-circuit: the rhs only runs if the lhs left in the
+            #target does not already decide the result
+            if target is None:
+                target = self.temporary()
+            saved = self.temporaries
+            self.expression(node.lhs, target)
+            self.temporaries = saved
+            to_end = self.emit_jump(jump, target, 0)
+            self.expression(node.rhs, target)
+            self.temporaries = saved
+            self.patch(to_end)
+            return target
+
+        else:
+            raise ValueError('Not an expression: ' + str(node))
+
+def literal_value(node):
+    ''' The register value of a number or boolean literal. '''
+    if isinstance(node, ArithmeticNumber):
+        return wrap_int(int(node.num))
+    return 1 if node.value == 'true' else 0
+
+def constants_in(cst):
+    ''' The set of register values of all literals in a program. '''
+    values = set()
+    stack = [cst]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, (ArithmeticNumber, BooleanValue)):
+            values.add(literal_value(node))
+        stack.extend(node.children())
+    return values
+
+def compile_cst(cst, variables=None):
+    ''' Compiles a CST to a Program. See BytecodeCompiler. '''
+    return BytecodeCompiler(cst, variables).compile()
+
+def run(program):
+    '''Runs a program to completion.
+
+    :param Program program: the program to run
+    :return dict{str : int}: the final value of every variable
+    '''
+    code = program.code
+    r = list(program.registers)
+    pc = 0
+
+    while True:
+        op = code[pc]
+        if op == MOVE:
+            r[code[pc + 1]] = r[code[pc + 2]]
+            pc += 3
+        elif op == ADD:
+            v = r[code[pc + 2]] + r[code[pc + 3]]
+            if v > MAX_INT or v < MIN_INT: v = wrap_int(v)
+            r[code[pc + 1]] = v
+            pc += 4
+        elif op == SUB:
+            v = r[code[pc + 2]] - r[code[pc + 3]]
+            if v > MAX_INT or v < MIN_INT: v = wrap_int(v)
+            r[code[pc + 1]] = v
+            pc += 4
+        elif op == JUMP_IF_FALSE:
+            if r[code[pc + 1]]: pc += 3
+            else:               pc += 3 + code[pc + 2]
+        elif op == JUMP:
+            pc += 2 + code[pc + 1]
+        elif op == LT:
+            r[code[pc + 1]] = 1 if r[code[pc + 2]] < r[code[pc + 3]] else 0
+            pc += 4
+        elif op == LE:
+            r[code[pc + 1]] = 1 if r[code[pc + 2]] <= r[code[pc + 3]] else 0
+            pc += 4
+        elif op == EQ:
+            r[code[pc + 1]] = 1 if r[code[pc + 2]] == r[code[pc + 3]] else 0
+            pc += 4
+        elif op == GE:
+            r[code[pc + 1]] = 1 if r[code[pc + 2]] >= r[code[pc + 3]] else 0
+            pc += 4
+        elif op == GT:
+            r[code[pc + 1]] = 1 if r[code[pc + 2]] > r[code[pc + 3]] else 0
+            pc += 4
+        elif op == NE:
+            r[code[pc + 1]] = 1 if r[code[pc + 2]] != r[code[pc + 3]] else 0
+            pc += 4
+        elif op == MUL:
+            v = r[code[pc + 2]] * r[code[pc + 3]]
+            if v > MAX_INT or v < MIN_INT: v = wrap_int(v)
+            r[code[pc + 1]] = v
+            pc += 4
+        elif op == JUMP_IF_TRUE:
+            if r[code[pc + 1]]: pc += 3 + code[pc + 2]
+            else:               pc += 3
+        elif op == NOT:
+            r[code[pc + 1]] = 0 if r[code[pc + 2]] else 1
+            pc += 3
+        elif op == HALT:
+            break
+        else:
+            raise ValueError('Bad opcode ' + str(op) + ' at ' + str(pc))
+
+    return dict(zip(program.variables, r))
+
+def format_results(results):
+    ''' The variable dump printed by ast_to_llvm.build_exit. '''
+    return ''.join('Global variable %s = %d\n' % (var, results[var])
+                   for var in sorted(results))
+
+def disassemble(program):
+    ''' A human readable listing of a program's code. '''
+    lines = []
+    pc = 0
+    while pc < len(program.code):
+        op = program.code[pc]
+        operands = program.code[pc + 1:pc + 1 + OPERAND_COUNTS[op]]
+        lines.append('%5d  %-14s %s' % (pc, OPCODE_NAMES[op],
+                                        ' '.join(str(o) for o in operands)))
+        pc += 1 + OPERAND_COUNTS[op]
+    return '\n'.join(lines)
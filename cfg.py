@@ -16,17 +16,26 @@
     separated by lines.
 """
 
-from pyparsing import *
-
-
-# pyparsing definitions for above-specified context-free grammar.
-pyp_Arrow = Keyword("->").suppress()
-pyp_Symbol = Word(printables)
-pyp_List = ZeroOrMore(~LineStart().leaveWhitespace() + Word(printables))
-pyp_Production = Group(pyp_Symbol.setResultsName("lhs") +
-                       pyp_Arrow.suppress() +
-                       Group(pyp_List).setResultsName("rhs"))
-pyp_Grammar = ZeroOrMore(pyp_Production)
+import backends
+
+
+def grammar_parser():
+    """ The pyparsing definitions for the above-specified context-free
+    grammar, built the first time a grammar file is read. """
+    global _pyp_Grammar
+    if _pyp_Grammar is None:
+        pp = backends.load('pyparsing')
+        pyp_Arrow = pp.Keyword("->").suppress()
+        pyp_Symbol = pp.Word(pp.printables)
+        pyp_List = pp.ZeroOrMore(~pp.LineStart().leaveWhitespace() +
+                                 pp.Word(pp.printables))
+        pyp_Production = pp.Group(pyp_Symbol.setResultsName("lhs") +
+                                  pyp_Arrow.suppress() +
+                                  pp.Group(pyp_List).setResultsName("rhs"))
+        _pyp_Grammar = pp.ZeroOrMore(pyp_Production)
+    return _pyp_Grammar
+
+_pyp_Grammar = None
 
 EOF = '\0'
 EPSILON = '`'
@@ -69,7 +78,7 @@ class Grammar:
 
         if grammar is not None:
             # Convert ParseResult objects into Productions.
-            parse = pyp_Grammar.parseFile(grammar)
+            parse = grammar_parser().parseFile(grammar)
             productions = [Production(p.lhs, p.rhs.asList()) for p in parse]
 
             # First production's left-hand-side is start symbol.
@@ -0,0 +1,139 @@
+'''A content-addressed cache for the artifacts of the source-to-binary
+pipeline in homework1_suite. Every artifact is stored under the hash of
+everything that went into producing it:
+
+  tokens            source
+  ast               source, grammar
+  bitcode, object,  source, grammar, compiler options
+  binary
+
+so a change to the compiler options, say, still reuses the cached token
+stream and reduced AST. The cache is bounded in size; once it grows past
+the limit, the least recently used artifacts are evicted first.
+'''
+
+import hashlib
+import json
+import os
+import tempfile
+
+#pipeline stages, from shallowest to deepest
+STAGES = ['tokens', 'ast', 'bitcode', 'object', 'binary']
+
+#bump when a change to the pipeline makes old artifacts invalid
+CACHE_VERSION = 4
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+def stage_keys(source, grammar, options):
+    '''Returns the cache key of every stage's artifact.
+
+    :param str source: the program text
+    :param str grammar: the grammar file text
+    :param dict options: the compiler options that affect code generation
+    :return dict{str : str}: stage name to key
+    '''
+    def digest(*parts):
+        h = hashlib.sha1(str(CACHE_VERSION))
+        for part in parts:
+            h.update(hashlib.sha1(part).digest())
+        return h.hexdigest()
+
+    option_text = json.dumps(options, sort_keys=True)
+    keys = {'tokens': digest(source),
+            'ast': digest(source, grammar)}
+    for stage in ['bitcode', 'object', 'binary']:
+        keys[stage] = digest(source, grammar, option_text)
+    return keys
+
+
+class CompileCache:
+    ''' A directory of cached artifacts with LRU eviction. '''
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        '''
+        :param str directory: where to keep the artifacts, created if
+                              it does not exist
+        :param int max_bytes: the size the cache is trimmed back to
+        '''
+        self.directory = directory
+        self.max_bytes = max_bytes
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def path(self, key, stage):
+        return os.path.join(self.directory, key[:2], key + '.' + stage)
+
+    def get(self, key, stage):
+        '''Looks up an artifact, marking it as recently used.
+
+        :return str: the artifact's path, or None if it is not cached
+        '''
+        path = self.path(key, stage)
+        try:
+            os.utime(path, None)
+        except OSError:
+            return None
+        return path
+
+    def read(self, key, stage):
+        ''' :return str: the artifact's contents, or None if not cached '''
+        path = self.get(key, stage)
+        if path is None:
+            return None
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def put(self, key, stage, data):
+        '''Stores an artifact, then evicts old ones if the cache is over
+        its size limit.
+
+        :param str data: the artifact's contents
+        :return str: the artifact's path
+        '''
+        path = self.path(key, stage)
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        #write then rename, so a concurrent reader never sees half a file
+        fd, temp_path = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        if stage == 'binary':
+            os.chmod(temp_path, 0755)
+        os.rename(temp_path, path)
+
+        self.evict()
+        return path
+
+    def entries(self):
+        ''' :return list[(float, int, str)]: (last use, size, path) of
+                                            every artifact '''
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+        return entries
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        ''' Removes least recently used artifacts until under the limit. '''
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
@@ -0,0 +1,237 @@
+'''A long-lived compiler for the homework 1 language. The grammar, its parse
+table, pyparsing and llvmpy are loaded once, when the server starts, and
+every request after that only pays for compiling its own program.
+
+Requests and responses are JSON objects, one per line, read from stdin
+and written to stdout, or exchanged over a Unix socket:
+
+    {"id": 1, "mode": "jit", "file": "prog.txt", "opt_level": 2}
+    {"id": 1, "ok": true, "exit_code": 0, "results": {"x": 10}, ...}
+
+A request names its program with "file" or gives it inline as "source".
+The modes are:
+
+    ir      the LLVM IR of the program, in "ir"
+    object  writes an object file, to "output" or next to the source
+    jit     runs the program with the JIT; "exit_code" and "results"
+    vm      runs the program on the bytecode VM; "results"
+
+Successful responses carry the request's stage_trace records in
+"stages". A failed request gets "ok": false and an "error" instead.
+
+    python compile_server.py serve [--socket PATH]
+    python compile_server.py client --socket PATH [--mode MODE] FILE...
+'''
+
+import argparse
+import json
+import os
+import socket
+import SocketServer
+import sys
+import threading
+import time
+
+import ast_to_llvm
+import bytecode_vm
+import homework1_suite
+import stage_trace
+
+MODES = ['ir', 'object', 'jit', 'vm']
+
+
+class CompileServer:
+    ''' The warm compiler state shared by every request. '''
+
+    def __init__(self):
+        self.parser = homework1_suite.build_parser()
+        self.jit = None
+        if ast_to_llvm.HAVE_LLVM:
+            import llvm_jit
+            self.jit = llvm_jit.JitRunner()
+        #the pipeline swaps sys.stdout and the JIT redirects fd 1, so
+        #requests are compiled one at a time
+        self.lock = threading.Lock()
+
+    def compile(self, request, trace):
+        '''Compiles one program.
+
+        :param dict request: see the module docstring
+        :param Trace trace: the trace to record the stages in
+        :return dict: the fields of the response besides id and ok
+        '''
+        mode = request.get('mode', 'ir')
+        if mode not in MODES:
+            raise ValueError("Unknown mode: " + str(mode))
+        if 'source' in request:
+            source = request['source']
+        elif 'file' in request:
+            source = open(request['file'], 'r').read()
+        else:
+            raise ValueError("A request needs a file or a source")
+        opt_level = int(request.get('opt_level', 0))
+
+        root = homework1_suite.parse(homework1_suite.tokenize(source),
+                                     self.parser, trace)
+        cst, variables = homework1_suite.ast_to_cst(root, opt_level, trace)
+        if mode == 'vm':
+            program = bytecode_vm.compile_cst(cst, variables)
+            return {'results': bytecode_vm.run(program)}
+
+        if not ast_to_llvm.HAVE_LLVM:
+            raise ValueError("Mode %s needs llvmpy, which is not installed"
+                             % mode)
+        llvm_code = homework1_suite.cst_to_llvm(cst, variables, opt_level,
+                                                trace=trace)
+        if mode == 'ir':
+            return {'ir': str(llvm_code)}
+        elif mode == 'object':
+            obj = request.get('output')
+            if obj is None:
+                if 'file' not in request:
+                    raise ValueError("An object request with an inline "
+                                     "source needs an output path")
+                obj = homework1_suite.binary_name(request['file']) + '.o'
+            homework1_suite.llvm_to_object(obj, llvm_code, trace)
+            return {'object': os.path.abspath(obj)}
+        else:
+            exit_code, results = self.jit.run(llvm_code)
+            return {'exit_code': exit_code, 'results': results}
+
+    def handle(self, line):
+        '''Answers one request line.
+
+        :param str line: a JSON request
+        :return str: the JSON response, without a newline
+        '''
+        start = time.time()
+        response = {}
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("A request is a JSON object")
+            response['id'] = request.get('id')
+            with self.lock:
+                stdout = sys.stdout
+                #the pipeline reports its progress on stdout, which may
+                #be the response channel
+                sys.stdout = open(os.devnull, 'w')
+                trace = stage_trace.Trace(quiet=True)
+                try:
+                    response.update(self.compile(request, trace))
+                    response['stages'] = trace.stages
+                finally:
+                    sys.stdout.close()
+                    sys.stdout = stdout
+            response['ok'] = True
+        except Exception as e:
+            response['ok'] = False
+            response['error'] = '%s: %s' % (type(e).__name__, e)
+        response['seconds'] = time.time() - start
+        return json.dumps(response, sort_keys=True)
+
+def serve_lines(server, input, output):
+    ''' Answers requests line by line until the input is closed. '''
+    for line in iter(input.readline, ''):
+        if not line.strip():
+            continue
+        output.write(server.handle(line) + '\n')
+        output.flush()
+
+
+class RequestHandler(SocketServer.StreamRequestHandler):
+
+    def handle(self):
+        serve_lines(self.server.compile_server, self.rfile, self.wfile)
+
+
+class UnixServer(SocketServer.ThreadingMixIn, SocketServer.UnixStreamServer):
+    daemon_threads = True
+
+def serve_socket(server, path):
+    '''Answers requests from any number of clients on a Unix socket until
+    interrupted.
+    '''
+    if os.path.exists(path):
+        os.remove(path)
+    unix_server = UnixServer(path, RequestHandler)
+    unix_server.compile_server = server
+    try:
+        unix_server.serve_forever()
+    finally:
+        unix_server.server_close()
+        os.remove(path)
+
+def send(path, requests):
+    '''Sends requests to a server over its socket.
+
+    :param str path: the server's socket
+    :param requests: an iterable of request dicts
+    :return generator[dict]: the responses, in order
+    '''
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    connection.connect(path)
+    try:
+        replies = connection.makefile('r')
+        for request in requests:
+            connection.sendall(json.dumps(request) + '\n')
+            yield json.loads(replies.readline())
+    finally:
+        connection.close()
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Compiles programs in '
+                                         'the homework 1 language on '
+                                         'request.')
+    commands = arg_parser.add_subparsers(dest='command')
+
+    serve = commands.add_parser('serve', help='run the server')
+    serve.add_argument('--socket',
+                       help='listen on this Unix socket (default: read '
+                            'requests from stdin)')
+
+    client = commands.add_parser('client', help='send files to a server')
+    client.add_argument('--socket', required=True,
+                        help="the server's Unix socket")
+    client.add_argument('--mode', default='ir', choices=MODES,
+                        help='what to do with each file (default: ir)')
+    client.add_argument('-O', dest='opt_level', type=int, default=0,
+                        help='optimization level (default: 0)')
+    client.add_argument('files', nargs='+', help='the programs to compile')
+    args = arg_parser.parse_args()
+
+    if args.command == 'serve':
+        responses = sys.stdout
+        if not args.socket:
+            #keep stdout for responses; anything printed while building
+            #the parser goes to stderr instead
+            sys.stdout = sys.stderr
+        server = CompileServer()
+        if args.socket:
+            print 'Listening on %s' % args.socket
+            sys.stdout.flush()
+            try:
+                serve_socket(server, args.socket)
+            except KeyboardInterrupt:
+                pass
+        else:
+            serve_lines(server, sys.stdin, responses)
+    else:
+        requests = [{'id': n, 'mode': args.mode, 'opt_level': args.opt_level,
+                     'file': os.path.abspath(f)}
+                    for n, f in enumerate(args.files)]
+        failed = 0
+        for request, response in zip(requests, send(args.socket, requests)):
+            print '%s (%.1f ms)' % (request['file'],
+                                    response['seconds'] * 1000)
+            if not response['ok']:
+                failed += 1
+                print '  ' + response['error']
+            elif 'ir' in response:
+                print response['ir']
+            elif 'object' in response:
+                print '  ' + response['object']
+            else:
+                for var in sorted(response['results']):
+                    print '  %s = %d' % (var, response['results'][var])
+        exit(1 if failed else 0)
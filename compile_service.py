@@ -0,0 +1,383 @@
+'''A compile service that overlaps the stages of many requests. Each
+stage has its own threads and takes its work off a bounded queue, so the
+lexing of one request overlaps the compiling of the one before it and
+the linking of the one before that:
+
+    submit -> [lex] -> [compile] -> [link] -> callback
+
+  - lex:     lexes the program into a TokenStream, in this process
+  - compile: parses and lowers the program in a pool of worker processes,
+             each with a warm parser, and runs it there for jit and vm
+             requests; one thread per worker waits on it
+  - link:    links object files with `cc', one child process per thread
+
+A full queue blocks the stage that feeds it, so a burst of requests
+waits in submit rather than piling up in memory. Every stage keeps
+metrics: the depth of its queue, how long jobs waited in the queue and
+how long the stage took over them.
+
+Requests and responses are the JSON objects of compile_server, with one
+more mode:
+
+    native  writes a linked executable, to "output" or next to the source;
+            the response has its path in "binary"
+
+    python compile_service.py [--workers N] [--linkers N] [--queue-size N]
+        [--metrics]
+
+reads requests from stdin, one per line, and writes each response as
+soon as it is ready, so responses can come back out of order.
+'''
+
+import argparse
+import collections
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import threading
+import time
+import Queue
+
+import ast_to_llvm
+import bytecode_vm
+import homework1_suite
+import stage_trace
+import token_stream
+
+MODES = ['ir', 'object', 'jit', 'native', 'vm']
+
+#latencies kept per stage for the percentiles
+LATENCY_SAMPLES = 1000
+
+#the warm parser, set in each worker by init_worker
+_parser = None
+#the worker's llvm_jit.JitRunner, made for its first jit request
+_jit = None
+
+
+def init_worker(parser):
+    global _parser
+    _parser = parser
+    sys.stdout = open(os.devnull, 'w')
+
+def compile_job(request, tokens):
+    '''Parses and lowers one program in a worker, and runs it for jit
+    and vm requests.
+
+    :param dict request: see the module docstring
+    :param TokenStream tokens: the program's tokens
+    :return (dict, list[dict]): the fields of the response, and the
+                                stage_trace records of the compilation
+    '''
+    trace = stage_trace.Trace(quiet=True)
+    mode = request.get('mode', 'ir')
+    opt_level = int(request.get('opt_level', 0))
+
+    root = homework1_suite.parse(tokens, _parser, trace)
+    cst, variables = homework1_suite.ast_to_cst(root, opt_level, trace)
+    if mode == 'vm':
+        program = bytecode_vm.compile_cst(cst, variables)
+        result = {'results': bytecode_vm.run(program)}
+    elif not ast_to_llvm.HAVE_LLVM:
+        raise ValueError("Mode %s needs llvmpy, which is not installed"
+                         % mode)
+    else:
+        llvm_code = homework1_suite.cst_to_llvm(cst, variables, opt_level,
+                                                trace=trace)
+        if mode == 'ir':
+            result = {'ir': str(llvm_code)}
+        elif mode == 'jit':
+            exit_code, results = jit_runner().run(llvm_code)
+            result = {'exit_code': exit_code, 'results': results}
+        else:
+            obj = object_path(request)
+            homework1_suite.llvm_to_object(obj, llvm_code, trace)
+            result = {'object': os.path.abspath(obj)}
+    return result, trace.stages
+
+def jit_runner():
+    global _jit
+    if _jit is None:
+        import llvm_jit
+        _jit = llvm_jit.JitRunner()
+    return _jit
+
+def object_path(request):
+    ''' The object file a request writes, see binary_path. '''
+    if request.get('mode') == 'object' and request.get('output'):
+        return request['output']
+    return binary_path(request) + '.o'
+
+def binary_path(request):
+    ''' The output of a request, by default named after its file. '''
+    if request.get('output'):
+        return request['output']
+    if 'file' not in request:
+        raise ValueError("A request with an inline source needs an "
+                         "output path")
+    return homework1_suite.binary_name(request['file'])
+
+
+class Job:
+    ''' One request on its way through the stages. '''
+
+    def __init__(self, request, callback):
+        self.request = request
+        self.callback = callback
+        self.response = {'id': request.get('id')}
+        self.start = time.time()
+        #set whenever the job is put on a queue
+        self.queued = None
+        self.tokens = None
+
+
+class StageMetrics:
+    ''' Counts and latencies of one stage. '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.processed = 0
+        self.failed = 0
+        self.max_depth = 0
+        self.waits = collections.deque(maxlen=LATENCY_SAMPLES)
+        self.services = collections.deque(maxlen=LATENCY_SAMPLES)
+
+    def observe_depth(self, depth):
+        with self.lock:
+            self.max_depth = max(self.max_depth, depth)
+
+    def record(self, wait, service, ok):
+        with self.lock:
+            self.processed += 1
+            if not ok:
+                self.failed += 1
+            self.waits.append(wait)
+            self.services.append(service)
+
+    def to_json(self, depth):
+        with self.lock:
+            self.max_depth = max(self.max_depth, depth)
+            return {'depth': depth,
+                    'max_depth': self.max_depth,
+                    'processed': self.processed,
+                    'failed': self.failed,
+                    'wait': latency_summary(self.waits),
+                    'service': latency_summary(self.services)}
+
+def latency_summary(samples):
+    ''' :return dict: the mean, median, 95th percentile and maximum '''
+    if not samples:
+        return {'mean': 0.0, 'p50': 0.0, 'p95': 0.0, 'max': 0.0}
+    ordered = sorted(samples)
+    return {'mean': sum(ordered) / len(ordered),
+            'p50': ordered[len(ordered) // 2],
+            'p95': ordered[min(len(ordered) - 1, len(ordered) * 95 // 100)],
+            'max': ordered[-1]}
+
+
+class Stage:
+    '''Threads that take jobs off a bounded queue, pass each to a
+    function and hand it on. The function returns the next stage, or
+    None when the job is finished.
+    '''
+
+    def __init__(self, name, function, threads, queue_size):
+        self.name = name
+        self.function = function
+        self.queue = Queue.Queue(queue_size)
+        self.metrics = StageMetrics()
+        self.threads = [threading.Thread(target=self.run,
+                                         name='%s-%d' % (name, n))
+                        for n in range(threads)]
+        for thread in self.threads:
+            thread.daemon = True
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+
+    def put(self, job):
+        ''' Queues a job, waiting while the queue is full. '''
+        job.queued = time.time()
+        self.queue.put(job)
+        self.metrics.observe_depth(self.queue.qsize())
+
+    def run(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                break
+            started = time.time()
+            try:
+                following = self.function(job)
+                ok = True
+            except Exception as e:
+                job.response['ok'] = False
+                job.response['error'] = '%s: %s' % (type(e).__name__, e)
+                following = None
+                ok = False
+            finished = time.time()
+            self.metrics.record(started - job.queued, finished - started, ok)
+            if following is not None:
+                following.put(job)
+            else:
+                finish(job)
+
+    def stop(self):
+        ''' Lets the queued jobs through, then ends the threads. '''
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+
+def finish(job):
+    job.response.setdefault('ok', True)
+    job.response['seconds'] = time.time() - job.start
+    job.callback(job.response)
+
+
+class CompileService:
+    ''' The stages and the worker pool, see the module docstring. '''
+
+    def __init__(self, workers=None, linkers=None, queue_size=16):
+        '''
+        :param int workers: worker processes, by default one per CPU
+        :param int linkers: links run at once, by default one per worker
+        :param int queue_size: the most jobs waiting for each stage
+        '''
+        workers = workers or multiprocessing.cpu_count()
+        linkers = linkers or workers
+        self.pool = multiprocessing.Pool(workers, init_worker,
+                                         (homework1_suite.build_parser(),))
+        self.lex_stage = Stage('lex', self.lex, 1, queue_size)
+        self.compile_stage = Stage('compile', self.compile, workers,
+                                   queue_size)
+        self.link_stage = Stage('link', self.link, linkers, queue_size)
+        self.stages = [self.lex_stage, self.compile_stage, self.link_stage]
+
+    def start(self):
+        for stage in self.stages:
+            stage.start()
+
+    def submit(self, request, callback):
+        '''Queues a request, waiting while the lex queue is full.
+
+        :param dict request: see the module docstring
+        :param callback: called with the response dict from a stage's
+                         thread when the request is done
+        '''
+        self.lex_stage.put(Job(request, callback))
+
+    def stop(self):
+        ''' Finishes every submitted request and shuts the pool down. '''
+        for stage in self.stages:
+            stage.stop()
+        self.pool.close()
+        self.pool.join()
+
+    def metrics(self):
+        ''' :return dict{str : dict}: the metrics of every stage '''
+        return dict((stage.name, stage.metrics.to_json(stage.queue.qsize()))
+                    for stage in self.stages)
+
+    def lex(self, job):
+        request = job.request
+        if request.get('mode', 'ir') not in MODES:
+            raise ValueError("Unknown mode: " + str(request.get('mode')))
+        if 'source' in request:
+            source = request['source']
+        elif 'file' in request:
+            source = open(request['file'], 'r').read()
+        else:
+            raise ValueError("A request needs a file or a source")
+        job.tokens = token_stream.from_lexer(homework1_suite.homework1_lexer,
+                                             source)
+        return self.compile_stage
+
+    def compile(self, job):
+        result, stages = self.pool.apply(compile_job,
+                                         (job.request, job.tokens))
+        job.tokens = None
+        job.response.update(result)
+        job.response['stages'] = stages
+        if job.request.get('mode') == 'native':
+            return self.link_stage
+        return None
+
+    def link(self, job):
+        obj = job.response.pop('object')
+        binary = binary_path(job.request)
+        cmd = ['cc', '-o', binary, obj]
+        linker = subprocess.Popen(cmd, stdout=subprocess.PIPE,
+                                  stderr=subprocess.STDOUT)
+        output = linker.communicate()[0]
+        if linker.returncode != 0:
+            raise Exception("Failed to link with " + str(cmd) + ": " +
+                            output.strip())
+        job.response['binary'] = os.path.abspath(binary)
+        return None
+
+def format_metrics(metrics):
+    ''' :return str: a table of the stage metrics, one stage per line '''
+    lines = ['  %-8s %6s %6s %9s %6s %10s %10s %10s %10s' %
+             ('stage', 'depth', 'max', 'processed', 'failed',
+              'wait p50', 'wait p95', 'run p50', 'run p95')]
+    for name in ['lex', 'compile', 'link']:
+        m = metrics[name]
+        lines.append('  %-8s %6d %6d %9d %6d %10.2f %10.2f %10.2f %10.2f' %
+                     (name, m['depth'], m['max_depth'], m['processed'],
+                      m['failed'], m['wait']['p50'] * 1000,
+                      m['wait']['p95'] * 1000, m['service']['p50'] * 1000,
+                      m['service']['p95'] * 1000))
+    lines.append('  (latencies in ms)')
+    return '\n'.join(lines)
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Compiles programs in '
+                                         'the homework 1 language from '
+                                         'requests on stdin, overlapping '
+                                         'their stages.')
+    arg_parser.add_argument('--workers', type=int, default=None,
+                            help='worker processes (default: one per CPU)')
+    arg_parser.add_argument('--linkers', type=int, default=None,
+                            help='links run at once (default: one per '
+                                 'worker)')
+    arg_parser.add_argument('--queue-size', type=int, default=16,
+                            help='the most requests waiting for each stage '
+                                 '(default: 16)')
+    arg_parser.add_argument('--metrics', action='store_true',
+                            help='print the stage metrics to stderr when '
+                                 'the input ends')
+    args = arg_parser.parse_args()
+
+    responses = sys.stdout
+    #keep stdout for responses; anything printed while building the
+    #parser goes to stderr instead
+    sys.stdout = sys.stderr
+    service = CompileService(args.workers, args.linkers, args.queue_size)
+    service.start()
+
+    write_lock = threading.Lock()
+    def respond(response):
+        with write_lock:
+            responses.write(json.dumps(response, sort_keys=True) + '\n')
+            responses.flush()
+
+    for line in iter(sys.stdin.readline, ''):
+        if not line.strip():
+            continue
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("A request is a JSON object")
+        except ValueError as e:
+            respond({'id': None, 'ok': False,
+                     'error': '%s: %s' % (type(e).__name__, e)})
+            continue
+        service.submit(request, respond)
+
+    service.stop()
+    if args.metrics:
+        sys.stderr.write(format_metrics(service.metrics()) + '\n')
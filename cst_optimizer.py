@@ -0,0 +1,222 @@
+'''Optimizations over the CST built by ast_to_llvm.ast_to_cst, run before
+any backend lowers it:
+
+  - constant folding of arithmetic, relations and boolean operators
+  - constant propagation through straight-line assignments
+  - removal of if branches and while bodies that can never run
+  - removal of skip statements
+
+Since the expressions of the language have no side effects, any
+expression whose value is known may be replaced by that value. The
+optimized tree is built out of new nodes; the input is left untouched.
+'''
+
+from ast_to_llvm import StatementWhile, StatementIf, StatementSequential,\
+    StatementAssignment, StatementSkip, ArithmeticParenthesized,\
+    ArithmeticOperation, ArithmeticNumber, ArithmeticVariable,\
+    BooleanValue, BooleanNot, BooleanBinary, BooleanRelation,\
+    assigned_variables, evaluate_arithmetic, evaluate_relation, wrap_int
+
+
+def optimize_cst(cst):
+    '''Returns an optimized copy of a program.
+
+    :param cst: the ProgramNode at the root of the program
+    :return: the root of the optimized program
+    '''
+    root = optimize_statement(cst, {})
+    link_parents(root)
+    return root
+
+def link_parents(root):
+    '''Points the parent of every node in the tree at its parent.'''
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        for child in node.children():
+            child.parent = node
+            stack.append(child)
+
+def constant_value(node):
+    '''Returns the value of a number or boolean literal, or None if the
+    node is not a literal.
+    '''
+    if isinstance(node, ArithmeticNumber):
+        return wrap_int(int(node.num))
+    elif isinstance(node, BooleanValue):
+        return node.value == 'true'
+    return None
+
+def make_number(value):
+    return ArithmeticNumber(str(value))
+
+def make_boolean(value):
+    return BooleanValue('true' if value else 'false')
+
+def optimize_statement(node, constants):
+    '''Optimizes a statement.
+
+    :param node: the statement to optimize
+    :param dict{str : int} constants: the variables known to hold a
+                                      constant before the statement runs.
+                                      It is updated to the variables known
+                                      to be constant after it runs.
+    :return: the optimized statement
+    '''
+    if isinstance(node, StatementSequential):
+        return optimize_sequence(node, constants)
+
+    elif isinstance(node, StatementAssignment):
+        value = optimize_expression(node.value, constants)
+        constant = constant_value(value)
+        if constant is None:
+            constants.pop(node.var, None)
+        else:
+            constants[node.var] = constant
+        return StatementAssignment(node.var, value)
+
+    elif isinstance(node, StatementIf):
+        condition = optimize_expression(node.boolean_expression, constants)
+        constant = constant_value(condition)
+
+        #only one branch can ever run
+        if constant is not None:
+            if constant:
+                return optimize_statement(node.then_statement, constants)
+            return optimize_statement(node.else_statement, constants)
+
+        then_constants = dict(constants)
+        then_statement = optimize_statement(node.then_statement,
+                                            then_constants)
+        else_statement = optimize_statement(node.else_statement,
+                                            constants)
+
+        #after the if, only what both branches agree on is known
+        for var in constants.keys():
+            if then_constants.get(var) != constants[var]:
+                del constants[var]
+
+        if isinstance(then_statement, StatementSkip) and\
+           isinstance(else_statement, StatementSkip):
+            return StatementSkip()
+        return StatementIf(condition, then_statement, else_statement)
+
+    elif isinstance(node, StatementWhile):
+        #the body never runs when the first test of the condition fails
+        first_test = optimize_expression(node.bool_expr, constants)
+        if constant_value(first_test) is False:
+            return StatementSkip()
+
+        #anything the body assigns may differ on every later test
+        loop_constants = dict(constants)
+        for var in assigned_variables(node.do_statement):
+            loop_constants.pop(var, None)
+
+        condition = optimize_expression(node.bool_expr, loop_constants)
+
+        do_statement = optimize_statement(node.do_statement,
+                                          dict(loop_constants))
+
+        constants.clear()
+        constants.update(loop_constants)
+        return StatementWhile(condition, do_statement)
+
+    elif isinstance(node, StatementSkip):
+        return StatementSkip()
+
+    else:
+        raise ValueError('Not a statement: ' + str(node))
+
+def optimize_sequence(node, constants):
+    '''Optimizes a chain of sequential statements, dropping any that
+    became skip. The chain is walked iteratively so long programs don't
+    hit the recursion limit.
+    '''
+    statements = []
+    pending = [node]
+    while pending:
+        current = pending.pop()
+        if isinstance(current, StatementSequential):
+            pending.append(current.s2)
+            pending.append(current.s1)
+            continue
+
+        statement = optimize_statement(current, constants)
+        if not isinstance(statement, StatementSkip):
+            statements.append(statement)
+
+    if not statements:
+        return StatementSkip()
+
+    result = statements[-1]
+    for statement in statements[-2::-1]:
+        result = StatementSequential(statement, result)
+    return result
+
+def optimize_expression(node, constants):
+    '''Folds an arithmetic or boolean expression as far as the known
+    constants allow.
+
+    :param node: the expression to fold
+    :param dict{str : int} constants: the variables known to be constant
+    :return: the folded expression
+    '''
+    if isinstance(node, ArithmeticNumber):
+        return make_number(constant_value(node))
+
+    elif isinstance(node, ArithmeticVariable):
+        if node.var in constants:
+            return make_number(constants[node.var])
+        return ArithmeticVariable(node.var)
+
+    elif isinstance(node, ArithmeticParenthesized):
+        expr = optimize_expression(node.expr, constants)
+        if constant_value(expr) is not None:
+            return expr
+        return ArithmeticParenthesized(expr)
+
+    elif isinstance(node, ArithmeticOperation):
+        lhs = optimize_expression(node.lhs, constants)
+        rhs = optimize_expression(node.rhs, constants)
+        x, y = constant_value(lhs), constant_value(rhs)
+        if x is not None and y is not None:
+            return make_number(evaluate_arithmetic(node.op, x, y))
+        return ArithmeticOperation(lhs, node.op, rhs)
+
+    elif isinstance(node, BooleanValue):
+        return make_boolean(constant_value(node))
+
+    elif isinstance(node, BooleanNot):
+        expr = optimize_expression(node.expr, constants)
+        value = constant_value(expr)
+        if value is not None:
+            return make_boolean(not value)
+        return BooleanNot(expr)
+
+    elif isinstance(node, BooleanBinary):
+        lhs = optimize_expression(node.lhs, constants)
+        rhs = optimize_expression(node.rhs, constants)
+        x, y = constant_value(lhs), constant_value(rhs)
+
+        if node.op == '&&':
+            if x is False or y is False: return make_boolean(False)
+            if x is True: return rhs
+            if y is True: return lhs
+        elif node.op == '||':
+            if x is True or y is True: return make_boolean(True)
+            if x is False: return rhs
+            if y is False: return lhs
+        else:
+            raise ValueError('Not a valid boolean operator:' + node.op)
+        return BooleanBinary(lhs, node.op, rhs)
+
+    elif isinstance(node, BooleanRelation):
+        lhs = optimize_expression(node.lhs, constants)
+        rhs = optimize_expression(node.rhs, constants)
+        x, y = constant_value(lhs), constant_value(rhs)
+        if x is not None and y is not None:
+            return make_boolean(evaluate_relation(node.op, x, y))
+        return BooleanRelation(lhs, node.op, rhs)
+
+    else:
+        raise ValueError('Not an expression: ' + str(node))
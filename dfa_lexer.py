@@ -0,0 +1,501 @@
+'''A lexer generator. A token-spec file, kept next to the grammar it
+lexes for (homework1_grammar.txt has homework1_grammar.tokens), lists one
+rule per line:
+
+    %ignore  /[ \\t\\r\\n]+/
+    :=       ":="
+    var      /[a-zA-Z]+/
+
+From the rules the generator builds an NFA, turns it into a DFA by subset
+construction and minimizes that with Hopcroft's algorithm. Bytes that no
+rule tells apart share a byte class, so the transitions are stored as a
+dense table of states by byte classes. Building the tables is the slow
+part, so they can be cached on disk, keyed by the spec's contents.
+
+The scanner walks the table one byte at a time, taking the longest match
+and, between matches of the same length, the rule listed first. It reads
+str or mmap input, and yields lexer.Tokens that ast_parser.Parser takes
+directly.
+
+    python dfa_lexer.py SPEC FILE
+'''
+
+import hashlib
+import marshal
+import os
+
+import compile_cache
+from lexer import Token
+
+#bump when a change to the generator makes cached tables invalid
+TABLE_VERSION = 1
+
+IGNORE = '%ignore'
+
+ALL_BYTES = frozenset(range(256))
+
+CLASS_ESCAPES = {'d': frozenset(range(ord('0'), ord('9') + 1)),
+                 's': frozenset(map(ord, ' \t\r\n\f\v')),
+                 'w': frozenset(map(ord, '0123456789_'
+                                         'abcdefghijklmnopqrstuvwxyz'
+                                         'ABCDEFGHIJKLMNOPQRSTUVWXYZ'))}
+CHAR_ESCAPES = {'t': '\t', 'n': '\n', 'r': '\r', 'f': '\f', 'v': '\v'}
+
+
+def read_spec(text):
+    '''Reads the rules of a token-spec file.
+
+    :param str text: the file's contents
+    :return list[(str, str, bool)]: (terminal, regex, is literal) for
+                                    each rule, in order
+    '''
+    rules = []
+    for number, line in enumerate(text.splitlines(), 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        parts = line.split(None, 1)
+        if len(parts) != 2:
+            raise ValueError("Line %d: expected a terminal and a pattern: %s"
+                             % (number, line))
+        terminal, pattern = parts[0], parts[1].strip()
+        if len(pattern) >= 2 and pattern[0] == pattern[-1] == '"':
+            literal = pattern[1:-1].replace('\\"', '"').replace('\\\\', '\\')
+            rules.append((terminal, literal, True))
+        elif len(pattern) >= 2 and pattern[0] == pattern[-1] == '/':
+            rules.append((terminal, pattern[1:-1], False))
+        else:
+            raise ValueError('Line %d: a pattern is a "literal" or a /regex/: '
+                             '%s' % (number, pattern))
+    return rules
+
+
+class RegexParser:
+    '''Parses the regex syntax of token specs into a tree of tuples:
+
+        ('set', frozenset of bytes)
+        ('cat', [trees])
+        ('alt', [trees])
+        ('star', tree), ('plus', tree), ('opt', tree)
+
+    Supported are literal characters, ., [classes] with ranges and ^,
+    the escapes \\d \\s \\w \\t \\n \\r, grouping, |, *, + and ?.
+    '''
+
+    def __init__(self, pattern):
+        self.pattern = pattern
+        self.position = 0
+
+    def error(self, message):
+        return ValueError("%s at %d in /%s/" % (message, self.position,
+                                                self.pattern))
+
+    def peek(self):
+        if self.position < len(self.pattern):
+            return self.pattern[self.position]
+        return None
+
+    def take(self):
+        c = self.peek()
+        self.position += 1
+        return c
+
+    def parse(self):
+        tree = self.alternation()
+        if self.peek() is not None:
+            raise self.error("Unbalanced )")
+        return tree
+
+    def alternation(self):
+        branches = [self.concatenation()]
+        while self.peek() == '|':
+            self.take()
+            branches.append(self.concatenation())
+        return branches[0] if len(branches) == 1 else ('alt', branches)
+
+    def concatenation(self):
+        items = []
+        while self.peek() not in (None, '|', ')'):
+            items.append(self.repetition())
+        return ('cat', items)
+
+    def repetition(self):
+        tree = self.atom()
+        while self.peek() in ('*', '+', '?'):
+            tree = ({'*': 'star', '+': 'plus', '?': 'opt'}[self.take()], tree)
+        return tree
+
+    def atom(self):
+        c = self.take()
+        if c == '(':
+            tree = self.alternation()
+            if self.take() != ')':
+                raise self.error("Missing )")
+            return tree
+        elif c == '[':
+            return ('set', self.char_class())
+        elif c == '.':
+            return ('set', ALL_BYTES - frozenset([ord('\n')]))
+        elif c == '\\':
+            return ('set', self.escape())
+        elif c in ('*', '+', '?'):
+            raise self.error("Nothing to repeat")
+        return ('set', frozenset([ord(c)]))
+
+    def escape(self):
+        c = self.take()
+        if c is None:
+            raise self.error("Trailing \\")
+        if c in CLASS_ESCAPES:
+            return CLASS_ESCAPES[c]
+        return frozenset([ord(CHAR_ESCAPES.get(c, c))])
+
+    def char_class(self):
+        negate = self.peek() == '^'
+        if negate:
+            self.take()
+        chars = set()
+        first = True
+        while first or self.peek() != ']':
+            first = False
+            c = self.take()
+            if c is None:
+                raise self.error("Missing ]")
+            if c == '\\':
+                low = self.escape()
+                if len(low) > 1:
+                    chars.update(low)
+                    continue
+                low = iter(low).next()
+            else:
+                low = ord(c)
+            following = self.pattern[self.position + 1:self.position + 2]
+            if self.peek() == '-' and following not in ('', ']'):
+                self.take()
+                c = self.take()
+                high = iter(self.escape()).next() if c == '\\' else ord(c)
+                if high < low:
+                    raise self.error("Bad range")
+                chars.update(range(low, high + 1))
+            else:
+                chars.add(low)
+        self.take()
+        return ALL_BYTES - chars if negate else frozenset(chars)
+
+def literal_tree(text):
+    return ('cat', [('set', frozenset([ord(c)])) for c in text])
+
+
+class NFA:
+    ''' An NFA over bytes, built by Thompson's construction. '''
+
+    def __init__(self):
+        self.epsilon = []
+        #(set of bytes, target) pairs of each state
+        self.edges = []
+        #accepting state to the index of its rule
+        self.accepts = {}
+        self.start = self.new_state()
+
+    def new_state(self):
+        self.epsilon.append([])
+        self.edges.append([])
+        return len(self.epsilon) - 1
+
+    def add_rule(self, tree, rule):
+        start, end = self.build(tree)
+        self.epsilon[self.start].append(start)
+        self.accepts[end] = rule
+
+    def build(self, tree):
+        ''' :return (int, int): the start and end states of the fragment '''
+        kind = tree[0]
+        start = self.new_state()
+        if kind == 'set':
+            end = self.new_state()
+            self.edges[start].append((tree[1], end))
+        elif kind == 'cat':
+            end = start
+            for item in tree[1]:
+                s, e = self.build(item)
+                self.epsilon[end].append(s)
+                end = e
+        elif kind == 'alt':
+            end = self.new_state()
+            for branch in tree[1]:
+                s, e = self.build(branch)
+                self.epsilon[start].append(s)
+                self.epsilon[e].append(end)
+        else:
+            s, e = self.build(tree[1])
+            end = self.new_state()
+            self.epsilon[start].append(s)
+            self.epsilon[e].append(end)
+            if kind in ('star', 'opt'):
+                self.epsilon[start].append(end)
+            if kind in ('star', 'plus'):
+                self.epsilon[e].append(s)
+        return start, end
+
+    def closure(self, states):
+        closure = set(states)
+        pending = list(states)
+        while pending:
+            for s in self.epsilon[pending.pop()]:
+                if s not in closure:
+                    closure.add(s)
+                    pending.append(s)
+        return frozenset(closure)
+
+    def byte_classes(self):
+        '''Partitions the bytes so bytes in a class take the same edges.
+
+        :return (list[int], list[int]): the class of every byte, and a
+                                        representative byte of every class
+        '''
+        sets = list(set(s for edges in self.edges for s, _ in edges))
+        signatures = {}
+        class_of = []
+        representatives = []
+        for byte in range(256):
+            signature = tuple(byte in s for s in sets)
+            if signature not in signatures:
+                signatures[signature] = len(representatives)
+                representatives.append(byte)
+            class_of.append(signatures[signature])
+        return class_of, representatives
+
+
+def subset_construction(nfa, representatives):
+    '''Builds the DFA of an NFA. State 0 is the dead state and 1 the start.
+
+    :return (list[list[int]], list[int]): each state's transition by byte
+                                          class, and the rule it accepts
+                                          (-1 for none)
+    '''
+    dead = frozenset()
+    start = nfa.closure([nfa.start])
+    numbers = {dead: 0, start: 1}
+    states = [dead, start]
+    transitions = []
+    accepts = []
+
+    i = 0
+    while i < len(states):
+        current = states[i]
+        row = []
+        for byte in representatives:
+            targets = [t for s in current for bytes, t in nfa.edges[s]
+                       if byte in bytes]
+            target = nfa.closure(targets) if targets else dead
+            if target not in numbers:
+                numbers[target] = len(states)
+                states.append(target)
+            row.append(numbers[target])
+        transitions.append(row)
+        rules = [nfa.accepts[s] for s in current if s in nfa.accepts]
+        accepts.append(min(rules) if rules else -1)
+        i += 1
+    return transitions, accepts
+
+def minimize(transitions, labels):
+    '''Merges equivalent states with Hopcroft's partition refinement.
+
+    :param list[list[int]] transitions: a complete DFA, by byte class
+    :param list labels: what each state accepts; only states with equal
+                        labels may be merged
+    :return list[int]: the block of every state, with the blocks of
+                       states 0 and 1 numbered 0 and 1
+    '''
+    n = len(transitions)
+    classes = len(transitions[0])
+    inverse = [[[] for _ in range(n)] for _ in range(classes)]
+    for state, row in enumerate(transitions):
+        for c, target in enumerate(row):
+            inverse[c][target].append(state)
+
+    groups = {}
+    for state, label in enumerate(labels):
+        groups.setdefault(label, set()).add(state)
+    blocks = groups.values()
+    block_of = [0] * n
+    for b, block in enumerate(blocks):
+        for state in block:
+            block_of[state] = b
+
+    pending = range(len(blocks))
+    waiting = set(pending)
+    while pending:
+        b = pending.pop()
+        waiting.discard(b)
+        splitter = set(blocks[b])
+        for c in range(classes):
+            sources = set()
+            for state in splitter:
+                sources.update(inverse[c][state])
+            touched = {}
+            for state in sources:
+                touched.setdefault(block_of[state], set()).add(state)
+            for b, inside in touched.items():
+                block = blocks[b]
+                if len(inside) == len(block):
+                    continue
+                outside = block - inside
+                blocks[b] = inside
+                blocks.append(outside)
+                new = len(blocks) - 1
+                for state in outside:
+                    block_of[state] = new
+                if b in waiting or len(outside) <= len(inside):
+                    pending.append(new)
+                    waiting.add(new)
+                else:
+                    pending.append(b)
+                    waiting.add(b)
+
+    #renumber so the dead and start states keep their numbers
+    numbers = {block_of[0]: 0}
+    numbers.setdefault(block_of[1], 1)
+    for b in block_of:
+        numbers.setdefault(b, len(numbers))
+    return [numbers[b] for b in block_of]
+
+def build_tables(rules):
+    '''Compiles token rules to the tables of a minimized DFA.
+
+    :param list[(str, str, bool)] rules: from read_spec
+    :return dict: the tables, as plain data that marshal can store
+    '''
+    nfa = NFA()
+    for index, (terminal, pattern, literal) in enumerate(rules):
+        if literal:
+            tree = literal_tree(pattern)
+        else:
+            tree = RegexParser(pattern).parse()
+        nfa.add_rule(tree, index)
+        if nfa.closure([nfa.start]) & frozenset(nfa.accepts):
+            raise ValueError("Rule %s matches the empty string" % terminal)
+
+    class_of, representatives = nfa.byte_classes()
+    transitions, accepts = subset_construction(nfa, representatives)
+    labels = [rules[a][0] if a >= 0 else None for a in accepts]
+    block_of = minimize(transitions, labels)
+
+    states = max(block_of) + 1
+    table = [None] * states
+    accepting = [None] * states
+    for state, block in enumerate(block_of):
+        table[block] = [block_of[t] for t in transitions[state]]
+        accepting[block] = labels[state]
+
+    return {'version': TABLE_VERSION,
+            'class_map': ''.join(chr(c) for c in class_of),
+            'table': table,
+            'accepting': accepting}
+
+
+class DFALexer:
+    ''' A table-driven scanner for one token spec. '''
+
+    def __init__(self, tables):
+        '''
+        :param dict tables: from build_tables
+        '''
+        self.class_map = tables['class_map']
+        self.table = tables['table']
+        self.accepting = tables['accepting']
+
+    def tokens(self, data):
+        '''Scans the input lazily.
+
+        :param data: the whole input, as a str or an mmap
+        :return generator[Token]: the tokens, in order, without the ones
+                                  of %ignore rules
+        '''
+        table = self.table
+        accepting = self.accepting
+        find = data.find
+
+        #the byte classes of the input, translated a chunk at a time
+        classes = bytearray()
+        for start in xrange(0, len(data), 1 << 16):
+            classes += data[start:start + (1 << 16)].translate(self.class_map)
+
+        end = len(classes)
+        position = 0
+        line = 1
+        line_start = 0
+
+        while position < end:
+            state = 1
+            i = position
+            match_end = position
+            terminal = None
+            while i < end:
+                state = table[state][classes[i]]
+                if not state:
+                    break
+                i += 1
+                if accepting[state] is not None:
+                    terminal = accepting[state]
+                    match_end = i
+
+            if match_end == position:
+                raise ValueError("Unexpected character %r at line %d, "
+                                 "column %d" % (data[position], line,
+                                                position - line_start + 1))
+
+            if terminal != IGNORE:
+                yield Token(terminal, data[position:match_end], line,
+                            position - line_start + 1)
+
+            newline = find('\n', position, match_end)
+            while newline != -1:
+                line += 1
+                line_start = newline + 1
+                newline = find('\n', line_start, match_end)
+
+            position = match_end
+
+def load_lexer(spec_file, cache_dir=None):
+    '''Builds the lexer of a token-spec file, or loads its tables from the
+    cache if they were built before.
+
+    :param str spec_file: the token-spec file
+    :param str cache_dir: a compile_cache directory, by default no cache
+    :return DFALexer:
+    '''
+    text = open(spec_file, 'r').read()
+    if cache_dir is None:
+        return DFALexer(build_tables(read_spec(text)))
+
+    cache = compile_cache.CompileCache(cache_dir)
+    key = hashlib.sha1('%d\0%s' % (TABLE_VERSION, text)).hexdigest()
+    data = cache.read(key, 'dfa')
+    if data is not None:
+        return DFALexer(marshal.loads(data))
+
+    tables = build_tables(read_spec(text))
+    cache.put(key, 'dfa', marshal.dumps(tables))
+    return DFALexer(tables)
+
+def spec_file_for(grammar_file):
+    ''' The token-spec file that sits next to a grammar file. '''
+    return os.path.splitext(grammar_file)[0] + '.tokens'
+
+if __name__ == '__main__':
+    import sys
+    import mmap
+
+    if len(sys.argv) != 3:
+        print __doc__.splitlines()[-1].strip()
+        exit(1)
+
+    lexer = load_lexer(sys.argv[1])
+    tables = lexer.table
+    print '%d states, %d byte classes' % (len(tables), len(tables[0]))
+    with open(sys.argv[2], 'rb') as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        for token in lexer.tokens(data):
+            print '%d:%d\t%s\t%s' % (token.line, token.column, token.terminal,
+                                     token.value)
@@ -0,0 +1,179 @@
+'''Writes parse trees (Rose_Tree) and CSTs (ProgramNode) as Graphviz DOT,
+streaming each node and edge to the file as it is reached instead of
+building a pydot graph in memory. Nodes are numbered in preorder, so the
+same tree always gets the same ids, and the tree is walked with an
+explicit stack, so any depth works.
+
+Large trees can be cut down to something Graphviz can lay out:
+
+  - max_depth: nodes at this depth are drawn without their subtrees
+  - max_nodes: after this many nodes, every subtree not yet drawn is
+    drawn as one node
+
+A collapsed subtree is drawn as a box labelled with the number of nodes
+it hides. pydot is only loaded by render, to turn a DOT file into an
+image.
+
+    python dot_writer.py SOURCE OUT.dot [--tree parse|ast|cst]
+        [--max-depth N] [--max-nodes N] [--render FORMAT]
+'''
+
+import os
+
+import backends
+
+
+def children_of(node):
+    ''' The children of a Rose_Tree or a ProgramNode. '''
+    children = node.children
+    return children() if callable(children) else children
+
+def default_label(node):
+    '''`symbol@value' for a Rose_Tree, or `symbol' when it has no value;
+    the class and the plain attributes of a ProgramNode.
+    '''
+    if hasattr(node, 'symbol'):
+        if node.value == '':
+            return str(node.symbol)
+        return '%s@%s' % (node.symbol, node.value)
+    atoms = ['%s' % value for name, value in sorted(vars(node).items())
+             if name != 'parent' and not hasattr(value, 'children')]
+    return ' '.join([node.__class__.__name__] + atoms)
+
+def quote(text):
+    ''' A DOT string literal. '''
+    return '"' + text.replace('\\', '\\\\').replace('"', '\\"') \
+                     .replace('\n', '\\n') + '"'
+
+def subtree_size(node):
+    ''' Counts the nodes under node, not counting node itself. '''
+    count = 0
+    stack = list(children_of(node))
+    while stack:
+        count += 1
+        stack.extend(children_of(stack.pop()))
+    return count
+
+def write_dot(root, out, name='Parse Tree', max_depth=None, max_nodes=None,
+              label=default_label):
+    '''Streams a tree to an open file as a DOT digraph.
+
+    :param root: the root Rose_Tree or ProgramNode
+    :param out: a file open for writing
+    :param str name: the graph's name
+    :param int max_depth: collapse the subtrees of nodes at this depth
+    :param int max_nodes: collapse the subtrees not drawn after this many
+                          nodes
+    :param label: makes the label of a node
+    :return int: the number of nodes written, collapsed ones counting once
+    '''
+    write = out.write
+    write('digraph %s {\n' % quote(name))
+    write('  node [shape=ellipse];\n')
+
+    next_id = 0
+    #(node, depth, id of its parent or None)
+    stack = [(root, 0, None)]
+    while stack:
+        node, depth, parent_id = stack.pop()
+        node_id = next_id
+        next_id += 1
+        children = children_of(node)
+
+        collapse = children and (
+            (max_depth is not None and depth >= max_depth) or
+            (max_nodes is not None and next_id >= max_nodes))
+        if collapse:
+            write('  %d [label=%s, shape=box];\n' %
+                  (node_id, quote('%s\n+%d nodes' % (label(node),
+                                                     subtree_size(node)))))
+        else:
+            write('  %d [label=%s];\n' % (node_id, quote(label(node))))
+        if parent_id is not None:
+            write('  %d -> %d;\n' % (parent_id, node_id))
+
+        if not collapse:
+            for child in reversed(children):
+                stack.append((child, depth + 1, node_id))
+
+    write('}\n')
+    return next_id
+
+def render(dot_file, image_file, format='png'):
+    '''Lays out a DOT file with Graphviz through pydot.
+
+    :param str format: any output format of Graphviz's -T option
+    '''
+    pydot = backends.load('graphviz')
+    if hasattr(pydot, 'call_graphviz'):
+        #hand Graphviz the file itself rather than parse it into pydot
+        _, stderr, process = pydot.call_graphviz(
+            'dot', ['-T' + format, os.path.abspath(dot_file),
+                    '-o', os.path.abspath(image_file)],
+            os.path.dirname(os.path.abspath(dot_file)))
+        if process.returncode != 0:
+            raise Exception("Graphviz failed on %s: %s" % (dot_file, stderr))
+        return
+    graph = pydot.graph_from_dot_file(dot_file)
+    if isinstance(graph, list):
+        graph = graph[0]
+    graph.write(image_file, format=format)
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+    import threading
+    import homework1_suite
+    import stage_trace
+
+    arg_parser = argparse.ArgumentParser(description='Draws the tree of a '
+                                         'program in the homework 1 '
+                                         'language as DOT.')
+    arg_parser.add_argument('source', help='the program')
+    arg_parser.add_argument('out', help='the DOT file to write')
+    arg_parser.add_argument('--tree', default='ast',
+                            choices=['parse', 'ast', 'cst'],
+                            help='the parse tree, the reduced AST or the '
+                                 'CST (default: ast)')
+    arg_parser.add_argument('--max-depth', type=int, default=None)
+    arg_parser.add_argument('--max-nodes', type=int, default=None)
+    arg_parser.add_argument('--render', metavar='FORMAT',
+                            help='also lay the graph out to an image in '
+                                 'this format, next to OUT')
+    args = arg_parser.parse_args()
+
+    def load_tree():
+        trace = stage_trace.Trace(quiet=True)
+        tokens = homework1_suite.lex_file(args.source, trace)
+        if args.tree == 'parse':
+            return homework1_suite.build_parser(trace).parse(tokens)[0]
+        tree = homework1_suite.parse(tokens, trace=trace)
+        if args.tree == 'cst':
+            tree, _ = homework1_suite.ast_to_cst(tree, trace=trace)
+        return tree
+
+    out = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    #the reductions recurse once per level of the tree, so large programs
+    #are reduced on a thread with a large stack
+    sys.setrecursionlimit(10 ** 6)
+    threading.stack_size(512 * 1024 * 1024)
+    trees = []
+    try:
+        thread = threading.Thread(target=lambda: trees.append(load_tree()))
+        thread.start()
+        thread.join()
+    finally:
+        sys.stdout = out
+    if not trees:
+        exit(1)
+    tree = trees[0]
+
+    with open(args.out, 'w') as f:
+        count = write_dot(tree, f, max_depth=args.max_depth,
+                          max_nodes=args.max_nodes)
+    print 'Wrote %d nodes to %s' % (count, args.out)
+    if args.render:
+        image = os.path.splitext(args.out)[0] + '.' + args.render
+        render(args.out, image, args.render)
+        print 'Rendered %s' % image
@@ -0,0 +1,244 @@
+'''Analyzes a whole directory or list of grammars in one go, for checking
+many candidate grammars for hygiene and LL(1) conflicts. A pool of
+worker processes, each with pyparsing and the grammar file parser loaded
+once, takes every grammar through:
+
+  - load: reading the productions from the file
+  - hygiene: finding the unproductive and unreachable non-terminals,
+    which cfg.Grammar drops, and the grammar that is left
+  - first_follow: nullable, FIRST and FOLLOW
+  - conflicts: the ParseTable, and its cells with more than one
+    production
+
+Each grammar gets its own JSON report, with whatever stages it got
+through and their timings, and a line on stdout as soon as it finishes,
+in the order they finish. A grammar that fails, like one whose start
+symbol is unproductive, is reported with the stage it failed in and the
+rest of the batch carries on, as is one whose worker process dies.
+
+    python grammar_batch.py [-j JOBS] [--out-dir DIR] [--strict] PATH...
+'''
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+import cfg
+import ll1_tools
+from batch_jobs import common_directory, find_sources, run_jobs, run_stage
+from cfg import EOF, EPSILON
+from grammar_minimize import build_grammar
+from parsetable import ParseTable
+
+
+def symbol_name(symbol):
+    ''' A symbol as it is written in a report. '''
+    if symbol == EOF:
+        return 'EOF'
+    if symbol == EPSILON:
+        return 'EPSILON'
+    return symbol
+
+def sets_json(sets):
+    ''' dict{str : set[str]} as sorted lists of symbol names. '''
+    return dict((non_terminal, sorted(symbol_name(s) for s in symbols))
+                for non_terminal, symbols in sets.items())
+
+def report_paths(sources, out_dir):
+    '''Where the report of each grammar goes: under out_dir at the
+    grammar's path relative to the directory all the grammars are in, with
+    .json for its extension.
+
+    :return list[str]: the reports, in the order of sources
+    :raise ValueError: if two grammars would get the same report
+    '''
+    root = common_directory(sources) if sources else None
+    paths = []
+    written = {}
+    for source in sources:
+        name = os.path.relpath(os.path.abspath(source), root)
+        path = os.path.join(out_dir, os.path.splitext(name)[0] + '.json')
+        key = os.path.realpath(path)
+        if key in written:
+            raise ValueError('%s and %s would both be reported in %s' %
+                             (written[key], source, path))
+        written[key] = source
+        paths.append(path)
+    return paths
+
+def init_worker():
+    #build the grammar file parser once per worker, not once per grammar
+    cfg.grammar_parser()
+    #ParseTable prints a warning for every grammar that is not LL(1);
+    #the reports say so instead
+    sys.stdout = open(os.devnull, 'w')
+
+def load(source):
+    '''
+    :return list[Production]: the productions of a grammar file, in order
+    '''
+    parse = cfg.grammar_parser().parseFile(source)
+    productions = [cfg.Production(p.lhs, p.rhs.asList()) for p in parse]
+    if not productions:
+        raise ValueError("No productions in " + source)
+    return productions
+
+def hygiene(record, productions):
+    '''Finds the unproductive and unreachable non-terminals, as
+    cfg.Grammar does when it reads a file, and adds them to the record.
+
+    :return Grammar: the grammar without them
+    '''
+    start = productions[0].lhs
+    record['start'] = start
+    non_terminals = set(p.lhs for p in productions)
+
+    productive = cfg.Generating(productions)
+    record['unproductive'] = sorted(non_terminals -
+                                    set(p.lhs for p in productive))
+    if start not in set(p.lhs for p in productive):
+        raise Exception("Starting production is non-generating!")
+    reachable = cfg.Reachable(productive, start)
+    record['unreachable'] = sorted(set(p.lhs for p in productive) -
+                                   set(p.lhs for p in reachable))
+
+    grammar = build_grammar(start, [(p.lhs, p.rhs) for p in reachable])
+    record['nonterminals'] = len(grammar.nonTerminals)
+    record['terminals'] = len(grammar.terminals)
+    record['productions'] = len(reachable)
+    return grammar
+
+def first_follow(record, grammar):
+    record['nullable'] = sorted(ll1_tools.nullable(grammar))
+    record['first'] = sets_json(ll1_tools.first(grammar))
+    record['follow'] = sets_json(ll1_tools.follows(grammar))
+
+def conflicts(record, grammar):
+    table = ParseTable(grammar)
+    record['ll1'] = table.isLl1
+    record['conflicts'] = [
+        {'nonterminal': non_terminal, 'terminal': symbol_name(terminal),
+         'productions': [' '.join(symbol_name(s) for s in rhs)
+                         for rhs in cell]}
+        for non_terminal in sorted(table.table)
+        for terminal, cell in sorted(table.table[non_terminal].items())
+        if len(cell) > 1]
+
+def analyze_job(job):
+    '''Analyzes one grammar in a worker and writes its report.
+
+    :param (str, str) job: the grammar file and the report to write
+    :return dict: the report
+    '''
+    source, report = job
+    record = {'file': source, 'report': report, 'status': 'ok',
+              'stage': None, 'error': None, 'timings': {}}
+    try:
+        productions = run_stage(record, 'load', load, source)
+        grammar = run_stage(record, 'hygiene', hygiene, record, productions)
+        run_stage(record, 'first_follow', first_follow, record, grammar)
+        run_stage(record, 'conflicts', conflicts, record, grammar)
+        record['stage'] = None
+    except Exception as e:
+        record['status'] = 'failed'
+        record['error'] = '%s: %s' % (type(e).__name__, e)
+    write_report(record)
+    return record
+
+def write_report(record):
+    with open(record['report'], 'w') as f:
+        json.dump(record, f, indent=2, sort_keys=True)
+
+def analyze_batch(sources, out_dir, jobs=None, report=None):
+    '''Analyzes every grammar, writing a report for each to out_dir.
+
+    :param list[str] sources: the grammar files
+    :param int jobs: worker processes, by default one per CPU
+    :param report: called with each record as its grammar finishes
+    :return list[dict]: one record per grammar, in the order of sources
+    '''
+    jobs = jobs or multiprocessing.cpu_count()
+    paths = report_paths(sources, out_dir)
+    for directory in set([out_dir] + [os.path.dirname(p) for p in paths]):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    work = zip(sources, paths)
+    #by job index, as the same file may be named differently twice
+    records = [None] * len(work)
+    for index, record in run_jobs(analyze_job, work, jobs, init_worker):
+        if record is None:
+            source, path = work[index]
+            record = {'file': source, 'report': path, 'status': 'failed',
+                      'stage': None, 'timings': {},
+                      'error': 'The worker process analyzing it died'}
+            write_report(record)
+        records[index] = record
+        if report is not None:
+            report(record)
+
+    return records
+
+def is_clean(record):
+    ''' Whether a grammar is hygienic and LL(1). '''
+    return record['status'] == 'ok' and record['ll1'] and \
+        not record['unproductive'] and not record['unreachable']
+
+def print_record(record):
+    total = sum(record['timings'].values()) * 1000
+    if record['status'] != 'ok':
+        #the stage is not known when the worker died
+        where = ' in ' + record['stage'] if record['stage'] else ''
+        print 'FAILED    %s%s: %s' % (record['file'], where,
+                                        record['error'])
+    else:
+        findings = []
+        if record['conflicts']:
+            findings.append('%d conflicts' % len(record['conflicts']))
+        for kind in ['unproductive', 'unreachable']:
+            if record[kind]:
+                findings.append('%s %s' % (kind, ' '.join(record[kind])))
+        print '%-9s %s (%.1f ms)%s' % (
+            'ok' if is_clean(record) else 'not LL(1)' if not record['ll1']
+            else 'unclean', record['file'], total,
+            ': ' + '; '.join(findings) if findings else '')
+    sys.stdout.flush()
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Checks many grammars '
+                                         'for hygiene and LL(1) conflicts '
+                                         'in parallel.')
+    arg_parser.add_argument('paths', nargs='+',
+                            help='grammar files and directories of grammars')
+    arg_parser.add_argument('-j', '--jobs', type=int, default=None,
+                            help='worker processes (default: one per CPU)')
+    arg_parser.add_argument('--extension', default='.txt',
+                            help='extension of the grammars to analyze in '
+                                 'directories (default: .txt)')
+    arg_parser.add_argument('--out-dir', default='grammar_reports',
+                            help='where to write the reports (default: '
+                                 'grammar_reports)')
+    arg_parser.add_argument('--strict', action='store_true',
+                            help='exit with status 1 unless every grammar '
+                                 'is hygienic and LL(1)')
+    args = arg_parser.parse_args()
+
+    sources = find_sources(args.paths, args.extension)
+
+    start = time.time()
+    try:
+        records = analyze_batch(sources, args.out_dir, args.jobs,
+                                print_record)
+    except ValueError as e:
+        arg_parser.error(str(e))
+    elapsed = time.time() - start
+
+    failed = len([r for r in records if r['status'] != 'ok'])
+    clean = len([r for r in records if is_clean(r)])
+    print '%d analyzed, %d failed, %d hygienic and LL(1) in %.2f s; ' \
+          'reports written to %s' % (len(records), failed, clean, elapsed,
+                                     args.out_dir)
+    exit(1 if failed or (args.strict and clean < len(records)) else 0)
@@ -0,0 +1,223 @@
+'''Merges structurally equivalent non-terminals of a cfg.Grammar. Two
+non-terminals are equivalent when they have the same right-hand sides
+once every non-terminal in them is replaced by its equivalence class.
+Such non-terminals derive the same sentences through the same shapes of
+tree, so each class can be replaced by a single representative.
+
+The classes are found by partition refinement. All the non-terminals
+start in one block, and each round splits every block by the
+right-hand sides of its members, written in block numbers, until no
+block splits. What is left is the coarsest partition that is stable, so
+every pair of non-terminals that can be merged is merged.
+
+Merging can leave a non-terminal with the same right-hand side twice, or
+with A -> A, which derives nothing new; both are dropped. The start
+symbol represents its own class, and every other class is represented
+by its alphabetically first member. Minimization keeps the mapping both
+ways, so trees parsed with the smaller grammar can be labelled with the
+original names.
+
+    python grammar_minimize.py GRAMMAR [--out FILE] [--repeat N]
+'''
+
+import os
+import sys
+import time
+
+from cfg import Grammar, EPSILON
+from parsetable import ParseTable
+
+
+def symbols_of(rhs):
+    ''' The symbols of a right-hand side, empty for epsilon. '''
+    return [s for s in rhs if s != EPSILON]
+
+def equivalence_classes(grammar):
+    '''Partitions the non-terminals of grammar into structurally
+    equivalent classes.
+
+    :param Grammar grammar: the grammar
+    :return list[list[str]]: the classes, each sorted
+    '''
+    non_terminals = sorted(grammar.nonTerminals)
+    block = dict((non_terminal, 0) for non_terminal in non_terminals)
+    count = 1
+
+    while True:
+        #a non-terminal's right-hand sides, written in block numbers;
+        #terminals are strings and blocks ints, so they cannot collide
+        signatures = {}
+        for non_terminal in non_terminals:
+            signature = frozenset(
+                tuple(block.get(s, s) for s in symbols_of(rhs))
+                for rhs in grammar.productions[non_terminal])
+            key = (block[non_terminal], signature)
+            signatures.setdefault(key, []).append(non_terminal)
+
+        if len(signatures) == count:
+            break
+        count = len(signatures)
+        for number, members in enumerate(sorted(signatures.values())):
+            for non_terminal in members:
+                block[non_terminal] = number
+
+    return sorted(signatures.values())
+
+def build_grammar(start, productions):
+    '''Builds a Grammar from its productions, without reading a file.
+
+    :param str start: the start symbol
+    :param list[(str, list[str])] productions: (lhs, rhs) pairs, an empty
+                                               rhs for epsilon
+    :return Grammar: the grammar
+    '''
+    grammar = Grammar()
+    grammar.start = start
+    for lhs, rhs in productions:
+        grammar.addProduction(lhs, list(rhs))
+    for righthandsides in grammar.productions.values():
+        for rhs in righthandsides:
+            grammar.terminals |= set(symbols_of(rhs))
+    grammar.terminals -= grammar.nonTerminals
+    return grammar
+
+
+class Minimization:
+    ''' A minimized grammar and how it maps to the original one. '''
+
+    def __init__(self, grammar):
+        '''
+        :param Grammar grammar: the grammar to minimize, left unchanged
+        '''
+        self.original = grammar
+        #original non-terminal to its representative
+        self.names = {}
+        #representative to the original non-terminals it stands for
+        self.merged = {}
+        for members in equivalence_classes(grammar):
+            representative = grammar.start if grammar.start in members \
+                             else members[0]
+            self.merged[representative] = members
+            for member in members:
+                self.names[member] = representative
+
+        productions = []
+        seen = set()
+        self.dropped = 0
+        for lhs in sorted(self.merged, key=lambda s: (s != grammar.start, s)):
+            for member in self.merged[lhs]:
+                for rhs in grammar.productions[member]:
+                    rhs = tuple(self.names.get(s, s) for s in symbols_of(rhs))
+                    if (lhs, rhs) in seen or rhs == (lhs,):
+                        self.dropped += 1
+                        continue
+                    seen.add((lhs, rhs))
+                    productions.append((lhs, rhs))
+        self.grammar = build_grammar(grammar.start, productions)
+
+    def original_names(self, symbol):
+        '''
+        :return list[str]: the original non-terminals a symbol of the
+                           minimized grammar stands for, [symbol] for a
+                           terminal
+        '''
+        return self.merged.get(symbol, [symbol])
+
+    def label(self, node):
+        '''Labels a Rose_Tree parsed with the minimized grammar by its
+        original names, for dot_writer.write_dot.
+        '''
+        symbol = '|'.join(self.original_names(node.symbol))
+        if node.value == '':
+            return symbol
+        return '%s@%s' % (symbol, node.value)
+
+    def write(self, out):
+        ''' Writes the minimized grammar in the format cfg reads. '''
+        write_grammar(self.grammar, out)
+
+def write_grammar(grammar, out):
+    ''' Writes a grammar to an open file in the format cfg reads. '''
+    for lhs in sorted(grammar.productions,
+                      key=lambda s: (s != grammar.start, s)):
+        for rhs in grammar.productions[lhs]:
+            out.write(' '.join([lhs, '->'] + symbols_of(rhs)) + '\n')
+
+def table_size(grammar):
+    '''Builds the parse table of grammar.
+
+    :return (dict, float): the table's size as 'rows', 'columns', 'cells'
+                           (non-empty ones) and 'entries', and the seconds
+                           it took to build, nullable, FIRST and FOLLOW
+                           included
+    '''
+    out = sys.stdout
+    #ParseTable prints a warning for grammars that are not LL(1)
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        start = time.time()
+        table = ParseTable(grammar).table
+        seconds = time.time() - start
+    finally:
+        sys.stdout = out
+    cells = [cell for row in table.values() for cell in row.values() if cell]
+    return {'rows': len(table),
+            'columns': len(grammar.terminals) + 1,
+            'cells': len(cells),
+            'entries': sum(len(cell) for cell in cells)}, seconds
+
+def report(minimization, repeat=5):
+    '''Compares the parse tables of the original and minimized grammars.
+
+    :param int repeat: tables to build of each, the fastest is reported
+    :return str: the report, one line per measure
+    '''
+    grammars = [minimization.original, minimization.grammar]
+    #an untimed build of each first, so neither is timed cold
+    sizes = [table_size(grammar)[0] for grammar in grammars]
+    best = [None, None]
+    for round in range(repeat):
+        #and they take turns going first
+        for i in ([0, 1] if round % 2 == 0 else [1, 0]):
+            _, seconds = table_size(grammars[i])
+            best[i] = seconds if best[i] is None else min(best[i], seconds)
+
+    before, after = sizes
+    seconds_before, seconds_after = best
+    productions_before, productions_after = [
+        sum(len(r) for r in grammar.productions.values())
+        for grammar in grammars]
+    lines = ['  %-22s %10s %10s' % ('', 'original', 'minimized'),
+             '  %-22s %10d %10d' % ('non-terminals', before['rows'],
+                                    after['rows']),
+             '  %-22s %10d %10d' % ('productions', productions_before,
+                                    productions_after)]
+    for measure in ['cells', 'entries']:
+        lines.append('  %-22s %10d %10d' % ('table ' + measure,
+                                            before[measure], after[measure]))
+    lines.append('  %-22s %10.2f %10.2f  (%.1fx)' %
+                 ('analysis (ms)', seconds_before * 1000,
+                  seconds_after * 1000, seconds_before / seconds_after))
+    merged = [members for members in minimization.merged.values()
+              if len(members) > 1]
+    for members in sorted(merged):
+        lines.append('  merged ' + ', '.join(members))
+    return '\n'.join(lines)
+
+if __name__ == '__main__':
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(description='Merges equivalent '
+                                         'non-terminals of a grammar.')
+    arg_parser.add_argument('grammar', help='the grammar file')
+    arg_parser.add_argument('--out', help='write the minimized grammar here')
+    arg_parser.add_argument('--repeat', type=int, default=5,
+                            help='tables to build of each grammar for the '
+                                 'timing (default: 5)')
+    args = arg_parser.parse_args()
+
+    minimization = Minimization(Grammar(args.grammar))
+    print report(minimization, args.repeat)
+    if args.out:
+        with open(args.out, 'w') as f:
+            minimization.write(f)
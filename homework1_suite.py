@@ -1,108 +1,343 @@
-import re
 from cfg import Grammar
 from ast_parser import Parser
 import ast_to_llvm
 import ast_reductions
+import cst_optimizer
+import lexer
+import llvm_optimizer
+import bytecode_vm
+import argparse
+import compile_cache
+import stage_trace
+import token_stream
+import tree_serialize
+import cPickle as pickle
+import os
+import shutil
 import subprocess
 import sys
+from cStringIO import StringIO
 
-var = ('var','[a-zA-Z]+')
-num = ('num','[1-9]{1}[0-9]?')
-eq = (':=',':=')
-semi = (';', ';')
-skip = ('skip', 'skip')
-if_keyword = ('if', 'if')
-fi_keyword = ('fi', 'fi')
-then_keyword = ('then', 'then')
-else_keyword = ('else', 'else')
-do_keyword = ('do','do')
-od_keyword = ('od', 'od')
-while_keyword = ('while', 'while')
-open_paren = ('(', '\(')
-close_paren = (')', '\)')
-relop = ('relop', '<=|>=|!=|=|<|>')
-bop = ('bop', '&&|\|\|')
-true = ('true', 'true')
-false = ('false', 'false')
-
-terminals = {c : re.compile(v) for c,v in [eq, semi, skip, if_keyword, fi_keyword, then_keyword, else_keyword, do_keyword, od_keyword, while_keyword, open_paren, close_paren, relop, bop, true, false, var, num]}
+#the tokens of the homework 1 language
+literals = [(':=', ':='), (';', ';'), ('(', '('), (')', ')'),
+            ('relop', '<='), ('relop', '>='), ('relop', '!='),
+            ('relop', '='), ('relop', '<'), ('relop', '>'),
+            ('bop', '&&'), ('bop', '||'),
+            ('aop', '+'), ('aop', '-'), ('aop', '*')]
+patterns = [('num', '[0-9]+')]
+identifier = ('var', '[a-zA-Z]+')
+keywords = ['skip', 'if', 'fi', 'then', 'else', 'do', 'od', 'while',
+            'true', 'false', 'not']
+
+homework1_lexer = lexer.Lexer(literals, patterns, identifier, keywords)
 
 def tokenize(string):
-    string = re.sub('\s', ',', string)
-    tokens = string.split(',')
-
-    pairs = []
-    for token in tokens:
-        for term in terminals:
-            #the first one that matches gets precedence
-            m = re.search(terminals[term], token)
-            if m:
-                pairs.append((term, token))
-                continue
-    return pairs
-
-def compile_to_llvm(file):
-    print("Opening file....")
-    string = open(file,'r').read()
-    print('Done.')
-
-    print('Lexing...')
-    tokens = tokenize(string)
-    print('Done.')
-    
-    print('Constructing parser...')
-    parser = Parser(Grammar('./testdata/homework1_grammar.txt'))
-    print('Done.')
-    
-    print('Parsing tokens...')
-    root = parser.ll1_parse(tokens)
-    print('Done.')
+    '''Lexes a program lazily.
+
+    :return generator[Token]: the tokens, which unpack as (terminal,
+                              value, line, column)
+    '''
+    return homework1_lexer.tokens(string)
+
+GRAMMAR_FILE = './testdata/homework1_grammar.txt'
+
+#every stage function records itself in the stage_trace.Trace it is
+#given, or in a new one that only prints the progress
+
+def build_parser(trace=None):
+    trace = trace or stage_trace.Trace()
+    with trace.stage('parser', 'Constructing parser'):
+        return Parser(Grammar(GRAMMAR_FILE))
+
+def parse(tokens, parser=None, trace=None):
+    '''Parses a token list and reduces the parse tree.
+
+    :param Parser parser: a parser to reuse, by default a new one is
+                          built for the homework 1 grammar
+    :param Trace trace: the trace to record the stages in
+    :return Rose_Tree: the reduced AST
+    '''
+    trace = trace or stage_trace.Trace()
+    if parser is None:
+        parser = build_parser(trace)
+
+    with trace.stage('parse', 'Parsing tokens') as record:
+        root, _ = parser.parse(tokens)
+        record['nodes'] = stage_trace.count_nodes(root)
+
+    with trace.stage('reduce_ast', 'Reducing AST') as record:
+        root = ast_reductions.reduce_ast(root)
+        record['nodes'] = stage_trace.count_nodes(root)
+
+    return root
 
-    print('Reducing AST...')
-    root = ast_reductions.reduce_ast(root)
-    print('Done.')
+def ast_to_cst(root, opt_level=0, trace=None):
+    '''Builds the CST of a reduced AST.
 
-    print('Constructing CST...')
-    cst = ast_to_llvm.ast_to_cst(root)
-    print('Done.')
+    :return (ProgramNode, list[str]): the (optimized, if opt_level > 0)
+                                      CST and the variables the original
+                                      program assigns
+    '''
+    trace = trace or stage_trace.Trace()
+    with trace.stage('ast_to_cst', 'Constructing CST') as record:
+        cst = ast_to_llvm.ast_to_cst(root)
+        variables = ast_to_llvm.assigned_variables(cst)
+        record['nodes'] = stage_trace.count_nodes(cst)
 
-    print('Constructing LLVM code...')
-    llvm_code = ast_to_llvm.reduce_cst_to_llvm(cst)
-    llvm_code.verify()
-    print('Done.')
+    if opt_level > 0:
+        with trace.stage('optimize_cst', 'Optimizing CST') as record:
+            cst = cst_optimizer.optimize_cst(cst)
+            record['nodes'] = stage_trace.count_nodes(cst)
 
-    print 
-    print
-    print('****LLVM Code:*****')
-    print llvm_code
-    print
+    return cst, variables
+
+def read_source(file, trace=None):
+    trace = trace or stage_trace.Trace()
+    with trace.stage('read', 'Opening file.') as record:
+        string = open(file,'r').read()
+        record['bytes'] = len(string)
+    return string
+
+def lex(string, trace=None):
+    '''Lexes a whole program up front, so lexing is timed on its own.
+
+    :return TokenStream: the tokens
+    '''
+    trace = trace or stage_trace.Trace()
+    with trace.stage('lex', 'Lexing') as record:
+        tokens = token_stream.from_lexer(homework1_lexer, string)
+        record['tokens'] = len(tokens)
+        record['token_bytes'] = tokens.nbytes()
+    return tokens
+
+def lex_file(file, trace=None):
+    '''Lexes a source file, or maps a token file written by token_stream
+    instead of lexing again.
+
+    :return TokenStream: the tokens
+    '''
+    trace = trace or stage_trace.Trace()
+    if not token_stream.is_token_file(file):
+        return lex(read_source(file, trace), trace)
+    with trace.stage('read', 'Mapping token file.') as record:
+        tokens = token_stream.read(file)
+        record['tokens'] = len(tokens)
+    return tokens
+
+def compile_to_cst(file, opt_level=0, trace=None):
+    '''Runs the front end over a source or token file. See ast_to_cst.'''
+    trace = trace or stage_trace.Trace()
+    tokens = lex_file(file, trace)
+    root = parse(tokens, trace=trace)
+    tokens.close()
+    return ast_to_cst(root, opt_level, trace)
+
+def cst_to_llvm(cst, variables, opt_level=0, instrument=False, trace=None):
+    '''Generates, verifies and optimizes the LLVM module of a CST. With
+    instrument set, the program prints a block profile at exit.'''
+    trace = trace or stage_trace.Trace()
+    with trace.stage('codegen', 'Constructing LLVM code') as record:
+        llvm_code = ast_to_llvm.reduce_cst_to_llvm(cst, variables, instrument)
+        record['instructions'] = stage_trace.count_instructions(llvm_code)
+
+    with trace.stage('verify'):
+        llvm_code.verify()
+
+    if opt_level > 0:
+        with trace.stage('optimize', 'Optimizing at -O{}'.format(opt_level))\
+                as record:
+            timings = llvm_optimizer.optimize(llvm_code, opt_level)
+            llvm_code.verify()
+            record['passes'] = timings
+            record['instructions'] = stage_trace.count_instructions(llvm_code)
+            trace.say(llvm_optimizer.format_timings(timings))
 
     return llvm_code
 
+def compile_to_llvm(file, opt_level=0, instrument=False, trace=None):
+    trace = trace or stage_trace.Trace()
+    cst, variables = compile_to_cst(file, opt_level, trace)
+    llvm_code = cst_to_llvm(cst, variables, opt_level, instrument, trace)
 
-def llvm_to_native(name, llvm):
-    print('Constructing native code...')
-    obj = name + '.o'
-    dst = name
+    trace.say('')
+    trace.say('')
+    trace.say('****LLVM Code:*****')
+    trace.say(str(llvm_code))
+    trace.say('')
 
-    print("* Compiling to `{}'.".format(dst))
-    
-    with open(obj, 'wb') as f:
-        llvm.to_native_object(f)
-    
+    return llvm_code
+
+
+def llvm_to_object(obj, llvm, trace=None):
+    trace = trace or stage_trace.Trace()
+    with trace.stage('object') as record:
+        with open(obj, 'wb') as f:
+            llvm.to_native_object(f)
+        record['bytes'] = os.path.getsize(obj)
+
+def link(obj, dst, trace=None):
+    trace = trace or stage_trace.Trace()
     cmd = ['cc', '-o', dst, obj]
-    r = subprocess.call(cmd)
+    with trace.stage('link'):
+        r = subprocess.call(cmd)
     if r != 0:
         raise Exception("Failed to link with " + str(cmd))
+
+def binary_name(file):
+    '''The name of the executable built from a source file: the file name
+    without its extension, so that linking never overwrites the source.
+    '''
+    name = os.path.splitext(file)[0]
+    if name == file:
+        name += '.out'
+    return name
+
+def llvm_to_native(name, llvm, trace=None):
+    trace = trace or stage_trace.Trace()
+    trace.say('Constructing native code...')
+    obj = name + '.o'
+    dst = name
+
+    trace.say("* Compiling to `{}'.".format(dst))
+    
+    llvm_to_object(obj, llvm, trace)
+    link(obj, dst, trace)
     
-    print('Done.')
+    trace.say('Done.')
+
+def compile_with_cache(file, cache, opt_level=0, instrument=False,
+                       trace=None):
+    '''Compiles a file to a native executable next to it (see
+    binary_name), like compile_to_llvm followed by llvm_to_native, but
+    resumes from the deepest artifact of this source, grammar and
+    options found in the cache, and stores every artifact it has to
+    produce.
+
+    :param str file: a source file, or a token file written by
+                     token_stream, which is keyed by its bytes and mapped
+                     rather than lexed
+    :param CompileCache cache: the cache to use
+    '''
+    trace = trace or stage_trace.Trace()
+    source = read_source(file, trace)
+    grammar = open(GRAMMAR_FILE, 'r').read()
+    keys = compile_cache.stage_keys(source, grammar,
+                                    {'opt_level': opt_level,
+                                     'instrument': instrument})
+    binary = binary_name(file)
+    obj = binary + '.o'
+
+    cached = [stage for stage in compile_cache.STAGES
+              if cache.get(keys[stage], stage) is not None]
+    deepest = cached[-1] if cached else None
+    trace.say('Cache: resuming after stage `{}\'.'.format(deepest))
+
+    if deepest == 'binary':
+        shutil.copy(cache.get(keys['binary'], 'binary'), binary)
+        return
+
+    if deepest == 'object':
+        shutil.copy(cache.get(keys['object'], 'object'), obj)
+    else:
+        if deepest == 'bitcode':
+            from llvm.core import Module
+            bitcode = cache.read(keys['bitcode'], 'bitcode')
+            llvm_code = Module.from_bitcode(StringIO(bitcode))
+        else:
+            if deepest == 'ast':
+                root = tree_serialize.loads(cache.read(keys['ast'], 'ast'))
+            else:
+                if deepest == 'tokens':
+                    tokens = pickle.loads(cache.read(keys['tokens'],
+                                                     'tokens'))
+                elif token_stream.is_token_file(file):
+                    #already the tokens, and quicker to map than unpickle
+                    tokens = lex_file(file, trace)
+                else:
+                    tokens = lex(source, trace)
+                    cache.put(keys['tokens'], 'tokens',
+                              pickle.dumps(tokens, pickle.HIGHEST_PROTOCOL))
+
+                root = parse(tokens, trace=trace)
+                tokens.close()
+                cache.put(keys['ast'], 'ast', tree_serialize.dumps(root))
+
+            cst, variables = ast_to_cst(root, opt_level, trace)
+            llvm_code = cst_to_llvm(cst, variables, opt_level, instrument,
+                                    trace)
+            bitcode = StringIO()
+            llvm_code.to_bitcode(bitcode)
+            cache.put(keys['bitcode'], 'bitcode', bitcode.getvalue())
+
+        llvm_to_object(obj, llvm_code, trace)
+        cache.put(keys['object'], 'object', open(obj, 'rb').read())
+
+    link(obj, binary, trace)
+    cache.put(keys['binary'], 'binary', open(binary, 'rb').read())
 
 
 if __name__ == '__main__':
-    if len(sys.argv) != 2:
-        print "Script file takes the file to parse, exiting..."
-        exit(1)
+    arg_parser = argparse.ArgumentParser(description='Compiles a program in '
+                                         'the homework 1 language to a '
+                                         'native executable.')
+    arg_parser.add_argument('file', help='the file to compile')
+    arg_parser.add_argument('-O', dest='opt_level', type=int, default=0,
+                            choices=sorted(llvm_optimizer.OPT_LEVELS),
+                            help='LLVM optimization level (default: 0)')
+    mode = arg_parser.add_mutually_exclusive_group()
+    mode.add_argument('--jit', action='store_true',
+                      help='run the program in-process instead of '
+                           'linking a native executable')
+    mode.add_argument('--vm', action='store_true',
+                      help='run the program on the bytecode VM, which '
+                           'does not need llvmpy')
+    arg_parser.add_argument('--instrument', action='store_true',
+                            help='count how often each block runs and '
+                                 'print a block profile at exit')
+    arg_parser.add_argument('--cache-dir',
+                            help='reuse and store intermediate artifacts in '
+                                 'this directory')
+    arg_parser.add_argument('--cache-size', type=int, default=256,
+                            help='size limit of the cache in MB '
+                                 '(default: 256)')
+    arg_parser.add_argument('--quiet', action='store_true',
+                            help='do not print progress, only results')
+    arg_parser.add_argument('--trace', metavar='FILE',
+                            help='write the time, memory and size of every '
+                                 'stage to FILE as JSON')
+    args = arg_parser.parse_args()
+
+    trace = stage_trace.Trace(quiet=args.quiet)
+    results_out = sys.stdout
+    if args.quiet:
+        #the parser's own warnings are progress output too
+        sys.stdout = open(os.devnull, 'w')
+
+    if args.vm:
+        cst, variables = compile_to_cst(args.file, args.opt_level, trace)
+        with trace.stage('vm', 'Running on the bytecode VM'):
+            results = bytecode_vm.run(bytecode_vm.compile_cst(cst, variables))
+        results_out.write(bytecode_vm.format_results(results))
+
+    elif args.cache_dir and not args.jit:
+        cache = compile_cache.CompileCache(args.cache_dir,
+                                           args.cache_size * 1024 * 1024)
+        compile_with_cache(args.file, cache, args.opt_level,
+                           args.instrument, trace)
+
+    else:
+        llvm_code = compile_to_llvm(args.file, args.opt_level,
+                                    args.instrument, trace)
+        if args.jit:
+            import llvm_jit
+            with trace.stage('jit', 'Running with the JIT'):
+                exit_code, results = llvm_jit.JitRunner().run(llvm_code)
+            for var in sorted(results):
+                results_out.write('Global variable {} = {}\n'.format(
+                    var, results[var]))
+        else:
+            llvm_to_native(binary_name(args.file), llvm_code, trace)
 
-    file_name = sys.argv[1]
-    llvm_code = compile_to_llvm(file_name)
-    llvm_to_native(file_name, llvm_code)
+    if args.trace:
+        trace.write(args.trace)
+        trace.say('Trace written to {}.'.format(args.trace))
@@ -0,0 +1,103 @@
+'''A single-pass lexer built from one anchored master regular expression.
+
+Every token rule becomes a named group of one alternation, which is
+matched at the current position only, so the input is scanned once from
+left to right and each token costs one regex match whatever the number
+of rules. The matching rules are:
+
+  - literal rules are tried longest first, so `:=' wins over `=' and
+    `<=' over `<'
+  - pattern rules are tried after the literals, in the order given
+  - a word matched by the identifier rule is looked up in the keyword
+    table, so `if' is a keyword but `iff' and `ifx' are identifiers
+'''
+
+import re
+from collections import namedtuple
+
+Token = namedtuple('Token', ['terminal', 'value', 'line', 'column'])
+
+
+class Lexer:
+    ''' A lexer for one set of token rules. '''
+
+    def __init__(self, literals, patterns, identifier=None, keywords=(),
+                 skip=r'\s+'):
+        '''
+        :param list[(str, str)] literals: (terminal, text) pairs for tokens
+                                          that are fixed strings
+        :param list[(str, str)] patterns: (terminal, regex) pairs for the
+                                          other tokens
+        :param (str, str) identifier: the (terminal, regex) of identifiers,
+                                      which keywords are carved out of
+        :param keywords: the reserved words; each one is its own terminal
+        :param str skip: the regex of text between tokens
+        '''
+        self.keywords = dict((word, word) for word in keywords)
+
+        #group names have to be identifiers, so the groups are numbered
+        #and mapped back to their terminal
+        rules = [('skip', None, skip)]
+        for terminal, text in sorted(literals, key=lambda r: -len(r[1])):
+            rules.append(('literal', terminal, re.escape(text)))
+        if identifier is not None:
+            rules.append(('identifier', identifier[0], identifier[1]))
+        for terminal, pattern in patterns:
+            rules.append(('pattern', terminal, pattern))
+
+        self.rules = {}
+        groups = []
+        for n, (kind, terminal, pattern) in enumerate(rules):
+            name = 'g%d' % n
+            self.rules[name] = (kind, terminal)
+            groups.append('(?P<%s>%s)' % (name, pattern))
+        self.pattern = re.compile('|'.join(groups))
+
+    def tokens(self, text):
+        '''Scans text lazily.
+
+        :param str text: the whole input
+        :return generator[Token]: the tokens, in order
+        '''
+        for terminal, start, end, line, line_start in self.spans(text):
+            yield Token(terminal, text[start:end], line, start - line_start + 1)
+
+    def spans(self, text):
+        '''Scans text lazily, without copying out the tokens' values.
+
+        :param str text: the whole input
+        :return generator[(str, int, int, int, int)]: (terminal, start, end,
+                                                      line, offset of the
+                                                      line) of each token
+        '''
+        match = self.pattern.match
+        rules = self.rules
+        keywords = self.keywords
+
+        position = 0
+        line = 1
+        line_start = 0
+        end = len(text)
+
+        while position < end:
+            m = match(text, position)
+            if m is None or m.end() == position:
+                raise ValueError("Unexpected character %r at line %d, "
+                                 "column %d" % (text[position], line,
+                                                position - line_start + 1))
+
+            kind, terminal = rules[m.lastgroup]
+            next_position = m.end()
+
+            if kind == 'skip':
+                newlines = text.count('\n', position, next_position)
+                if newlines:
+                    line += newlines
+                    line_start = text.rfind('\n', position,
+                                            next_position) + 1
+            else:
+                if kind == 'identifier':
+                    terminal = keywords.get(m.group(), terminal)
+                yield terminal, position, next_position, line, line_start
+
+            position = next_position
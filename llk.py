@@ -0,0 +1,378 @@
+'''LL(k) analysis and parsing for grammars that need more than one token of
+lookahead. FIRST_k and FOLLOW_k are computed as sets of terminal
+sequences of at most k terminals, truncated, as tuples. Every distinct
+sequence is interned, so equal sequences share one tuple across all the
+sets. A sequence shorter than k ends in EOF, or is all a nullable
+non-terminal's FIRST_k can add.
+
+The table is the strong LL(k) table: a production A -> alpha is chosen
+on the lookaheads in FIRST_k(alpha FOLLOW_k(A)). Each non-terminal's
+lookaheads are stored as a trie, keyed by one terminal per level, and a
+branch stops as soon as only one production is left under it. The
+driver walks the trie as it peeks at tokens, so most decisions look at
+one token and only the cells that need k tokens peek that far. A branch
+cut short this way no longer checks the rest of its lookahead; a wrong
+token is then found when it fails to match, one step later.
+
+A leaf is the list of productions it chooses between, like a ParseTable
+cell. When the grammar is not LL(k) a leaf can hold several, and the
+parser takes the first, as Parser does.
+
+    python llk.py GRAMMAR [--k N] [--max-k N] [--table]
+'''
+
+import os
+import sys
+
+from ast_parser import Rose_Tree, describe_token
+from cfg import Grammar, EOF, EPSILON
+
+
+def symbols_of(rhs):
+    ''' The symbols of a right-hand side, empty for epsilon. '''
+    return [s for s in rhs if s != EPSILON]
+
+def concat(left, right, k, interned):
+    '''The k-truncated concatenation of two sets of sequences.
+
+    :param set[tuple] left: sequences of up to k terminals
+    :param set[tuple] right: the sequences that can follow them
+    :param dict interned: sequence to its one shared tuple
+    :return set[tuple]: every x + y for x in left and y in right, cut to
+                        its first k terminals
+    '''
+    result = set()
+    for x in left:
+        if len(x) >= k or (x and x[-1] == EOF):
+            result.add(x)
+            continue
+        for y in right:
+            sequence = (x + y)[:k]
+            result.add(interned.setdefault(sequence, sequence))
+    return result
+
+def first_of(symbols, first, terminals, k, interned):
+    '''
+    :param list[str] symbols: a sentential form
+    :param dict{str : set[tuple]} first: FIRST_k of every non-terminal
+    :return set[tuple]: FIRST_k of the symbols, {()} when they are empty
+    '''
+    result = set([()])
+    for symbol in symbols:
+        if symbol in terminals:
+            sequence = interned.setdefault((symbol,), (symbol,))
+            result = concat(result, set([sequence]), k, interned)
+        else:
+            result = concat(result, first[symbol], k, interned)
+        if all(len(x) >= k for x in result):
+            break
+    return result
+
+def first_k(grammar, k, interned=None):
+    '''Computes FIRST_k of every non-terminal, by a fixpoint in which the
+    sets only grow.
+
+    :param dict interned: the intern table to share, a new one by default
+    :return dict{str : set[tuple]}: non-terminal to its FIRST_k
+    '''
+    if interned is None:
+        interned = {}
+    first = dict((non_terminal, set())
+                 for non_terminal in grammar.nonTerminals)
+    changed = True
+    while changed:
+        changed = False
+        for lhs, righthandsides in grammar.productions.items():
+            for rhs in righthandsides:
+                sequences = first_of(symbols_of(rhs), first,
+                                     grammar.terminals, k, interned)
+                if not sequences <= first[lhs]:
+                    first[lhs] |= sequences
+                    changed = True
+    return first
+
+def follow_k(grammar, k, first, interned=None):
+    '''Computes FOLLOW_k of every non-terminal. The start symbol is
+    followed by EOF.
+
+    :param dict first: FIRST_k, from first_k
+    :return dict{str : set[tuple]}: non-terminal to its FOLLOW_k
+    '''
+    if interned is None:
+        interned = {}
+    terminals = grammar.terminals
+    follow = dict((non_terminal, set())
+                  for non_terminal in grammar.nonTerminals)
+    follow[grammar.start].add(interned.setdefault((EOF,), (EOF,)))
+
+    #(lhs, non-terminal, FIRST_k of what follows it in the production);
+    #FIRST_k is final, so these are worked out once
+    occurrences = []
+    for lhs, righthandsides in grammar.productions.items():
+        for rhs in righthandsides:
+            symbols = symbols_of(rhs)
+            for i, symbol in enumerate(symbols):
+                if symbol not in terminals:
+                    occurrences.append((lhs, symbol,
+                                        first_of(symbols[i + 1:], first,
+                                                 terminals, k, interned)))
+
+    changed = True
+    while changed:
+        changed = False
+        for lhs, symbol, rest in occurrences:
+            sequences = concat(rest, follow[lhs], k, interned)
+            if not sequences <= follow[symbol]:
+                follow[symbol] |= sequences
+                changed = True
+    return follow
+
+
+class LLkTable:
+    ''' The strong LL(k) table of a grammar, a lookahead trie per row. '''
+
+    def __init__(self, grammar, k=2):
+        self.grammar = grammar
+        self.k = k
+        #sequence to its one shared tuple
+        self.interned = {}
+        self.first = first_k(grammar, k, self.interned)
+        self.follow = follow_k(grammar, k, self.first, self.interned)
+        #(non-terminal, lookahead, [productions]) of every leaf that has
+        #more than one production
+        self.conflicts = []
+        #one leaf list per production, shared by every leaf choosing it
+        self.leaves = {}
+        self.tries = {}
+
+        for lhs in grammar.nonTerminals:
+            lookaheads = []
+            for rhs in grammar.productions[lhs]:
+                sequences = concat(
+                    first_of(symbols_of(rhs), self.first, grammar.terminals,
+                             k, self.interned),
+                    self.follow[lhs], k, self.interned)
+                for sequence in sorted(sequences):
+                    lookaheads.append((sequence, rhs))
+            self.tries[lhs] = self.build(lhs, lookaheads, 0, ())
+
+        self.isLlk = not self.conflicts
+        if not self.isLlk:
+            print "Warning, grammar is not LL(%d) table was constructed "\
+                  "anyway." % k
+
+    def build(self, lhs, lookaheads, depth, prefix):
+        '''Builds the trie of the lookaheads that start with prefix.
+
+        :param list[(tuple, list[str])] lookaheads: (sequence, production)
+                                                    pairs, in the order of
+                                                    the grammar
+        :return dict or list: a dict from the next terminal to a subtrie,
+                              or a leaf
+        '''
+        productions = []
+        for _, rhs in lookaheads:
+            if rhs not in productions:
+                productions.append(rhs)
+        if len(productions) == 1:
+            return self.leaf(productions[0])
+
+        if depth == self.k or any(len(sequence) == depth
+                                  for sequence, _ in lookaheads):
+            self.conflicts.append((lhs, prefix, productions))
+            return productions
+
+        branches = {}
+        for sequence, rhs in lookaheads:
+            branches.setdefault(sequence[depth], []).append((sequence, rhs))
+        return dict((terminal, self.build(lhs, branch, depth + 1,
+                                          prefix + (terminal,)))
+                    for terminal, branch in branches.items())
+
+    def leaf(self, rhs):
+        key = id(rhs)
+        if key not in self.leaves:
+            self.leaves[key] = [rhs]
+        return self.leaves[key]
+
+    def cells(self):
+        '''
+        :return generator[(str, tuple, list)]: (non-terminal, lookahead,
+                                               productions) for every leaf,
+                                               the lookahead only as long as
+                                               the trie looks
+        '''
+        for lhs in sorted(self.tries):
+            stack = [((), self.tries[lhs])]
+            while stack:
+                prefix, node = stack.pop()
+                if node.__class__ is dict:
+                    for terminal in sorted(node, reverse=True):
+                        stack.append((prefix + (terminal,), node[terminal]))
+                else:
+                    yield lhs, prefix, node
+
+    def size(self):
+        '''
+        :return dict: the number of trie 'nodes' (inner ones), 'cells'
+                      (leaves), 'sequences' interned, and 'depths', the
+                      number of cells deciding after 0, 1, ... k tokens
+        '''
+        nodes = 0
+        depths = [0] * (self.k + 1)
+        for lhs, prefix, _ in self.cells():
+            depths[len(prefix)] += 1
+        for trie in self.tries.values():
+            stack = [trie]
+            while stack:
+                node = stack.pop()
+                if node.__class__ is dict:
+                    nodes += 1
+                    stack.extend(node.values())
+        return {'nodes': nodes, 'cells': sum(depths),
+                'sequences': len(self.interned), 'depths': depths}
+
+    def __str__(self):
+        """ Output to CSV format, a row per leaf. """
+        ret = "non-terminal,lookahead,productions\n"
+        for lhs, prefix, productions in self.cells():
+            lookahead = ' '.join('EOF' if t == EOF else t for t in prefix)
+            ret += lhs + ',' + lookahead + ',' + \
+                   str(productions).replace(',', ' ') + '\n'
+        return ret
+
+
+class LLkParser:
+    '''
+    An LL(k) parser with the same interface as ast_parser.Parser
+    '''
+
+    def __init__(self, grammar, k=2):
+        self.grammar = grammar
+        self.k = k
+        self.table = LLkTable(grammar, k)
+
+    def parse(self, tokens):
+        '''
+        Parses a sequence of tokens from the start symbol, peeking at as
+        many tokens as the lookahead trie of each non-terminal needs.
+
+        :param tokens: an iterable of tokens, see Parser.parse
+        :return: RoseTree, [tokens]: the parse tree and the unconsumed
+                                     tokens
+        '''
+        tries = self.table.tries
+        terminals = self.grammar.terminals
+        tokens = iter(tokens)
+        #the next token, None for EOF, and its terminal
+        lookahead = next(tokens, None)
+        token = EOF if lookahead is None else lookahead[0]
+        #the tokens peeked at past lookahead, None for EOF
+        peeked = []
+
+        root = Rose_Tree(self.grammar.start, "")
+        #nodes still to be parsed, the next one on top
+        stack = [root]
+
+        while stack:
+            node = stack.pop()
+            current_symbol = node.symbol
+
+            if current_symbol in terminals:
+                if token != current_symbol:
+                    raise ValueError("Expected " + str(current_symbol) +
+                                     ", found " + describe_token(lookahead) +
+                                     ".", str([n.symbol for n in stack[::-1]]))
+                node.value = lookahead[1]
+                lookahead = peeked.pop(0) if peeked else next(tokens, None)
+                token = EOF if lookahead is None else lookahead[0]
+                continue
+
+            #walk the trie down, one token per level; most of them decide
+            #on the first
+            choice = tries[current_symbol]
+            if choice.__class__ is dict:
+                choice = choice.get(token)
+                depth = 0
+                found = lookahead
+                while choice.__class__ is dict:
+                    if depth == len(peeked):
+                        peeked.append(next(tokens, None))
+                    found = peeked[depth]
+                    choice = choice.get(EOF if found is None else found[0])
+                    depth += 1
+
+                if not choice:
+                    raise ValueError("Unexpected terminal, " +
+                                     describe_token(found) + ", found.",
+                                     str([n.symbol for n in stack[::-1]]))
+
+            for symbol in choice[0]:
+                if symbol == EPSILON:
+                    continue
+                child = Rose_Tree(symbol, "")
+                child.parent = node
+                node.children.append(child)
+
+            stack.extend(node.children[::-1])
+
+        leftover = [] if lookahead is None else [lookahead]
+        leftover.extend(peek for peek in peeked if peek is not None)
+        leftover.extend(tokens)
+        return root, leftover
+
+def smallest_k(grammar, max_k=3):
+    '''
+    :return (int, LLkTable): the smallest k up to max_k for which grammar
+                             is LL(k) and its table, or (None, the table
+                             for max_k)
+    '''
+    out = sys.stdout
+    #the tables warn about every k that does not work
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        for k in range(1, max_k + 1):
+            table = LLkTable(grammar, k)
+            if table.isLlk:
+                return k, table
+    finally:
+        sys.stdout = out
+    return None, table
+
+if __name__ == '__main__':
+    import argparse
+
+    arg_parser = argparse.ArgumentParser(description='Builds the LL(k) '
+                                         'table of a grammar.')
+    arg_parser.add_argument('grammar', help='the grammar file')
+    arg_parser.add_argument('--k', type=int, default=None,
+                            help='build the table for this k (default: the '
+                                 'smallest that works)')
+    arg_parser.add_argument('--max-k', type=int, default=3,
+                            help='the largest k to try (default: 3)')
+    arg_parser.add_argument('--table', action='store_true',
+                            help='print the table as CSV')
+    args = arg_parser.parse_args()
+
+    grammar = Grammar(args.grammar)
+    if args.k is not None:
+        k, table = args.k, LLkTable(grammar, args.k)
+    else:
+        k, table = smallest_k(grammar, args.max_k)
+        if k is None:
+            print 'Not LL(k) for any k up to %d.' % args.max_k
+            k = args.max_k
+        else:
+            print 'LL(%d)' % k
+
+    size = table.size()
+    print '%d trie nodes, %d cells, %d interned sequences' % \
+        (size['nodes'], size['cells'], size['sequences'])
+    print 'cells deciding after 0..%d tokens: %s' % \
+        (k, ' '.join(str(n) for n in size['depths']))
+    for lhs, prefix, productions in table.conflicts:
+        print 'conflict %s on %s: %s' % (
+            lhs, ' '.join('EOF' if t == EOF else t for t in prefix),
+            productions)
+    if args.table:
+        print table
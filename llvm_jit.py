@@ -0,0 +1,98 @@
+'''In-process execution of the modules built by
+ast_to_llvm.reduce_cst_to_llvm, as an alternative to writing an object
+file, linking it with `cc' and running the binary.
+
+A JitRunner owns one LLVM execution engine for its whole lifetime. Each
+program's module is added to the engine, its `main' is run, and the
+module is removed again, so running many small programs does not pay for
+creating an engine each time.
+'''
+
+import ctypes
+import os
+import re
+import sys
+import tempfile
+import threading
+
+from llvm.core import Module
+from llvm.ee import EngineBuilder
+
+#matches the lines printed by ast_to_llvm.build_exit
+RESULT_LINE = re.compile(r'^Global variable (\S+) = (-?\d+)$', re.MULTILINE)
+
+_libc = ctypes.CDLL(None)
+
+#redirecting file descriptor 1 affects the whole process, so only one
+#program may have its output captured at a time
+_stdout_lock = threading.Lock()
+
+def parse_results(output):
+    '''Turns the variable dump printed at the end of a program into a
+    dictionary of variable name to value.
+
+    :param str output: everything the program wrote to stdout
+    :return dict{str : int}: the final value of every variable
+    '''
+    return dict((name, int(value))
+                for name, value in RESULT_LINE.findall(output))
+
+def capture_stdout(function, *args):
+    '''Calls the function with file descriptor 1 pointed at a temporary
+    file, so that output written by native code (printf) is captured as
+    well as output written by Python.
+
+    :return (object, str): the function's return value and its output
+    '''
+    with _stdout_lock:
+        sys.stdout.flush()
+        _libc.fflush(None)
+
+        saved_stdout = os.dup(1)
+        with tempfile.TemporaryFile() as output:
+            os.dup2(output.fileno(), 1)
+            try:
+                result = function(*args)
+                _libc.fflush(None)
+            finally:
+                os.dup2(saved_stdout, 1)
+                os.close(saved_stdout)
+
+            output.seek(0)
+            return result, output.read()
+
+class JitRunner:
+    '''Compiles and runs modules in this process with a reusable
+    execution engine.
+    '''
+
+    def __init__(self, opt_level=2):
+        '''
+        :param int opt_level: the code generator optimization level used
+                              by the engine when it emits machine code
+        '''
+        #the engine has to be created around a module; an empty one
+        #stays loaded for the engine's lifetime so that programs can be
+        #added and removed freely
+        self.base_module = Module.new('jit')
+        self.engine = EngineBuilder.new(self.base_module)\
+                                   .opt(opt_level).create()
+
+    def run(self, llvm_module):
+        '''Runs the `main' function of a module and collects the values
+        it printed for its variables.
+
+        :param llvm_module: a Module built by reduce_cst_to_llvm
+        :return (int, dict{str : int}): main's exit code and the final
+                                        value of every variable
+        '''
+        f_main = llvm_module.get_function_named('main')
+
+        self.engine.add_module(llvm_module)
+        try:
+            exit_code, output = capture_stdout(self.engine.run_function,
+                                               f_main, [])
+        finally:
+            self.engine.remove_module(llvm_module)
+
+        return exit_code.as_int(), parse_results(output)
@@ -0,0 +1,98 @@
+'''Optimization stage for the LLVM modules produced by
+ast_to_llvm.reduce_cst_to_llvm. A pipeline is a list of LLVM pass names
+that is run over the module one pass at a time, so the cost of each pass
+can be reported next to the code it produced.
+
+The presets mirror the usual -O levels:
+
+  O0 - no optimization, the module is left as generated
+  O1 - promote variables to registers and clean up the result
+  O2 - O1 plus redundancy elimination and the loop passes
+  O3 - O2 plus loop unrolling and a second round of cleanups
+'''
+
+import time
+
+O1_PASSES = ['mem2reg',
+             'instcombine',
+             'simplifycfg']
+
+O2_PASSES = ['mem2reg',
+             'instcombine',
+             'reassociate',
+             'gvn',
+             'sccp',
+             'simplifycfg',
+             'loop-simplify',
+             'loop-rotate',
+             'licm',
+             'indvars',
+             'loop-deletion',
+             'instcombine',
+             'dce',
+             'simplifycfg']
+
+O3_PASSES = O2_PASSES + ['loop-unroll',
+                         'jump-threading',
+                         'correlated-propagation',
+                         'gvn',
+                         'dse',
+                         'instcombine',
+                         'adce',
+                         'simplifycfg']
+
+OPT_LEVELS = {0: [],
+              1: O1_PASSES,
+              2: O2_PASSES,
+              3: O3_PASSES}
+
+def passes_for_level(level):
+    '''Returns the list of pass names for an -O level.
+
+    :param int level: an optimization level between 0 and 3
+    :return list[str]: the pass names, in the order they run
+    '''
+    if level not in OPT_LEVELS:
+        raise ValueError("Unknown optimization level: " + str(level))
+    return OPT_LEVELS[level]
+
+def optimize(llvm_module, level=2, passes=None):
+    '''Runs an optimization pipeline over a module in place.
+
+    Each pass runs in its own PassManager so that it can be timed on its
+    own; the result is the same as running them back to back in one.
+
+    :param llvm_module: the Module to optimize
+    :param int level: the -O preset to use when passes is not given
+    :param list[str] passes: an explicit pipeline of pass names
+    :return list[(str, float)]: the wall time of every pass run, in
+                                seconds, in pipeline order
+    '''
+    #imported here so the presets can be looked at without llvmpy
+    from llvm.passes import PassManager
+
+    if passes is None:
+        passes = passes_for_level(level)
+
+    timings = []
+    for name in passes:
+        pm = PassManager.new()
+        pm.add(name)
+
+        start = time.time()
+        pm.run(llvm_module)
+        timings.append((name, time.time() - start))
+
+    return timings
+
+def format_timings(timings):
+    '''Formats the result of optimize() as a table, one pass per line,
+    followed by the total.
+    '''
+    lines = []
+    total = 0.0
+    for name, seconds in timings:
+        lines.append('  %-24s %9.3f ms' % (name, seconds * 1000))
+        total += seconds
+    lines.append('  %-24s %9.3f ms' % ('total', total * 1000))
+    return '\n'.join(lines)
@@ -0,0 +1,203 @@
+'''Instrumentation for the LL(1) parser. Pass a ParseTrace to
+Parser.parse and the parse reports to it:
+
+  - lookups of every (non-terminal, terminal) cell of the parse table
+  - productions expanded, and how many of them were epsilon
+  - terminals matched and the deepest the parse stack got
+  - sampled time per non-terminal: every sample_every-th expansion is
+    timed until its subtree is parsed, counting only the outermost of
+    nested samples of a non-terminal
+  - the error, and the stack it was raised with, when the parse fails
+
+Without a trace, Parser.parse skips the hooks, at the cost of a test
+of one local per step. Subclass ParseTrace and override its hooks to record
+something else. The counts can be written out as JSON:
+
+    {"tokens": 52, "expansions": 140, "epsilon_expansions": 31,
+     "max_depth": 17, "lookups": [{"nonterminal": "S", "terminal": "var",
+     "count": 9}, ...], "samples": {"S": {"count": 3, "seconds": 0.001}},
+     "error": null}
+
+or as a heat map of the lookups in the ParseTable CSV layout.
+
+    python parse_trace.py SOURCE [--json OUT] [--heatmap OUT.csv]
+
+A program that does not parse is still traced up to the error, and the
+command exits with status 1; one that does not lex fails as it would
+in homework1_suite.
+'''
+
+import json
+import time
+
+from cfg import EOF
+
+
+class ParseTrace:
+    ''' The counts of one or more parses. '''
+
+    def __init__(self, sample_every=16, clock=time.time):
+        '''
+        :param int sample_every: time one in this many expansions, 0 for
+                                 none
+        :param clock: returns the time in seconds
+        '''
+        self.sample_every = sample_every
+        self.clock = clock
+        #(non-terminal, terminal) to the times the cell was looked up
+        self.lookups = {}
+        self.expansions = 0
+        self.epsilon_expansions = 0
+        self.tokens = 0
+        self.max_depth = 0
+        #non-terminal to [samples, seconds]
+        self.samples = {}
+        self.error = None
+        self.error_stack = None
+
+    def lookup(self, nonterminal, terminal, depth):
+        '''Called for every parse table lookup.
+
+        :param int depth: the size of the parse stack, including the
+                          non-terminal being expanded
+        '''
+        cell = (nonterminal, terminal)
+        self.lookups[cell] = self.lookups.get(cell, 0) + 1
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+    def expand(self, nonterminal, production, children):
+        '''Called for every production expanded.
+
+        :param int children: the nodes it added, 0 for an epsilon
+                             production
+        '''
+        self.expansions += 1
+        if not children:
+            self.epsilon_expansions += 1
+
+    def match(self, terminal, value):
+        ''' Called for every terminal matched against the input. '''
+        self.tokens += 1
+
+    def sample(self, nonterminal, seconds):
+        ''' Called with the time a sampled non-terminal took to parse. '''
+        sample = self.samples.setdefault(nonterminal, [0, 0.0])
+        sample[0] += 1
+        sample[1] += seconds
+
+    def fail(self, error, stack):
+        '''Called with the ValueError a parse is about to raise.
+
+        :param list[str] stack: the symbols still to be parsed, the next
+                                one first
+        '''
+        self.error = error.args[0]
+        self.error_stack = stack
+
+    def to_json(self):
+        lookups = sorted(self.lookups.items(),
+                         key=lambda item: (-item[1], item[0]))
+        return {'tokens': self.tokens,
+                'expansions': self.expansions,
+                'epsilon_expansions': self.epsilon_expansions,
+                'max_depth': self.max_depth,
+                'lookups': [{'nonterminal': nonterminal,
+                             'terminal': 'EOF' if terminal == EOF
+                                         else terminal,
+                             'count': count}
+                            for (nonterminal, terminal), count in lookups],
+                'samples': dict((nonterminal, {'count': count,
+                                               'seconds': seconds})
+                                for nonterminal, (count, seconds)
+                                in self.samples.items()),
+                'error': self.error,
+                'error_stack': self.error_stack}
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_json(), f, indent=2, sort_keys=True)
+
+    def heatmap(self, parser):
+        '''The lookup counts laid out like ParseTable's CSV: a row per
+        non-terminal and a column per terminal, with an EOF column. A cell
+        the table has no production for is left empty, and one that was
+        never looked up is 0.
+
+        :param parser: the Parser, or its ParseTable
+        :return str: the CSV
+        '''
+        table = parser.table
+        columns = list(parser.grammar.terminals) + [EOF]
+        ret = ''
+        for header in columns:
+            ret += ',' + ('EOF' if header == EOF else header)
+        ret += '\n'
+        for row in table:
+            ret += row
+            for column in columns:
+                ret += ','
+                if table[row].get(column):
+                    ret += str(self.lookups.get((row, column), 0))
+            ret += '\n'
+        return ret
+
+    def write_heatmap(self, parser, path):
+        with open(path, 'w') as f:
+            f.write(self.heatmap(parser))
+
+    def summary(self, top=10):
+        ''' :return str: the totals and the hottest cells, one per line '''
+        lines = ['  %d tokens, %d expansions (%d epsilon), max depth %d' %
+                 (self.tokens, self.expansions, self.epsilon_expansions,
+                  self.max_depth)]
+        for cell in self.to_json()['lookups'][:top]:
+            lines.append('  %-20s %-10s %10d' % (cell['nonterminal'],
+                                                 cell['terminal'],
+                                                 cell['count']))
+        if self.error is not None:
+            lines.append('  failed: %s' % self.error)
+        return '\n'.join(lines)
+
+if __name__ == '__main__':
+    import argparse
+    import os
+    import sys
+    import homework1_suite
+    import stage_trace
+
+    arg_parser = argparse.ArgumentParser(description='Traces the parse of '
+                                         'a program in the homework 1 '
+                                         'language.')
+    arg_parser.add_argument('source', help='the program')
+    arg_parser.add_argument('--json', metavar='OUT',
+                            help='write the counts as JSON')
+    arg_parser.add_argument('--heatmap', metavar='OUT',
+                            help='write the lookups as a CSV heat map')
+    arg_parser.add_argument('--sample-every', type=int, default=16)
+    args = arg_parser.parse_args()
+
+    trace = ParseTrace(args.sample_every)
+    stages = stage_trace.Trace(quiet=True)
+    out = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        parser = homework1_suite.build_parser(stages)
+        #lexing errors are not the parser's, so they are left to stop us
+        tokens = homework1_suite.lex_file(args.source, stages)
+        try:
+            parser.parse(tokens, trace)
+        except ValueError:
+            #a failed parse is traced like any other
+            if trace.error is None:
+                raise
+        tokens.close()
+    finally:
+        sys.stdout = out
+
+    print trace.summary()
+    if args.json:
+        trace.write(args.json)
+    if args.heatmap:
+        trace.write_heatmap(parser, args.heatmap)
+    exit(1 if trace.error is not None else 0)
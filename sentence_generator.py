@@ -0,0 +1,388 @@
+'''Streams random sentences of any cfg.Grammar, for load testing parsers
+and parse tables with inputs far larger than memory.
+
+A sentence is derived leftmost with an explicit stack, and each token is
+yielded as soon as it is derived, so only the pending symbols are held.
+The length of the sentence is steered with two pieces of analysis:
+
+  - the minimal derivation length of every non-terminal, the fewest
+    terminals it can derive (0 exactly for the nullable ones), and the
+    production that achieves it
+  - which non-terminals are growable, i.e. can reach a recursive one
+
+Non-terminals are expanded by weighted random choice until the tokens
+emitted plus the minimal length of everything pending reach the target.
+From then on every non-terminal takes its minimal production, which
+always terminates. Below the target, the last growable non-terminal on
+the stack is made to grow, in its last position where it can, so the
+sentence does not end early.
+
+Nesting is capped: symbols derived in the last position of a production
+stay at the depth of their parent, so lists built by tail recursion are
+free, while every other position is one deeper. Past the cap,
+non-terminals take their minimal production. A grammar that can only
+grow by nesting therefore stops short of the target at the cap, with a
+warning.
+
+Left recursion, like TAGS -> TAGS TAG, would leave one pending TAG on
+the stack for every round, so the stack would hold the whole list.
+Instead, when a non-terminal takes a left-recursive production, the
+number of rounds is drawn up front, the non-terminal takes one of its
+other productions, and a single counter below it on the stack derives
+the tails one round at a time, stopping early at the target. Growing
+prefers tail recursion, and only falls back to left recursion, with as
+many rounds as reach the target, where nothing else can grow.
+
+    python sentence_generator.py GRAMMAR [--tokens N] [--seed N] [--parse]
+'''
+
+import random
+import warnings
+
+from cfg import Grammar, EPSILON
+
+
+def symbols_of(rhs):
+    ''' The symbols of a right-hand side, empty for epsilon. '''
+    return [s for s in rhs if s != EPSILON]
+
+def minimal_lengths(grammar):
+    '''Computes the fewest terminals each non-terminal can derive, by a
+    fixpoint in which a non-terminal's length only ever strictly drops.
+
+    :return (dict{str : int}, dict{str : list[str]}): the minimal lengths,
+             and for each non-terminal the production that last lowered
+             its length. Each of those productions only uses symbols
+             whose length was settled before it, so always expanding them
+             terminates.
+    '''
+    length = {}
+    closing = {}
+    changed = True
+    while changed:
+        changed = False
+        for lhs, options in grammar.productions.items():
+            for rhs in options:
+                total = 0
+                for symbol in symbols_of(rhs):
+                    if symbol in grammar.terminals:
+                        total += 1
+                    elif symbol in length:
+                        total += length[symbol]
+                    else:
+                        break
+                else:
+                    if lhs not in length or total < length[lhs]:
+                        length[lhs] = total
+                        closing[lhs] = symbols_of(rhs)
+                        changed = True
+
+    missing = set(grammar.productions) - set(length)
+    if missing:
+        raise ValueError("Non-terminals that derive no sentence: " +
+                         str(sorted(missing)))
+    return length, closing
+
+def growable_symbols(grammar):
+    '''The non-terminals that can reach a recursive non-terminal, so can
+    derive sentential forms of any length.
+    '''
+    reaches = {}
+    for lhs, options in grammar.productions.items():
+        reaches[lhs] = set(s for rhs in options for s in symbols_of(rhs)
+                           if s in grammar.productions)
+
+    #transitive closure, one depth-first search per non-terminal
+    closure = {}
+    for lhs in grammar.productions:
+        seen = set()
+        stack = list(reaches[lhs])
+        while stack:
+            symbol = stack.pop()
+            if symbol not in seen:
+                seen.add(symbol)
+                stack.extend(reaches[symbol])
+        closure[lhs] = seen
+
+    recursive = set(lhs for lhs in closure if lhs in closure[lhs])
+    return set(lhs for lhs in closure
+               if lhs in recursive or closure[lhs] & recursive)
+
+
+class SentenceGenerator:
+    ''' The analysis of one grammar, reusable for any number of sentences. '''
+
+    def __init__(self, grammar, weights=None, max_depth=50):
+        '''
+        :param Grammar grammar: a hygienic grammar
+        :param dict{str : list[float]} weights: relative weights of each
+                                               non-terminal's productions,
+                                               in the grammar's order; 1
+                                               for the rest
+        :param int max_depth: the nesting cap
+        '''
+        self.grammar = grammar
+        self.max_depth = max_depth
+        self.length, self.closing = minimal_lengths(grammar)
+        self.growable = growable_symbols(grammar)
+
+        self.options = {}
+        self.growing = {}
+        #for the left-recursive non-terminals: their tails, their other
+        #productions, the shortest tails and their length, and the chance
+        #of each further round
+        self.tails = {}
+        self.bases = {}
+        self.closing_tails = {}
+        self.tail_length = {}
+        self.repeat = {}
+        for lhs, options in grammar.productions.items():
+            choices = [symbols_of(rhs) for rhs in options]
+            lhs_weights = (weights or {}).get(lhs, [1.0] * len(choices))
+            if len(lhs_weights) != len(choices):
+                raise ValueError("%s has %d productions but %d weights" %
+                                 (lhs, len(choices), len(lhs_weights)))
+            weighted = zip(choices, lhs_weights)
+            self.options[lhs] = cumulative(weighted)
+
+            #left recursion, lhs -> lhs tail, as rounds of its tails after
+            #one of the other productions, see the module docstring
+            left = [(rhs[1:], w) for rhs, w in weighted
+                    if is_left(lhs, rhs)]
+            if cumulative(left):
+                self.tails[lhs] = cumulative(left)
+                self.bases[lhs] = cumulative([(rhs, w) for rhs, w in weighted
+                                              if not is_left(lhs, rhs)])
+                self.tail_length[lhs] = min(
+                    sum(self.cost(s) for s in tail) for tail, _ in left)
+                #any of the shortest tails will do once past the target
+                self.closing_tails[lhs] = cumulative(
+                    [(tail, 1.0) for tail, _ in left
+                     if sum(self.cost(s) for s in tail) ==
+                     self.tail_length[lhs]])
+                #the chance of another round
+                self.repeat[lhs] = sum(w for _, w in left if w > 0) / \
+                    float(sum(w for _, w in weighted if w > 0))
+
+            #growing in the last position does not count against the
+            #nesting cap, and growing by left recursion only takes a
+            #counter, so prefer those productions, in that order
+            growing = [(rhs, w) for rhs, w in weighted
+                       if any(s in self.growable for s in rhs)]
+            tail_growing = [(rhs, w) for rhs, w in growing
+                            if rhs[-1] in self.growable and
+                            not is_left(lhs, rhs)]
+            left_growing = [(rhs, w) for rhs, w in growing
+                            if lhs in self.tails and is_left(lhs, rhs)]
+            self.growing[lhs] = cumulative(tail_growing or left_growing or
+                                           growing)
+
+        #expanding this many non-terminals in a row without deriving a
+        #token means a cycle of productions that derive nothing
+        self.stall_limit = 4 * len(grammar.productions) + max_depth
+
+    def cost(self, symbol):
+        if symbol in self.length:
+            return self.length[symbol]
+        return 1
+
+    def push(self, stack, rhs, depth):
+        ''' Pushes the symbols of a production of a symbol at depth, the
+        first on top. '''
+        last = len(rhs) - 1
+        for i in range(last, -1, -1):
+            stack.append((rhs[i], depth if i == last else depth + 1))
+
+    def left_rounds(self, symbol, rand, grow):
+        '''Starts a left recursion of symbol: draws how many rounds of
+        tails it takes, and which production it takes first.
+
+        :param bool grow: take rounds until the sentence reaches its
+                          target, rather than as many as random choices
+                          of the left recursion would
+        :return (list[str], int): the production to expand symbol by now,
+                                  and the rounds, None for until the
+                                  target
+        '''
+        base = choose(rand, self.bases[symbol]) if self.bases[symbol] \
+            else self.closing[symbol]
+        if grow:
+            return base, None
+        rounds = 1
+        while rand.random() < self.repeat[symbol]:
+            rounds += 1
+        return base, rounds
+
+    def tokens(self, length, seed=None, values=None):
+        '''Derives one sentence of at least length tokens, or fewer, with
+        a warning, when the nesting cap stops it from growing.
+
+        :param int length: the target number of tokens
+        :param seed: the random seed
+        :param dict{str : function} values: makes the value of a token
+                                            from a random.Random, for the
+                                            terminals listed; by default
+                                            the value is the terminal
+        :return generator[(str, str)]: (terminal, value) pairs
+        '''
+        rand = random.Random(seed)
+        values = values or {}
+        productions = self.grammar.productions
+        start = self.grammar.start
+
+        stack = [(start, 0)]
+        pending = self.length[start]
+        growable_pending = 1 if start in self.growable else 0
+        emitted = 0
+        stall = 0
+
+        while stack:
+            entry = stack.pop()
+            if len(entry) == 3:
+                #a round of left recursion, the counter staying below it
+                #for the rest; past the target, the last round
+                symbol, depth, rounds = entry
+                pending -= self.tail_length[symbol]
+                if rounds is None:
+                    growable_pending -= 1
+                if emitted + pending + self.tail_length[symbol] >= length \
+                        or depth >= self.max_depth:
+                    rhs = choose(rand, self.closing_tails[symbol])
+                else:
+                    rhs = choose(rand, self.tails[symbol])
+                    if rounds is None:
+                        stack.append(entry)
+                        pending += self.tail_length[symbol]
+                        growable_pending += 1
+                    elif rounds > 1:
+                        stack.append((symbol, depth, rounds - 1))
+                        pending += self.tail_length[symbol]
+                self.push(stack, rhs, depth)
+                pending += sum(self.cost(s) for s in rhs)
+                growable_pending += len([s for s in rhs
+                                         if s in self.growable])
+                continue
+
+            symbol, depth = entry
+            if symbol not in productions:
+                value = values[symbol](rand) if symbol in values else symbol
+                yield (symbol, value)
+                emitted += 1
+                pending -= 1
+                stall = 0
+                continue
+
+            pending -= self.length[symbol]
+            if symbol in self.growable:
+                growable_pending -= 1
+            stall += 1
+
+            grow = False
+            if emitted + pending + self.length[symbol] >= length or \
+                    depth >= self.max_depth or stall > self.stall_limit:
+                rhs = self.closing[symbol]
+            elif growable_pending == 0 and self.growing[symbol]:
+                #the last chance to make the sentence longer
+                rhs = choose(rand, self.growing[symbol])
+                grow = True
+            else:
+                rhs = choose(rand, self.options[symbol])
+
+            if symbol in self.tails and is_left(symbol, rhs):
+                rhs, rounds = self.left_rounds(symbol, rand, grow)
+                #below the production, so its rounds follow it
+                stack.append((symbol, depth, rounds))
+                pending += self.tail_length[symbol]
+                if rounds is None:
+                    #it grows the sentence like a growable symbol
+                    growable_pending += 1
+
+            self.push(stack, rhs, depth)
+            pending += sum(self.cost(s) for s in rhs)
+            growable_pending += len([s for s in rhs if s in self.growable])
+
+        if emitted < length:
+            if start in self.growable:
+                reason = "nothing could grow within the nesting cap of %d" \
+                         % self.max_depth
+            else:
+                reason = "the grammar has no longer sentences"
+            warnings.warn("The sentence stopped at %d of %d tokens: %s" %
+                          (emitted, length, reason))
+
+def is_left(lhs, rhs):
+    ''' Whether a production of lhs is left-recursive with a tail. '''
+    return len(rhs) > 1 and rhs[0] == lhs
+
+def cumulative(weighted):
+    ''' :return (list, list[float]): the choices and their running total
+                                     weights, for choose '''
+    choices = []
+    totals = []
+    total = 0.0
+    for choice, weight in weighted:
+        if weight > 0:
+            total += weight
+            choices.append(choice)
+            totals.append(total)
+    return (choices, totals) if choices else None
+
+def choose(rand, options):
+    choices, totals = options
+    r = rand.random() * totals[-1]
+    low, high = 0, len(totals) - 1
+    while low < high:
+        middle = (low + high) // 2
+        if totals[middle] > r:
+            high = middle
+        else:
+            low = middle + 1
+    return choices[low]
+
+def sentence(grammar, length, seed=None, **kwargs):
+    '''Shorthand for SentenceGenerator(grammar, ...).tokens(length, seed).'''
+    return SentenceGenerator(grammar, **kwargs).tokens(length, seed)
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+    import time
+
+    arg_parser = argparse.ArgumentParser(description='Generates a random '
+                                         'sentence of a grammar.')
+    arg_parser.add_argument('grammar', help='the grammar file')
+    arg_parser.add_argument('--tokens', type=int, default=100,
+                            help='the target length (default: 100)')
+    arg_parser.add_argument('--seed', type=int, default=None)
+    arg_parser.add_argument('--max-depth', type=int, default=50,
+                            help='the nesting cap (default: 50)')
+    arg_parser.add_argument('--parse', action='store_true',
+                            help='feed the sentence to ast_parser.Parser '
+                                 'instead of printing it')
+    args = arg_parser.parse_args()
+
+    grammar = Grammar(args.grammar)
+    generator = SentenceGenerator(grammar, max_depth=args.max_depth)
+    tokens = generator.tokens(args.tokens, args.seed)
+
+    if args.parse:
+        from ast_parser import Parser
+        parser = Parser(grammar)
+        counted = [0]
+        def counting(tokens):
+            for token in tokens:
+                counted[0] += 1
+                yield token
+        start = time.time()
+        _, leftover = parser.parse(counting(tokens))
+        elapsed = time.time() - start
+        print 'Parsed %d tokens in %.2f s (%.0f tokens/s), %d left over' % \
+            (counted[0], elapsed, counted[0] / elapsed, len(leftover))
+    else:
+        line = []
+        for terminal, _ in tokens:
+            line.append(terminal)
+            if len(line) == 20:
+                sys.stdout.write(' '.join(line) + '\n')
+                line = []
+        sys.stdout.write(' '.join(line) + '\n')
@@ -0,0 +1,110 @@
+'''Per-stage instrumentation for the compile pipeline. Each stage runs
+inside Trace.stage, which records:
+
+  - wall and CPU time
+  - how far the stage raised the process's peak resident set size, in
+    bytes, as "peak_memory_growth"
+  - how many more objects the garbage collector tracks after the stage
+    than before, as "objects"
+  - whatever counts the stage adds to its record, like tokens or nodes
+
+and prints the pipeline's usual "Lexing..." / "Done." lines unless the
+trace is quiet. The records can be written out as a JSON trace:
+
+    {"stages": [{"stage": "lex", "wall": 0.001, "cpu": 0.001,
+     "peak_memory_growth": 413696, "objects": 1052, "tokens": 52}, ...],
+     "process_peak_memory": 25165824}
+
+The peak only ever grows, so a stage that stays below an earlier one's
+peak shows no growth however much it allocates; the later and larger
+stages are the ones it measures well. Objects count the containers the
+collector tracks, like lists, dicts and tree nodes, not strings or
+numbers, and what a stage leaves behind rather than what it used along
+the way.
+'''
+
+import gc
+import json
+import os
+import resource
+import time
+from contextlib import contextmanager
+
+
+def peak_memory():
+    ''' :return int: the process's peak resident set size in bytes '''
+    #ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def cpu_time():
+    user, system = os.times()[:2]
+    return user + system
+
+def count_nodes(root):
+    '''Counts the nodes of a parse tree (Rose_Tree) or CST (ProgramNode).'''
+    count = 0
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        count += 1
+        children = node.children
+        stack.extend(children() if callable(children) else children)
+    return count
+
+def count_instructions(llvm_module):
+    return sum(len(block.instructions)
+               for function in llvm_module.functions
+               for block in function.basic_blocks)
+
+
+class Trace:
+    ''' The stage records of one or more compilations. '''
+
+    def __init__(self, quiet=False):
+        '''
+        :param bool quiet: do not print progress
+        '''
+        self.quiet = quiet
+        self.stages = []
+
+    def say(self, message):
+        if not self.quiet:
+            print(message)
+
+    @contextmanager
+    def stage(self, name, message=None):
+        '''Times the body of a with statement as a stage.
+
+            with trace.stage('lex', 'Lexing') as record:
+                tokens = list(tokenize(string))
+                record['tokens'] = len(tokens)
+
+        :param str name: the stage's name in the trace
+        :param str message: printed as "message..." before the stage and
+                            followed by "Done."
+        :return dict: the stage's record, for the body to add counts to
+        '''
+        record = {'stage': name}
+        if message is not None:
+            self.say(message + '...')
+        peak = peak_memory()
+        objects = len(gc.get_objects())
+        wall = time.time()
+        cpu = cpu_time()
+        try:
+            yield record
+        finally:
+            record['wall'] = time.time() - wall
+            record['cpu'] = cpu_time() - cpu
+            record['peak_memory_growth'] = peak_memory() - peak
+            record['objects'] = len(gc.get_objects()) - objects
+            self.stages.append(record)
+        if message is not None:
+            self.say('Done.')
+
+    def to_json(self):
+        return {'process_peak_memory': peak_memory(), 'stages': self.stages}
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_json(), f, indent=2, sort_keys=True)
@@ -0,0 +1,271 @@
+'''A compact binary form of a lexed program, for handing tokens from the
+lexer to the parser without a tuple and two strings per token, and for
+saving them to replay later.
+
+A TokenStream keeps the source buffer and four parallel arrays, one entry
+per token:
+
+  - ids:    the terminal, as an index into the stream's interned terminals
+  - starts: the offset of the token's value in the source
+  - ends:   the offset just past the value
+  - lines:  the line the token is on
+
+14 bytes a token in all, against about 150 for a (terminal, value) tuple.
+Values are only sliced out of the source when asked for; the parser
+iterates the stream, which makes each Token as it is read.
+
+A stream written with write is laid out as
+
+    header:    magic, version, byte order, token count, terminal count,
+               source length, length of the terminal names
+    terminals: the names, separated by newlines
+    arrays:    ids, starts, ends and lines, each aligned to 4 bytes
+    source:    the source buffer
+
+and read maps the file, so the arrays and the source are used in place
+rather than copied into memory.
+
+    python token_stream.py SOURCE OUT      lexes SOURCE into OUT
+    python token_stream.py --dump FILE     prints the tokens of FILE
+'''
+
+import array
+from itertools import izip
+import mmap
+import struct
+import sys
+
+from lexer import Token
+
+MAGIC = 'TOKS'
+VERSION = 1
+HEADER = struct.Struct('=4sBBxxIIII')
+
+#the array of each field, and its typecode
+FIELDS = [('ids', 'H'), ('starts', 'I'), ('ends', 'I'), ('lines', 'I')]
+
+BYTE_ORDERS = {'little': 0, 'big': 1}
+
+
+class TokenStream:
+    ''' The tokens of one source buffer, see the module docstring. '''
+
+    def __init__(self, source, terminals, ids, starts, ends, lines,
+                 base=0, length=None):
+        '''
+        :param source: the source, as a str or the mmap of a token file
+        :param list[str] terminals: the interned terminal names
+        :param ids: the fields of the tokens, see the module docstring;
+                    each is an array.array, or a MappedArray when read
+                    from a file. So are starts, ends and lines.
+        :param int base: where the program starts in source; the
+                         offsets are relative to it
+        :param int length: the length of the program, by default the
+                           rest of source
+        '''
+        self.source = source
+        self.base = base
+        self.length = len(source) - base if length is None else length
+        self.terminals = terminals
+        self.ids = ids
+        self.starts = starts
+        self.ends = ends
+        self.lines = lines
+        #the mmap this stream reads from, if any
+        self.mapping = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        ''' The tokens as token would give them, finding each line's
+        start once rather than once per token. '''
+        source = self.source
+        base = self.base
+        terminals = self.terminals
+        #Token's own __new__ is a Python function, and a slow one
+        new = tuple.__new__
+        line, line_start = None, base
+        for terminal, start, end, token_line in izip(self.ids, self.starts,
+                                                     self.ends, self.lines):
+            start += base
+            if token_line != line:
+                line = token_line
+                line_start = max(source.rfind('\n', base, start) + 1, base)
+            yield new(Token, (terminals[terminal], source[start:base + end],
+                              line, start - line_start + 1))
+
+    def terminal(self, i):
+        return self.terminals[self.ids[i]]
+
+    def value(self, i):
+        return self.source[self.base + self.starts[i]:
+                           self.base + self.ends[i]]
+
+    def column(self, i):
+        ''' Found from the source, as the column is not stored. '''
+        start = self.base + self.starts[i]
+        line_start = self.source.rfind('\n', self.base, start) + 1
+        return start - max(line_start, self.base) + 1
+
+    def token(self, i):
+        ''' :return Token: the i'th token with its value and position '''
+        return Token(self.terminal(i), self.value(i), self.lines[i],
+                     self.column(i))
+
+    def nbytes(self):
+        ''' :return int: the size of the arrays, without the source '''
+        return sum(len(getattr(self, name)) * struct.calcsize(code)
+                   for name, code in FIELDS)
+
+    def write(self, path):
+        names = '\n'.join(self.terminals)
+        with open(path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, BYTE_ORDERS[sys.byteorder],
+                                len(self), len(self.terminals),
+                                self.length, len(names)))
+            f.write(names)
+            f.write('\0' * padding(HEADER.size + len(names)))
+            for name, code in FIELDS:
+                data = getattr(self, name).tostring()
+                f.write(data)
+                f.write('\0' * padding(len(data)))
+            f.write(self.source[self.base:self.base + self.length])
+
+    def close(self):
+        ''' Unmaps the file of a stream from read. '''
+        if self.mapping is not None:
+            self.mapping.close()
+            self.mapping = None
+
+
+class MappedArray:
+    ''' A read-only array of ints stored in a buffer, read in place. '''
+
+    def __init__(self, buf, offset, typecode, count):
+        self.buf = buf
+        self.offset = offset
+        self.unpack = struct.Struct('=' + typecode).unpack_from
+        self.itemsize = struct.calcsize('=' + typecode)
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        if not 0 <= i < self.count:
+            raise IndexError('MappedArray index out of range')
+        return self.unpack(self.buf, self.offset + i * self.itemsize)[0]
+
+    def __iter__(self):
+        for i in xrange(self.count):
+            yield self[i]
+
+    def tostring(self):
+        return self.buf[self.offset:self.offset + self.count * self.itemsize]
+
+
+def padding(size):
+    ''' The bytes needed to align size to 4. '''
+    return -size % 4
+
+def from_spans(source, spans):
+    '''Builds a stream from a lexer's spans.
+
+    :param str source: the lexed text
+    :param spans: (terminal, start, end, line, ...) tuples, like those of
+                  lexer.Lexer.spans
+    :return TokenStream:
+    '''
+    interned = {}
+    terminals = []
+    ids = array.array('H')
+    starts = array.array('I')
+    ends = array.array('I')
+    lines = array.array('I')
+    for span in spans:
+        terminal = span[0]
+        if terminal not in interned:
+            interned[terminal] = len(terminals)
+            terminals.append(terminal)
+        ids.append(interned[terminal])
+        starts.append(span[1])
+        ends.append(span[2])
+        lines.append(span[3])
+    return TokenStream(source, terminals, ids, starts, ends, lines)
+
+def from_lexer(lexer, source):
+    ''' Lexes source with a lexer.Lexer into a stream. '''
+    return from_spans(source, lexer.spans(source))
+
+def is_token_file(path):
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+def read(path):
+    '''Maps a file written by TokenStream.write. The stream reads from
+    the file until it is closed.
+
+    :return TokenStream:
+    '''
+    with open(path, 'rb') as f:
+        mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if len(mapping) < HEADER.size:
+        raise ValueError("Not a token file: " + path)
+    magic, version, byte_order, count, terminal_count, source_length, \
+        names_length = HEADER.unpack_from(mapping, 0)
+    if magic != MAGIC:
+        raise ValueError("Not a token file: " + path)
+    if version != VERSION:
+        raise ValueError("Token file %s has version %d, expected %d" %
+                         (path, version, VERSION))
+    if byte_order != BYTE_ORDERS[sys.byteorder]:
+        raise ValueError("Token file %s was written with the other byte "
+                         "order" % path)
+
+    offset = HEADER.size
+    names = mapping[offset:offset + names_length]
+    terminals = names.split('\n') if terminal_count else []
+    offset += names_length + padding(HEADER.size + names_length)
+
+    arrays = []
+    for name, code in FIELDS:
+        values = MappedArray(mapping, offset, code, count)
+        arrays.append(values)
+        size = count * values.itemsize
+        offset += size + padding(size)
+
+    if offset + source_length != len(mapping):
+        raise ValueError("Token file %s is truncated" % path)
+    stream = TokenStream(mapping, terminals, *arrays, base=offset,
+                         length=source_length)
+    stream.mapping = mapping
+    return stream
+
+if __name__ == '__main__':
+    import argparse
+    import homework1_suite
+
+    arg_parser = argparse.ArgumentParser(description='Writes or prints '
+                                         'binary token files.')
+    arg_parser.add_argument('--dump', action='store_true',
+                            help='print the tokens of a token file')
+    arg_parser.add_argument('files', nargs='+',
+                            help='SOURCE OUT, or the file to --dump')
+    args = arg_parser.parse_args()
+
+    if args.dump:
+        stream = read(args.files[0])
+        for token in stream:
+            print '%d:%d %s %r' % (token.line, token.column, token.terminal,
+                                   token.value)
+        stream.close()
+    else:
+        if len(args.files) != 2:
+            arg_parser.error('expected SOURCE and OUT')
+        source = open(args.files[0], 'r').read()
+        stream = from_lexer(homework1_suite.homework1_lexer, source)
+        stream.write(args.files[1])
+        print 'Wrote %d tokens in %d bytes of arrays' % (len(stream),
+                                                         stream.nbytes())
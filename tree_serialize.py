@@ -0,0 +1,473 @@
+'''A compact binary format for parse trees (Rose_Tree, reduced or not) and
+CSTs (ProgramNode), for caching them and sending them between processes.
+It is many times smaller than pickle, and as it neither writes nor reads
+recursively, any depth of tree works at the default recursion limit.
+Parse trees also write and read several times faster than with cPickle.
+CSTs are not: their nodes are instances, which cPickle's C code handles
+about as fast as this does below a thousand nodes or so, and from tens
+of thousands takes only about twice as long.
+
+A tree is written as
+
+    header:  magic, version, and the kind of tree, R or C
+    atoms:   the interned table of every symbol, value and field name,
+             each a type tag and its payload
+    schemas: (CSTs only) for each node class and set of attributes, the
+             class and the names of the attributes but parent, sorted
+    nodes:   the node count, then every node in preorder:
+               Rose_Tree:   symbol, value, number of children
+               ProgramNode: schema, then for each attribute the number
+                            of its atom plus one, or 0 for a child
+             with the children of a ProgramNode following it in the
+             order of its schema
+
+with every number a varint: 7 bits a byte, the high bit set on all but
+the last byte. The node numbers of a CST are instead one array of the
+narrowest of 1, 2 or 4 byte unsigned ints that holds them all, after its
+typecode and length, so they are read in one go. Parent links are not
+written; reading rebuilds them in the same pass, so every node's parent
+is the node above it in the tree and the root's is None.
+'''
+
+import array
+import gc
+import importlib
+import sys
+import types
+from contextlib import contextmanager
+
+from ast_parser import Rose_Tree
+from ast_to_llvm import ProgramNode
+
+MAGIC = 'TREE'
+VERSION = 2
+
+ROSE = 'R'
+CST = 'C'
+
+#type tags of atoms
+TAG_STR = 's'
+TAG_UNICODE = 'u'
+TAG_INT = 'i'
+TAG_NONE = 'n'
+TAG_TRUE = 't'
+TAG_FALSE = 'f'
+
+ATOM_TYPES = set([str, unicode, int, long, bool, types.NoneType])
+
+#the typecodes of the arrays of CST numbers
+ARRAY_TYPES = 'BHI'
+
+#the encodings of the one-byte varints
+SMALL = [chr(n) for n in range(128)]
+
+
+def varint(n):
+    ''' :return str: the encoding of a non-negative int '''
+    if n < 128:
+        return SMALL[n]
+    out = []
+    while n >= 128:
+        out.append(chr(n & 127 | 128))
+        n >>= 7
+    out.append(chr(n))
+    return ''.join(out)
+
+def read_varint(data, position):
+    '''
+    :param bytearray data:
+    :return (int, int): the value and the position after it
+    '''
+    value = 0
+    shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 127) << shift
+        if byte < 128:
+            return value, position
+        shift += 7
+
+def read_varints(data, position):
+    ''' :return list[int]: every varint from position to the end '''
+    values = []
+    append = values.append
+    end = len(data)
+    while position < end:
+        byte = data[position]
+        position += 1
+        if byte < 128:
+            append(byte)
+            continue
+        value = byte & 127
+        shift = 7
+        while True:
+            byte = data[position]
+            position += 1
+            value |= (byte & 127) << shift
+            if byte < 128:
+                break
+            shift += 7
+        append(value)
+    return values
+
+
+class AtomTable:
+    ''' Interns the atoms of a tree as they are written. '''
+
+    def __init__(self):
+        self.ids = {}
+        self.atoms = []
+
+    def id(self, atom):
+        #the type is part of the key, so 1, True and '1' stay apart
+        key = (atom.__class__, atom)
+        atom_id = self.ids.get(key) if key[0] in ATOM_TYPES else None
+        if atom_id is None:
+            if key[0] not in ATOM_TYPES:
+                raise ValueError("Cannot serialize an attribute of type " +
+                                 type(atom).__name__)
+            atom_id = self.ids[key] = len(self.atoms)
+            self.atoms.append(atom)
+        return atom_id
+
+    def encode(self):
+        out = [varint(len(self.atoms))]
+        for atom in self.atoms:
+            if atom is None:
+                out.append(TAG_NONE)
+            elif atom is True:
+                out.append(TAG_TRUE)
+            elif atom is False:
+                out.append(TAG_FALSE)
+            elif isinstance(atom, (int, long)):
+                #zigzag, so small negative numbers stay small
+                out.append(TAG_INT + varint(atom * 2 if atom >= 0
+                                            else -atom * 2 - 1))
+            else:
+                tag = TAG_STR
+                if isinstance(atom, unicode):
+                    tag = TAG_UNICODE
+                    atom = atom.encode('utf-8')
+                out.append(tag + varint(len(atom)) + atom)
+        return ''.join(out)
+
+def decode_atoms(data, position):
+    '''
+    :param bytearray data:
+    :return (list, int): the atoms and the position after them
+    '''
+    count, position = read_varint(data, position)
+    atoms = []
+    for _ in xrange(count):
+        tag = chr(data[position])
+        position += 1
+        if tag == TAG_NONE:
+            atoms.append(None)
+        elif tag == TAG_TRUE:
+            atoms.append(True)
+        elif tag == TAG_FALSE:
+            atoms.append(False)
+        elif tag == TAG_INT:
+            n, position = read_varint(data, position)
+            atoms.append(n >> 1 if not n & 1 else -(n >> 1) - 1)
+        elif tag in (TAG_STR, TAG_UNICODE):
+            length, position = read_varint(data, position)
+            atom = str(data[position:position + length])
+            if tag == TAG_UNICODE:
+                atom = atom.decode('utf-8')
+            atoms.append(atom)
+            position += length
+        else:
+            raise ValueError("Corrupt tree: unknown atom tag %r" % tag)
+    return atoms, position
+
+
+@contextmanager
+def collector_paused():
+    '''Turns the cyclic garbage collector off for the body of a with
+    statement. Reading a tree allocates a container for every node, none
+    of which is garbage yet, and the collector would otherwise scan them
+    over and over.
+    '''
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+def dumps(tree):
+    '''
+    :param tree: the root Rose_Tree or ProgramNode
+    :return str: the tree in the format of the module docstring
+    '''
+    with collector_paused():
+        if isinstance(tree, Rose_Tree):
+            return dump_rose(tree)
+        elif isinstance(tree, ProgramNode):
+            return dump_cst(tree)
+    raise ValueError("Not a Rose_Tree or ProgramNode: " + repr(tree))
+
+def dump_rose(root):
+    atoms = AtomTable()
+    intern = atoms.id
+    ids = atoms.ids
+    numbers = []
+    append = numbers.append
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        children = node.children
+        symbol = node.symbol
+        value = node.value
+        append(ids.get((symbol.__class__, symbol)) or intern(symbol))
+        append(ids.get((value.__class__, value)) or intern(value))
+        append(len(children))
+        stack.extend(reversed(children))
+
+    return ''.join([MAGIC, chr(VERSION), ROSE, atoms.encode(),
+                    varint(len(numbers) // 3)] +
+                   [SMALL[n] if n < 128 else varint(n) for n in numbers])
+
+def cst_schema(node, schemas, schema_list):
+    '''The schema of a node's class and attributes, added to schemas and
+    schema_list if it is new.
+
+    :return (int, int, list[str]): the schema's number, the size of the
+                                   node's __dict__, and the names of its
+                                   attributes but parent, sorted
+    '''
+    values = node.__dict__
+    names = sorted(name for name in values if name != 'parent')
+    key = (node.__class__, tuple(names), len(values))
+    schema = schemas.get(key)
+    if schema is None:
+        schema = schemas[key] = (len(schema_list), len(values), names)
+        schema_list.append((node.__class__, names))
+    return schema
+
+def dump_cst(root):
+    atoms = AtomTable()
+    intern = atoms.id
+    ids = atoms.ids
+    #(class, names, size) to schema, see cst_schema, and the last schema
+    #of each class, which nearly every node of the class fits
+    schemas = {}
+    last_schema = {}
+    schema_list = []
+    numbers = []
+    append = numbers.append
+    count = 0
+    stack = [root]
+    pop = stack.pop
+    push = stack.extend
+    while stack:
+        node = pop()
+        count += 1
+        values = node.__dict__
+        schema = last_schema.get(node.__class__)
+        if schema is None or len(values) != schema[1]:
+            schema = last_schema[node.__class__] = \
+                cst_schema(node, schemas, schema_list)
+        mark = len(numbers)
+        append(schema[0])
+        children = []
+        try:
+            for name in schema[2]:
+                value = values[name]
+                cls = value.__class__
+                if cls in ATOM_TYPES:
+                    atom_id = ids.get((cls, value))
+                    append((intern(value) if atom_id is None
+                            else atom_id) + 1)
+                elif isinstance(value, ProgramNode):
+                    append(0)
+                    children.append(value)
+                else:
+                    #raises the error for a value of any other type
+                    intern(value)
+        except KeyError:
+            #the same number of attributes, but not the same ones; rare
+            #enough to simply start the node over
+            del numbers[mark:]
+            stack.append(node)
+            count -= 1
+            last_schema[node.__class__] = \
+                cst_schema(node, schemas, schema_list)
+            continue
+        children.reverse()
+        push(children)
+
+    #the schemas' names go in the atom table too
+    encoded_schemas = [varint(len(schema_list))]
+    for cls, names in schema_list:
+        encoded_schemas.extend(varint(n) for n in
+                               [intern(cls.__module__),
+                                intern(cls.__name__), len(names)] +
+                               [intern(name) for name in names])
+
+    return ''.join([MAGIC, chr(VERSION), CST, atoms.encode()] +
+                   encoded_schemas + [varint(count)] +
+                   encode_array(numbers))
+
+def encode_array(numbers):
+    ''' :return list[str]: numbers as an array of the smallest unsigned
+                           type that holds them all, little-endian '''
+    typecode = 'I'
+    if not numbers or max(numbers) < 256:
+        typecode = 'B'
+    elif max(numbers) < 65536:
+        typecode = 'H'
+    values = array.array(typecode, numbers)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return [typecode, varint(len(values)), values.tostring()]
+
+def decode_array(data, position):
+    '''
+    :param bytearray data:
+    :return list[int]: the numbers of an array from encode_array, which
+                       must end the data
+    '''
+    typecode = chr(data[position])
+    if typecode not in ARRAY_TYPES:
+        raise ValueError("Corrupt tree: unknown array type %r" % typecode)
+    length, position = read_varint(data, position + 1)
+    values = array.array(typecode)
+    if len(data) - position != length * values.itemsize:
+        raise ValueError("Corrupt tree: expected %d numbers" % length)
+    values.fromstring(str(data[position:]))
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values.tolist()
+
+def dump(tree, f):
+    f.write(dumps(tree))
+
+
+def loads(data):
+    '''
+    :param str data: a tree from dumps
+    :return: the root Rose_Tree or ProgramNode
+    '''
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError("Not a serialized tree")
+    if ord(data[len(MAGIC)]) != VERSION:
+        raise ValueError("Serialized tree has version %d, expected %d" %
+                         (ord(data[len(MAGIC)]), VERSION))
+    kind = data[len(MAGIC) + 1]
+    data = bytearray(data)
+    atoms, position = decode_atoms(data, len(MAGIC) + 2)
+    with collector_paused():
+        if kind == ROSE:
+            return load_rose(data, position, atoms)
+        elif kind == CST:
+            return load_cst(data, position, atoms)
+    raise ValueError("Corrupt tree: unknown kind %r" % kind)
+
+def load_rose(data, position, atoms):
+    count, position = read_varint(data, position)
+    numbers = read_varints(data, position)
+    if len(numbers) != count * 3:
+        raise ValueError("Corrupt tree: expected %d nodes" % count)
+
+    root = None
+    #[node, children still to come] of the nodes being filled in
+    open_nodes = []
+    for i in xrange(0, len(numbers), 3):
+        node = Rose_Tree(atoms[numbers[i]], atoms[numbers[i + 1]])
+        if open_nodes:
+            top = open_nodes[-1]
+            node.parent = top[0]
+            top[0].children.append(node)
+            top[1] -= 1
+            if not top[1]:
+                open_nodes.pop()
+        elif root is None:
+            root = node
+        else:
+            raise ValueError("Corrupt tree: more than one root")
+        if numbers[i + 2]:
+            open_nodes.append([node, numbers[i + 2]])
+    if open_nodes:
+        raise ValueError("Corrupt tree: expected %d nodes" % count)
+    return root
+
+def load_class(module, name):
+    cls = getattr(importlib.import_module(module), name, None)
+    if cls is None or not issubclass(cls, ProgramNode):
+        raise ValueError("Corrupt tree: %s.%s is not a ProgramNode" %
+                         (module, name))
+    return cls
+
+def new_instance(cls, attributes):
+    ''' An instance of cls with the given attributes, without __init__. '''
+    if isinstance(cls, type):
+        node = cls.__new__(cls)
+        node.__dict__.update(attributes)
+        return node
+    return types.InstanceType(cls, attributes)
+
+def load_cst(data, position, atoms):
+    schema_count, position = read_varint(data, position)
+    schemas = []
+    for _ in xrange(schema_count):
+        module, position = read_varint(data, position)
+        name, position = read_varint(data, position)
+        length, position = read_varint(data, position)
+        names = []
+        for _ in xrange(length):
+            n, position = read_varint(data, position)
+            names.append(atoms[n])
+        cls = load_class(atoms[module], atoms[name])
+        #an old-style node is made straight from its class and attributes
+        new = new_instance if isinstance(cls, type) else types.InstanceType
+        schemas.append((cls, names, new))
+
+    count, position = read_varint(data, position)
+    numbers = iter(decode_array(data, position))
+    next_number = numbers.next
+    #an atom number is one more than its index, 0 standing for a child
+    atoms = [None] + atoms
+
+    root = None
+    #[attributes, child names, index of the next child, node] of the
+    #nodes being filled in
+    open_nodes = []
+    try:
+        for _ in xrange(count):
+            cls, names, new = schemas[next_number()]
+            top = open_nodes[-1] if open_nodes else None
+            attributes = {'parent': top and top[3]}
+            child_names = None
+            for name in names:
+                n = next_number()
+                if n:
+                    attributes[name] = atoms[n]
+                elif child_names is None:
+                    child_names = [name]
+                else:
+                    child_names.append(name)
+            node = new(cls, attributes)
+
+            if top is not None:
+                top[0][top[1][top[2]]] = node
+                top[2] += 1
+                if top[2] == len(top[1]):
+                    open_nodes.pop()
+            elif root is None:
+                root = node
+            else:
+                raise ValueError("Corrupt tree: more than one root")
+            if child_names is not None:
+                open_nodes.append([attributes, child_names, 0, node])
+    except (StopIteration, IndexError):
+        raise ValueError("Corrupt tree: expected %d nodes" % count)
+    if open_nodes or next(numbers, None) is not None:
+        raise ValueError("Corrupt tree: expected %d nodes" % count)
+    return root
+
+def load(f):
+    return loads(f.read())